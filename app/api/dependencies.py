@@ -0,0 +1,72 @@
+import fastapi
+from fastapi import Depends, HTTPException
+from fastapi.security import OAuth2PasswordBearer
+
+from app.core import security, token_cache
+from app.core.token_cache import CachedIdentity
+from app.database import database
+from app.database.schemas import RoleEnum
+from app.services.user_service import UserService
+
+# auto_error is off because browsers authenticate with the "token" cookie instead.
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login", auto_error=False)
+
+
+def request_token(request: fastapi.Request, token: str | None = None) -> str | None:
+    cookie_token = request.cookies.get("token")
+    if cookie_token:
+        return cookie_token
+    if token:
+        return token
+    authorization = request.headers.get("Authorization", "")
+    if authorization.lower().startswith("bearer "):
+        return authorization[7:]
+    return None
+
+
+async def authenticate_token(db, token: str | None) -> CachedIdentity | None:
+    """
+    Resolve an access token to the identity of its user, or None if the token is
+    invalid, expired or belongs to a deleted user. Results are cached per token
+    until any user changes (checked every AUTH_CACHE_RECHECK_SECONDS).
+    """
+    if not token:
+        return None
+
+    if token_cache.users_version_due():
+        token_cache.observe_users_version(await UserService.users_write_counter(db))
+    users_version = token_cache.users_version()
+    identity = token_cache.get(token)
+    if identity is not None:
+        return identity
+
+    try:
+        payload = await security.decode_access_token(token)
+        user = await UserService.get_user(db, int(payload["sub"]))
+    except (ValueError, KeyError, TypeError):
+        return None
+    if user is None:
+        return None
+
+    identity = CachedIdentity(
+        user_id=user.id, role=user.role, is_active=user.is_active, expires_at=float(payload["exp"])
+    )
+    token_cache.put(token, identity, users_version)
+    return identity
+
+
+async def get_current_user(
+    request: fastapi.Request, token: str | None = Depends(oauth2_scheme), db=Depends(database.get_db)
+) -> CachedIdentity:
+    identity = await authenticate_token(db, request_token(request, token))
+    if identity is None:
+        raise HTTPException(status_code=401, detail="Invalid authentication credentials")
+    if not identity.is_active:
+        raise HTTPException(status_code=401, detail="User is inactive. Please contact the administrator.")
+    return identity
+
+
+async def require_admin(identity: CachedIdentity = Depends(get_current_user)) -> CachedIdentity:
+    if identity.role != RoleEnum.IT_ADMIN.value:
+        raise HTTPException(status_code=403, detail="Administrator access required")
+    return identity
@@ -0,0 +1,84 @@
+import asyncio
+import logging
+import os
+from datetime import datetime
+
+import fastapi
+from fastapi import Depends, HTTPException, Query
+from starlette.datastructures import MutableHeaders
+
+from app.api.dependencies import authenticate_token, request_token, require_admin
+from app.core import config, profiling
+from app.database import database
+from app.database.schemas import RoleEnum
+
+router = fastapi.APIRouter()
+logger = logging.getLogger(__name__)
+
+
+class CProfileMiddleware:
+    """
+    Profile a request with cProfile when it carries `X-Profile: 1` and comes from an
+    admin. The X-Profile-Id header is sent with the response headers; the dump is
+    written once the body has been sent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def _is_admin(self, request: fastapi.Request) -> bool:
+        async with database.AsyncSessionLocal() as db:
+            identity = await authenticate_token(db, request_token(request))
+        return bool(identity and identity.is_active and identity.role == RoleEnum.IT_ADMIN.value)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not config.PROFILING_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        request = fastapi.Request(scope)
+        if request.headers.get("X-Profile") != "1" or not await self._is_admin(request):
+            await self.app(scope, receive, send)
+            return
+
+        with profiling.profiled() as profile_id:
+            async def send_with_profile_id(message):
+                if profile_id and message["type"] == "http.response.start":
+                    MutableHeaders(scope=message)["X-Profile-Id"] = profile_id
+                await send(message)
+
+            await self.app(scope, receive, send_with_profile_id)
+
+
+@router.get("/profile", dependencies=[Depends(require_admin)])
+async def sample_profile(
+    seconds: float = Query(default=10, gt=0),
+    interval_ms: float = Query(default=5, ge=1, le=1000),
+):
+    """
+    Sample every thread's stack for `seconds` and download the collapsed stacks
+    (render with flamegraph.pl or speedscope).
+    """
+    if seconds > config.PROFILE_MAX_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds must be at most {config.PROFILE_MAX_SECONDS:g}")
+
+    try:
+        # Sampled from a worker thread so the event loop keeps serving (and shows up in the profile).
+        collapsed = await asyncio.to_thread(profiling.sample_stacks, seconds, interval_ms / 1000)
+    except profiling.ProfilerBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    filename = f"profile-{datetime.now():%Y%m%d-%H%M%S}.collapsed"
+    return fastapi.responses.PlainTextResponse(
+        collapsed, headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+@router.get("/profiles/{profile_id}", dependencies=[Depends(require_admin)])
+async def get_request_profile(profile_id: str):
+    """Download a per-request cProfile dump (open with pstats or snakeviz)."""
+    if not profile_id.isalnum():
+        raise HTTPException(status_code=400, detail="Invalid profile id")
+    path = profiling.profile_path(profile_id)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return fastapi.responses.FileResponse(path, filename=f"{profile_id}.prof")
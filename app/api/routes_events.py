@@ -0,0 +1,80 @@
+import logging
+
+import fastapi
+from fastapi import Query, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+
+from app.core import config
+from app.services.inventory_events import InventoryEvent, event_bus
+
+router = fastapi.APIRouter()
+logger = logging.getLogger(__name__)
+
+
+def _format_sse(event: InventoryEvent) -> str:
+    return f"id: {event.seq}\nevent: {event.type}\ndata: {event.model_dump_json()}\n\n"
+
+
+def _resume_position(last_event_id: str | None, since: int | None) -> int | None:
+    if since is not None:
+        return since
+    if last_event_id and last_event_id.isdigit():
+        return int(last_event_id)
+    return None
+
+
+@router.get("/inventory")
+async def inventory_events(request: fastapi.Request, since: int | None = Query(default=None, ge=0)):
+    """
+    Server-Sent Events stream of stock changes, transactions and added/deleted
+    medicines. Browsers resume automatically through the Last-Event-ID header;
+    other clients can pass `since` with the last sequence number they processed.
+    A `reset` event means the client must reload its data from /medicines/all.
+    """
+    subscription, replay = await event_bus.subscribe(
+        _resume_position(request.headers.get("Last-Event-ID"), since)
+    )
+
+    async def stream():
+        try:
+            yield f"retry: 3000\n: at {event_bus.last_seq}\n\n"
+            for event in replay:
+                yield _format_sse(event)
+            while not subscription.overflowed:
+                event = await subscription.next(config.EVENT_KEEPALIVE_SECONDS)
+                if event is not None:
+                    yield _format_sse(event)
+                elif await request.is_disconnected():
+                    break
+                else:
+                    yield ": keepalive\n\n"
+        finally:
+            event_bus.unsubscribe(subscription)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.websocket("/inventory/ws")
+async def inventory_events_ws(websocket: WebSocket, since: int | None = Query(default=None, ge=0)):
+    """WebSocket variant of /inventory: one JSON event per message, resume with `since`."""
+    await websocket.accept()
+    subscription, replay = await event_bus.subscribe(since)
+    try:
+        for event in replay:
+            await websocket.send_text(event.model_dump_json())
+        while not subscription.overflowed:
+            event = await subscription.next(config.EVENT_KEEPALIVE_SECONDS)
+            if event is None:
+                await websocket.send_json({"type": "keepalive", "seq": event_bus.last_seq})
+            else:
+                await websocket.send_text(event.model_dump_json())
+        # Too far behind: close and let the client reconnect with the last seq it processed.
+        await websocket.close(code=1013, reason="Subscriber too slow, resume with ?since=")
+    except WebSocketDisconnect:
+        pass
+    finally:
+        event_bus.unsubscribe(subscription)
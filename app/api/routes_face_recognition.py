@@ -1,23 +1,29 @@
+import asyncio
 import logging
 import os
 import requests
 
-import cv2
 import fastapi
 import numpy as np
 from deepface import DeepFace
-from pathlib import Path
 
-from fastapi import UploadFile
-from pandas.core.series import Series
+from fastapi import UploadFile, WebSocket, WebSocketDisconnect
 from pydantic import BaseModel
 from sqlalchemy.ext.asyncio import AsyncSession
 
 import app.core.config as config
+import app.core.metrics as metrics
+import app.core.tracing as tracing
 import app.core.security as security
 import app.database.database as database
 from app.database.schemas import RoleEnum, UserSchema
 from app.services.authentication_history_service import AuthenticationHistoryService
+from app.services.face_gallery import MAX_DISTANCE, embed, embed_aligned, face_gallery, is_real_face
+from app.services.face_quality import FaceQualityService
+from app.services.face_tracker import IoUTracker, Track
+from app.services.frame_decoder import DecodedFrame
+from app.services.inference_pool import run_inference
+from app.services.recognition_cache import recognition_cache
 from app.services.user_service import UserService
 
 cabinet_url = "10.42.0.203"
@@ -28,17 +34,8 @@ logger = logging.getLogger(__name__)
 
 df = DeepFace
 FACE_RECOGNITION_CONF = config.FACE_RECOGNITION_CONF
-
-
-def _extract_face_name(identity_path: str) -> str:
-    """
-    Extract folder name from DeepFace identity paths and tolerate Windows-style separators.
-    """
-    normalized_path = str(identity_path).replace("\\", "/").strip()
-    parts = [part for part in normalized_path.split("/") if part]
-    if len(parts) >= 2:
-        return parts[-2].strip()
-    return Path(normalized_path).stem.strip()
+RECOGNIZE_ENDPOINT = "/faces/recognize"
+STREAM_ENDPOINT = "/faces/stream"
 
 
 class Face(BaseModel):
@@ -57,193 +54,170 @@ class FaceRecognitionResult(BaseModel):
     token: str
 
 
-# noinspection D
-async def recognize_face(
-    db: AsyncSession, image: np.ndarray, faces_detected: list[Face]
-) -> list[FaceRecognitionResult]:
-    face_identities = []
-    for face in faces_detected:
-        x, y, w, h = face.box
-        # Add padding to the face crop to improve re-detection and alignment
-        h_img, w_img, _ = image.shape
-        padding = 0.20  # 20% padding
-        
-        pad_x = int(w * padding)
-        pad_y = int(h * padding)
-        
-        x_new = max(0, x - pad_x)
-        y_new = max(0, y - pad_y)
-        w_new = min(w_img, x + w + pad_x) - x_new
-        h_new = min(h_img, y + h + pad_y) - y_new
-        
-        face_img = image[y_new : y_new + h_new, x_new : x_new + w_new]
-        try:
-            results = df.find(
-                img_path=face_img,
-                db_path="./db",
-                model_name="Facenet512",
-                enforce_detection=False,
-                silent=True,
-                refresh_database=True,
-                anti_spoofing=True,
-                detector_backend="ssd",
-                align=True,
+async def _record_access(db: AsyncSession, user_id: int):
+    # History write should not block successful recognition response.
+    try:
+        await AuthenticationHistoryService.add_auth_access(db, user_id)
+    except Exception as e:
+        logger.warning(
+            "Failed to write authentication history for user %s: %s",
+            user_id,
+            e,
+        )
+
+
+async def _identify(
+    db: AsyncSession, face: Face, embedding: np.ndarray, endpoint: str
+) -> FaceRecognitionResult | None:
+    """Match one face's embedding against the gallery; the result carries a token for the user."""
+    with metrics.stage(endpoint, "find", "Facenet512"):
+        matches = face_gallery.search(embedding, k=5)
+    if not matches:
+        logger.debug("No faces in the database to compare.")
+        return None
+
+    for face_name, distance in matches:
+        # Matches are sorted, so once one fails nothing further can pass.
+        if distance > MAX_DISTANCE:
+            logger.debug(
+                "Skipping %s due to high distance %.4f (> %.4f)",
+                face_name,
+                distance,
+                MAX_DISTANCE,
+            )
+            return None
+
+        # Confidence is the cosine similarity, higher is better; FACE_RECOGNITION_CONF
+        # may be given on a 0-1 or 0-100 scale and only tightens the model's cut-off.
+        reported_score = max(0.0, 1.0 - distance)
+        threshold = FACE_RECOGNITION_CONF / 100 if FACE_RECOGNITION_CONF > 1 else FACE_RECOGNITION_CONF
+        if reported_score < threshold:
+            logger.debug(
+                "Skipping %s due to low confidence %.4f (< %.4f)",
+                face_name,
+                reported_score,
+                threshold,
             )
-        except ValueError:
-            logger.debug("No faces in the database to compare.")
+            return None
+
+        logger.info("Recognized %s with confidence %.4f", face_name, reported_score)
+        with metrics.stage(endpoint, "user_lookup"):
+            user = await UserService.get_user_by_face_name(db, face_name)
+        if not user:
+            logger.debug("No user matched face name '%s'", face_name)
             continue
 
-        matched_user = False
-        for result in results:
-            if "identity" not in result:
-                logger.debug("DeepFace result has no identity column: %s", result.columns)
-                continue
+        with metrics.stage(endpoint, "token"):
+            token = await security.create_access_token(user.id, None)
+        await _record_access(db, user.id)
+        return FaceRecognitionResult(
+            face=face,
+            identity=face_name,
+            confidence=reported_score,
+            role=user.role,
+            user=UserSchema.model_validate(user),
+            token=token,
+        )
+    return None
 
-            identity: Series = result["identity"]
-            if "confidence" in result:
-                confidence: Series = result["confidence"]
-                # Confidence-based output: higher is better.
-                combined = sorted(
-                    list(zip(identity, confidence)),
-                    key=lambda item: float(item[1]),
-                    reverse=True,
-                )
-                score_mode = "confidence"
-            elif "distance" in result:
-                distance: Series = result["distance"]
-                # Distance-based output: lower is better.
-                combined = sorted(
-                    list(zip(identity, distance)),
-                    key=lambda item: float(item[1]),
-                )
-                score_mode = "distance"
-            else:
-                logger.debug("DeepFace result has no confidence/distance column: %s", result.columns)
-                continue
 
-            if not combined:
-                logger.debug(
-                    "No matches found for identities: %s",
-                    identity.tolist() if hasattr(identity, "tolist") else identity,
-                )
-                continue
+# noinspection D
+async def embed_face(frame: DecodedFrame, face: Face, endpoint: str) -> np.ndarray | None:
+    """Embedding of a detected face, re-detected in a padded crop; None if it is lost or a spoof."""
+    x, y, w, h = face.box
+    # Add padding to the face crop to improve re-detection and alignment
+    padding = 0.20  # 20% padding
 
-            for candidate_identity, candidate_score in combined:
-                raw_score = float(candidate_score)
-
-                if score_mode == "confidence":
-                    # DeepFace confidence can be 0-1 or 0-100 depending on backend/version.
-                    threshold = FACE_RECOGNITION_CONF
-                    if raw_score > 1 and threshold <= 1:
-                        threshold *= 100
-                    elif raw_score <= 1 and threshold > 1:
-                        threshold /= 100
-
-                    if raw_score < threshold:
-                        logger.debug(
-                            "Skipping %s due to low confidence %.4f (< %.4f)",
-                            candidate_identity,
-                            raw_score,
-                            threshold,
-                        )
-                        continue
-                    reported_score = raw_score
-                else:
-                    if raw_score > FACE_RECOGNITION_CONF:
-                        logger.debug(
-                            "Skipping %s due to high distance %.4f (> %.4f)",
-                            candidate_identity,
-                            raw_score,
-                            FACE_RECOGNITION_CONF,
-                        )
-                        continue
-                    # Keep return field semantically as "confidence": 1-distance.
-                    reported_score = max(0.0, 1.0 - raw_score)
-
-                face_name = _extract_face_name(candidate_identity)
-                if not face_name:
-                    logger.debug("Could not extract face name from identity path: %s", candidate_identity)
-                    continue
-
-                logger.info("Recognized %s with %s score %.4f", face_name, score_mode, raw_score)
-                user = await UserService.get_user_by_face_name(db, face_name)
-                if not user:
-                    logger.debug("No user matched face name '%s'", face_name)
-                    continue
-
-                token = await security.create_access_token(user.id, None)
-                face_identities.append(
-                    FaceRecognitionResult(
-                        face=face,
-                        identity=face_name,
-                        confidence=reported_score,
-                        role=user.role,
-                        user=UserSchema.model_validate(user),
-                        token=token,
-                    )
-                )
+    pad_x = int(w * padding)
+    pad_y = int(h * padding)
+
+    x_new = max(0, x - pad_x)
+    y_new = max(0, y - pad_y)
+
+    # Small faces are cropped from the full-resolution frame so Facenet512 gets its 160 px input.
+    face_img = await frame.crop(x_new, y_new, x + w + pad_x, y + h + pad_y, config.FACE_MIN_CROP)
+    metrics.FACE_EMBEDDINGS.labels(endpoint).inc()
+    try:
+        with metrics.stage(endpoint, "embed", "Facenet512"):
+            embedding = await run_inference(embed, face_img, anti_spoofing=True)
+    except ValueError as e:
+        logger.warning("Face at %s rejected while embedding: %s", face.box, e)
+        return None
+    if embedding is None:
+        logger.debug("No face found in crop at %s", face.box)
+    return embedding
 
-                # History write should not block successful recognition response.
-                try:
-                    await AuthenticationHistoryService.add_auth_access(db, user.id)
-                except Exception as e:
-                    logger.warning(
-                        "Failed to write authentication history for user %s: %s",
-                        user.id,
-                        e,
-                    )
 
-                matched_user = True
-                break
+async def recognize_face(
+    db: AsyncSession, frame: DecodedFrame, faces_detected: list[Face], endpoint: str = RECOGNIZE_ENDPOINT
+) -> list[FaceRecognitionResult]:
+    face_identities = []
+    if faces_detected:
+        with metrics.stage(endpoint, "gallery_refresh"):
+            await face_gallery.refresh()
+    for face in faces_detected:
+        embedding = await embed_face(frame, face, endpoint)
+        if embedding is None:
+            continue
 
-            if matched_user:
-                break
+        result = await _identify(db, face, embedding, endpoint)
+        if result is not None:
+            face_identities.append(result)
 
     logger.info("Face identities: %s", face_identities)
     return face_identities
 
 
-@router.post("/recognize")
-async def face_recognition(image: UploadFile, db=fastapi.Depends(database.get_db)):
-    try:
-        content = await image.read()
-        nparr = np.frombuffer(content, np.uint8)
-        image_data = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        if image_data is None:
-             raise fastapi.HTTPException(status_code=400, detail="Failed to decode image")
-             
-        logger.info("Received image: %s" % image.filename)
-    except Exception as e:
-        logger.error(f"Error processing image upload: {e}")
-        raise fastapi.HTTPException(status_code=400, detail="Invalid image file")
+async def recognize_aligned_faces(
+    db: AsyncSession, faces: list[Face], face_images: list, endpoint: str
+) -> list[FaceRecognitionResult]:
+    """
+    recognize_face() for faces whose aligned crops extract_faces() already
+    produced and that passed anti-spoofing: they are embedded as they are.
+    """
+    face_identities = []
+    if faces:
+        with metrics.stage(endpoint, "gallery_refresh"):
+            await face_gallery.refresh()
+    for face, face_img in zip(faces, face_images):
+        metrics.FACE_EMBEDDINGS.labels(endpoint).inc()
+        with metrics.stage(endpoint, "embed", "Facenet512"):
+            embedding = await run_inference(embed_aligned, face_img)
+        result = await _identify(db, face, embedding, endpoint)
+        if result is not None:
+            face_identities.append(result)
+    return face_identities
 
-    try:
-        faces = df.extract_faces(
-            image_data,
+
+async def _extract_faces(frame: DecodedFrame, endpoint: str, anti_spoofing: bool = True) -> list[dict]:
+    with metrics.stage(endpoint, "extract_faces", "ssd"), \
+            tracing.span("model.extract_faces", model="ssd"):
+        return await run_inference(
+            df.extract_faces,
+            frame.image,
             enforce_detection=False,
             detector_backend="ssd",
             align=True,
-            anti_spoofing=True,
+            anti_spoofing=anti_spoofing,
         )
-    except Exception as e:
-        logger.error(f"Error extracting faces: {e}")
-        # If face extraction fails, it might be due to no face or other issues.
-        # DeepFace might raise ValueError or similar.
-        return {"message": "No faces detected or error in processing"}
 
-    if len(faces) <= 0:
-        return {"message": "No faces detected"}
 
+def _parse_faces(frame: DecodedFrame, faces: list[dict], check_spoofing: bool = True) -> tuple[list[Face], list]:
+    """Faces (in original coordinates) and their crops, leaving out spoofs when they were checked."""
     faces_detected = []
+    face_images = []
     for face in faces:
         try:
             (x, y, w, h, left_eye, right_eye) = face["facial_area"].values()
+            # Detection ran on the reduced frame; report and crop in original coordinates.
+            x, y, w, h = frame.to_original((x, y, w, h))
+            left_eye = frame.to_original(left_eye) if left_eye else None
+            right_eye = frame.to_original(right_eye) if right_eye else None
             confidence = face["confidence"]
             is_real = face.get("is_real", None)
             antispoof_score = face.get("antispoof_score", None)
 
-            if not is_real:
+            if check_spoofing and not is_real:
                 logger.warning(
                     "Face at %s failed anti-spoofing check with score %s",
                     (x, y, w, h),
@@ -259,24 +233,248 @@ async def face_recognition(image: UploadFile, db=fastapi.Depends(database.get_db
                     confidence=confidence,
                 )
             )
+            face_images.append(face["face"])
         except Exception as e:
             logger.error(f"Error parsing face data: {e}")
             continue
+    return faces_detected, face_images
+
+
+def _quality_gate(endpoint: str, faces_detected: list[Face], face_images: list) -> tuple[list[Face], list[dict]]:
+    """Splits faces into those worth recognising and {"box", "reason"} for the rest."""
+    if not config.FACE_QUALITY_GATE or not faces_detected:
+        return faces_detected, []
+    with metrics.stage(endpoint, "quality"):
+        reasons = FaceQualityService.check(
+            [face.box for face in faces_detected],
+            [(face.left_eye, face.right_eye) for face in faces_detected],
+            face_images,
+        )
+    rejected = [
+        {"box": face.box, "reason": reason}
+        for face, reason in zip(faces_detected, reasons)
+        if reason is not None
+    ]
+    if rejected:
+        logger.info("Faces rejected by quality gate: %s", rejected)
+    return [face for face, reason in zip(faces_detected, reasons) if reason is None], rejected
 
-    try:
-        recognition_results = await recognize_face(db, image_data, faces_detected)
-    except Exception as e:
-        logger.error(f"Error in recognition logic: {e}", exc_info=True)
-        raise fastapi.HTTPException(status_code=500, detail="Error during face recognition process")
 
+def _trigger_unlock(endpoint: str, recognized: bool):
     try:
         from app.services.serial_service import SerialService
 
-        if len(recognition_results) > 0:
-            SerialService.send_command("open")
-        else:
-            SerialService.send_command("close")
+        with metrics.stage(endpoint, "serial"):
+            if recognized:
+                SerialService.send_command("open")
+            else:
+                SerialService.send_command("close")
     except Exception as e:
         logger.error(f"Failed to trigger serial unlock: {e}")
 
+
+@router.post("/recognize")
+async def face_recognition(image: UploadFile, db=fastapi.Depends(database.get_db)):
+    try:
+        content = await image.read()
+        frame = await DecodedFrame.decode(content, config.FACE_DECODE_SIZE, RECOGNIZE_ENDPOINT)
+        
+        if frame is None:
+             raise fastapi.HTTPException(status_code=400, detail="Failed to decode image")
+             
+        logger.info("Received image: %s" % image.filename)
+    except Exception as e:
+        logger.error(f"Error processing image upload: {e}")
+        raise fastapi.HTTPException(status_code=400, detail="Invalid image file")
+
+    # Keyed on the exact upload: a retry after a serial timeout resends the same bytes,
+    # while a look-alike frame of someone else must never be handed this result's tokens.
+    cache_key = recognition_cache.content_key(content) if recognition_cache.enabled else None
+    cached = recognition_cache.get(RECOGNIZE_ENDPOINT, cache_key) if cache_key is not None else None
+    if cached is not None:
+        # Same upload again: unlock again and record the access, skip the models.
+        for result in cached:
+            await _record_access(db, result.user.id)
+        _trigger_unlock(RECOGNIZE_ENDPOINT, len(cached) > 0)
+        return cached
+
+    try:
+        faces = await _extract_faces(frame, RECOGNIZE_ENDPOINT)
+    except Exception as e:
+        logger.error(f"Error extracting faces: {e}")
+        # If face extraction fails, it might be due to no face or other issues.
+        # DeepFace might raise ValueError or similar.
+        return {"message": "No faces detected or error in processing"}
+
+    if len(faces) <= 0:
+        return {"message": "No faces detected"}
+
+    faces_detected, face_images = _parse_faces(frame, faces)
+    faces_detected, rejected = _quality_gate(RECOGNIZE_ENDPOINT, faces_detected, face_images)
+    if rejected and not faces_detected:
+        return {"message": "Face quality too low", "rejected": rejected}
+
+    try:
+        recognition_results = await recognize_face(db, frame, faces_detected)
+    except Exception as e:
+        logger.error(f"Error in recognition logic: {e}", exc_info=True)
+        raise fastapi.HTTPException(status_code=500, detail="Error during face recognition process")
+
+    if cache_key is not None:
+        recognition_cache.put(
+            RECOGNIZE_ENDPOINT,
+            cache_key,
+            recognition_results,
+            expires_at=min((security.token_expires_at(r.token) for r in recognition_results), default=None),
+            user_ids=[r.user.id for r in recognition_results],
+        )
+
+    _trigger_unlock(RECOGNIZE_ENDPOINT, len(recognition_results) > 0)
+
     return recognition_results
+
+
+def _needs_recognition(track: Track) -> bool:
+    if track.attempts == 0:
+        return True
+    if track.frames_since_attempt < config.FACE_STREAM_RETRY_FRAMES:
+        return False
+    return track.result is None or track.confidence < config.FACE_STREAM_RECHECK_CONFIDENCE
+
+
+def _track_message(track: Track) -> dict:
+    return {
+        "track_id": track.track_id,
+        "box": track.box,
+        "identity": track.result.identity if track.result else None,
+        "confidence": track.confidence,
+    }
+
+
+async def _recognize_tracks(
+    frame: DecodedFrame, tracks: list[Track], faces: list[Face], face_images: list, due: list[int]
+) -> list[dict]:
+    """
+    Recognise the faces of the `due` tracks from this frame's tracking pass: the
+    boxes and aligned crops are reused, only anti-spoofing (skipped while
+    tracking) and the embedding run now. Returns the messages to push to the client.
+    """
+    for i in due:
+        tracks[i].attempts += 1
+        tracks[i].frames_since_attempt = 0
+
+    messages = []
+    candidates, candidate_images, candidate_tracks = [], [], []
+    for i in due:
+        # Detection ran on the reduced frame, so the check does too.
+        box = tuple(int(round(value / frame.scale)) for value in faces[i].box)
+        with metrics.stage(STREAM_ENDPOINT, "anti_spoofing", "Fasnet"):
+            is_real, score = await run_inference(is_real_face, frame.image, box)
+        if not is_real:
+            logger.warning("Face at %s failed anti-spoofing check with score %s", faces[i].box, score)
+            messages.append({"type": "rejected", "track_id": tracks[i].track_id, "reason": "spoof"})
+            continue
+        candidates.append(faces[i])
+        candidate_images.append(face_images[i])
+        candidate_tracks.append(tracks[i])
+
+    passed, rejected = _quality_gate(STREAM_ENDPOINT, candidates, candidate_images)
+    rejected_reasons = {rejection["box"]: rejection["reason"] for rejection in rejected}
+    passed_images = []
+    for face, face_img, track in zip(candidates, candidate_images, candidate_tracks):
+        if face.box in rejected_reasons:
+            messages.append({"type": "rejected", "track_id": track.track_id, "reason": rejected_reasons[face.box]})
+        else:
+            passed_images.append(face_img)
+    if not passed:
+        return messages
+
+    async with database.AsyncSessionLocal() as db:
+        results = await recognize_aligned_faces(db, passed, passed_images, STREAM_ENDPOINT)
+    _trigger_unlock(STREAM_ENDPOINT, len(results) > 0)
+
+    for result in results:
+        track = next((t for face, t in zip(candidates, candidate_tracks) if face.box == result.face.box), None)
+        if track is None:
+            continue
+        if track.result is not None and track.confidence >= result.confidence:
+            continue
+        track.result = result
+        track.confidence = result.confidence
+        messages.append(
+            {"type": "recognized", "track_id": track.track_id, "result": result.model_dump(mode="json")}
+        )
+    return messages
+
+
+@router.websocket("/stream")
+async def face_stream(websocket: WebSocket):
+    """
+    Face unlock over a stream of frames. The client sends encoded images (JPEG)
+    as binary messages; text messages are answered with an error and otherwise
+    ignored. Faces are tracked across frames and each one is
+    recognised once, when it appears, rather than on every frame; a "recognized"
+    message (with the same result as /recognize) is pushed as soon as that
+    happens, and a "tracks" message follows every processed frame. Frames that
+    arrive while one is being processed are skipped in favour of the newest.
+    """
+    await websocket.accept()
+    tracker = IoUTracker(config.FACE_STREAM_IOU, config.FACE_STREAM_MAX_MISSED)
+    stats = {"received": 0, "processed": 0, "skipped": 0}
+    latest: list[bytes | None] = [None]
+    frame_ready = asyncio.Event()
+
+    async def receive_frames():
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            content = message.get("bytes")
+            if content is None:
+                # receive_bytes() would raise on a text message and end the stream.
+                await websocket.send_json({"type": "error", "detail": "Frames must be sent as binary messages"})
+                continue
+            stats["received"] += 1
+            if latest[0] is not None:
+                stats["skipped"] += 1
+            latest[0] = content
+            frame_ready.set()
+
+    receiver = asyncio.create_task(receive_frames())
+    try:
+        while True:
+            waiter = asyncio.create_task(frame_ready.wait())
+            await asyncio.wait({receiver, waiter}, return_when=asyncio.FIRST_COMPLETED)
+            if receiver.done():
+                waiter.cancel()
+                receiver.result()  # re-raises the disconnect
+            frame_ready.clear()
+            content, latest[0] = latest[0], None
+
+            frame = await DecodedFrame.decode(content, config.FACE_DECODE_SIZE, STREAM_ENDPOINT)
+            if frame is None:
+                await websocket.send_json({"type": "error", "detail": "Failed to decode frame"})
+                continue
+            stats["processed"] += 1
+
+            try:
+                faces, face_images = _parse_faces(
+                    frame, await _extract_faces(frame, STREAM_ENDPOINT, anti_spoofing=False), check_spoofing=False
+                )
+                tracks = tracker.update([face.box for face in faces])
+                due = [i for i, track in enumerate(tracks) if _needs_recognition(track)]
+                messages = await _recognize_tracks(frame, tracks, faces, face_images, due) if due else []
+            except Exception as e:
+                logger.error(f"Error processing stream frame: {e}", exc_info=True)
+                await websocket.send_json({"type": "error", "detail": "Error during face recognition process"})
+                continue
+
+            for message in messages:
+                await websocket.send_json(message)
+            await websocket.send_json(
+                {"type": "tracks", "tracks": [_track_message(track) for track in tracks], "stats": stats}
+            )
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
@@ -1,6 +1,5 @@
 import logging
 import os
-import uuid
 from datetime import datetime, timedelta
 from typing import List
 
@@ -8,49 +7,45 @@ import cv2
 import fastapi
 import numpy as np
 from fastapi import HTTPException, UploadFile, Depends
-from fastapi.security import OAuth2PasswordBearer
+from fastapi.encoders import jsonable_encoder
 from ultralytics.engine.results import Probs
 
 import app.database.database as db
-from app.core import security
+from app.api.dependencies import get_current_user
+from app.core import config, metrics
 from app.database.schemas import MedicineSchema
 from app.scheduler.scheduler import scheduler
 from app.scheduler.tasks import retrain_classification_model
+from app.services import fs
+from app.services.blob_store import blob_store, is_blob_id
 from app.services.classification import ClassificationService
+from app.services.frame_decoder import DecodedFrame
 from app.services.inventory_service import InventoryService
 from app.services.object_detection import ObjectDetectionService
+from app.services.prototype_classification import PrototypeClassificationService
+from app.services.recognition_cache import recognition_cache
+from app.services.thumbnail_service import ThumbnailService
+from app.services.training_ingest_service import IngestJob, TrainingIngestService
 from app.types.MedicineInput import MedicineInput
+from app.utils import conditional
 
 router = fastapi.APIRouter()
 logger = logging.getLogger(__name__)
 cls_service = ClassificationService()
+prototype_service = PrototypeClassificationService(cls_service)
 
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
-
-
-async def get_current_user(request: fastapi.Request, token: str = fastapi.Depends(oauth2_scheme)):
-    try:
-        logger.info("Working")
-        cookie_token = request.cookies.get("token")
-        if cookie_token:
-            token = cookie_token
-
-        payload = await security.decode_access_token(token)
-
-        if payload is None:
-            raise fastapi.HTTPException(status_code=401, detail="Invalid authentication credentials")
-        # You can add more checks here, like verifying user existence in the database or yung multi roles
-        return payload["sub"]
-    except ValueError as e:
-        logger.error(f"Error decoding token: {e}")
-        raise fastapi.HTTPException(status_code=401, detail="Invalid authentication credentials")
-
-
-
+RECOGNIZE_ENDPOINT = "/medicines/recognize"
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
 
 
 @router.get("/all", response_model=List[MedicineSchema])
-async def all(db=fastapi.Depends(db.get_db)):
+async def all(request: fastapi.Request, response: fastapi.Response, db=fastapi.Depends(db.get_db)):
+    version, last_modified = await InventoryService.catalog_version(db)
+    etag = conditional.make_etag("medicines", version)
+    if conditional.is_not_modified(request, etag):
+        return conditional.not_modified(etag, last_modified)
+
+    conditional.set_validators(response, etag, last_modified)
     return await InventoryService.list_all(db)
 
 
@@ -58,12 +53,8 @@ async def all(db=fastapi.Depends(db.get_db)):
 async def add_stock(
         medicine_name: str, quantity: int, db=fastapi.Depends(db.get_db), user=fastapi.Depends(get_current_user)
 ):
-    user_id = int(user) if user and user.isdigit() else None
-    if not user_id:
-        raise HTTPException(status_code=401, detail="Invalid user ID")
-
     try:
-        return await InventoryService.add_stock(db, medicine_name, quantity, user_id)
+        return await InventoryService.add_stock(db, medicine_name, quantity, user.user_id)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -72,17 +63,23 @@ async def add_stock(
 async def reduce_stock(
         medicine_name: str, quantity: int, db=fastapi.Depends(db.get_db), user=fastapi.Depends(get_current_user)
 ):
-    user_id = int(user) if user and user.isdigit() else None
-    if not user_id:
-        raise HTTPException(status_code=401, detail="Invalid user ID")
     try:
-        return await InventoryService.reduce_stock(db, medicine_name, quantity, user_id)
+        return await InventoryService.reduce_stock(db, medicine_name, quantity, user.user_id)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
 @router.get("/{medicine_id}", response_model=MedicineSchema)
-async def get_medicine(medicine_id: int, db=fastapi.Depends(db.get_db)):
+async def get_medicine(
+        medicine_id: int, request: fastapi.Request, response: fastapi.Response, db=fastapi.Depends(db.get_db)
+):
+    last_modified = await InventoryService.medicine_version(db, medicine_id)
+    if last_modified is not None:
+        etag = conditional.make_etag("medicine", medicine_id, last_modified)
+        if conditional.is_not_modified(request, etag):
+            return conditional.not_modified(etag, last_modified)
+        conditional.set_validators(response, etag, last_modified)
+
     medicine = await InventoryService.get_medicine(db, medicine_id)
     if not medicine:
         raise HTTPException(status_code=404, detail="Medicine not found")
@@ -100,7 +97,26 @@ async def search_medicine(name: str, db=fastapi.Depends(db.get_db)):
         raise HTTPException(status_code=400, detail=str(e))
 
 
-@router.post("/add")
+def _schedule_retraining(medicine_name: str, immediate_training: bool):
+    job_id = f"train_{medicine_name}"
+    if immediate_training:
+        scheduler.add_job(
+            retrain_classification_model,
+            "date",
+            id=job_id,
+            replace_existing=True,
+        )
+    else:
+        scheduler.add_job(
+            retrain_classification_model,
+            "date",
+            run_date=datetime.now() + timedelta(minutes=10),
+            id=job_id,
+            replace_existing=True,
+        )
+
+
+@router.post("/add", status_code=202)
 async def add_medicine(
         thumbnail: UploadFile,
         training_files: list[UploadFile],
@@ -112,6 +128,10 @@ async def add_medicine(
     """
     Add a new medicine to the system.
 
+    Training images are cropped in the background; poll `/medicines/ingest/{job_id}`
+    for the per-file status. Retraining (or the prototype update) starts once the
+    crops are saved.
+
     Args:
         thumbnail: Medicine thumbnail image
         training_files: Training images for the classification model
@@ -119,14 +139,8 @@ async def add_medicine(
         medicine_input: Medicine details (name, description, etc.)
 
     Returns:
-        Success message with medicine details and training information
+        The created medicine and the training ingest job handle
     """
-    try:
-        thumbnail_location = f"uploads/thumbnails/{medicine_input.name}.jpg"
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
-
-    # save to uploads/thumbnails/thumbnail_filename.jpg
     if not thumbnail.filename:
         raise HTTPException(status_code=400, detail="No thumbnail filename provided")
     if not thumbnail.content_type.startswith("image/"):
@@ -134,115 +148,100 @@ async def add_medicine(
             status_code=400,
             detail="Invalid thumbnail file type. Please upload an image.",
         )
-    os.makedirs(os.path.dirname(thumbnail_location), exist_ok=True)
-    with open(thumbnail_location, "wb") as f:
-        f.write(await thumbnail.read())
-    logger.info(f"Received thumbnail: {thumbnail.filename}")
 
-    # save training files to uploads/training/medicine_name/filename.jpg
-    training_location = f"uploads/training/{medicine_input.name}/"
-    os.makedirs(training_location, exist_ok=True)
     if not training_files:
         raise HTTPException(status_code=400, detail="No training files provided")
-
-    try:
-        for training_file in training_files:
-            if not training_file.filename:
-                raise HTTPException(
-                    status_code=400, detail="One of the training files has no filename"
-                )
-            if not training_file.content_type.startswith("image/"):
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Invalid training file type for {training_file.filename}. Please upload an image.",
-                )
-
-            # Convert file to numpy array for detection
-            image_data = cv2.imdecode(
-                np.frombuffer(await training_file.read(), np.uint8), cv2.IMREAD_COLOR
+    for training_file in training_files:
+        if not training_file.filename:
+            raise HTTPException(
+                status_code=400, detail="One of the training files has no filename"
+            )
+        if not training_file.content_type.startswith("image/"):
+            raise HTTPException(
+                status_code=400,
+                detail=f"Invalid training file type for {training_file.filename}. Please upload an image.",
             )
-            result = await ObjectDetectionService.detect_medicines(image_data)
 
-            # Crop the detected medicine from the image
-            if not result:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"No medicine detected in training image {training_file.filename}. Please upload a clear image of the medicine.",
-                )
-            x1, y1, x2, y2 = map(int, result[0]["bbox"])
-            cropped_image = image_data[y1:y2, x1:x2]
+    # Upload files are closed once the request ends, so stage them on disk now
+    # (streamed, never held in memory); the ingest job owns the training files.
+    try:
+        staged = await fs.save_uploads([thumbnail, *training_files], blob_store.staging_dir)
+    except fs.UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    (thumbnail_path, thumbnail_blob_id), staged_training = staged[0], staged[1:]
+    uploads = [(training_file.filename, path) for training_file, (path, _) in zip(training_files, staged_training)]
 
-            # Save cropped image
-            ext = os.path.splitext(training_file.filename)[1] or ".jpg"
-            filename = f"{uuid.uuid4().hex}{ext}"
-            training_file_location = os.path.join(training_location, filename)
-            cv2.imwrite(training_file_location, cropped_image)
-            logger.info(f"Received and processed training file: {training_file.filename}")
+    async def discard_staged():
+        for path, _ in staged:
+            await blob_store.discard_staged(path)
 
-    except cv2.error as e:
-        logger.error(f"OpenCV error in add_medicine: {e}")
-        raise HTTPException(status_code=400, detail="Error processing image. The file might be corrupted.")
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"Unexpected error in add_medicine: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail="An unexpected error occurred while adding the medicine.")
+    try:
+        thumbnail_variants = await ThumbnailService.render(thumbnail_path, thumbnail_blob_id)
+    except ValueError as e:
+        await discard_staged()
+        raise HTTPException(status_code=400, detail=str(e))
 
     try:
         new_medicine = await InventoryService.add_medicine(
-            db, medicine_input, thumbnail_location
+            db, medicine_input, thumbnail_blob_id
         )
 
         if not new_medicine:
             raise HTTPException(status_code=500, detail="Failed to add medicine to database")
-
-        job_id = f"train_{medicine_input.name}"
-        if immediate_training:
-            scheduler.add_job(
-                retrain_classification_model,
-                "date",
-                id=job_id,
-                replace_existing=True,
-            )
-        else:
-            scheduler.add_job(
-                retrain_classification_model,
-                "date",
-                run_date=datetime.now() + timedelta(minutes=10),
-                id=job_id,
-                replace_existing=True,
-            )
-        return new_medicine
+    except HTTPException:
+        await discard_staged()
+        raise
     except ValueError as e:
+        await discard_staged()
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
+        await discard_staged()
         logger.error(f"Error saving medicine to database: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Failed to save medicine information.")
 
+    await ThumbnailService.save(thumbnail_path, thumbnail_blob_id, thumbnail_variants)
+    logger.info(f"Received thumbnail: {thumbnail.filename}")
+
+    medicine_name = medicine_input.name
+
+    async def on_ingest_complete(job: IngestJob, crops: list[np.ndarray]):
+        if not crops:
+            logger.warning("No usable training crops for %s, skipping training", medicine_name)
+            return
+        if config.CLASSIFICATION_MODE == "prototype":
+            # Recognisable immediately, no retraining needed.
+            await prototype_service.add_samples(medicine_name, crops)
+        else:
+            _schedule_retraining(medicine_name, immediate_training)
+
+    job = TrainingIngestService.submit(medicine_name, uploads, on_ingest_complete)
+    return {"medicine": MedicineSchema.model_validate(new_medicine), "job": job}
 
 
+@router.get("/ingest/{job_id}", response_model=IngestJob)
+async def get_ingest_job(job_id: str):
+    job = TrainingIngestService.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Ingest job not found")
+    return job
+
 
 @router.delete("/delete/{medicine_id}", response_model=MedicineSchema)
 async def delete_medicine(medicine_id: int, db=fastapi.Depends(db.get_db)):
     try:
         medicine: MedicineSchema = await InventoryService.delete_medicine(db, medicine_id)
+        await prototype_service.remove(medicine.name)
+        TrainingIngestService.forget(medicine.name)
 
         # Also delete associated training images
         training_dir = f"uploads/training/{medicine.name}/"
+        logger.debug("Removing training images at %s", training_dir)
+        await blob_store.remove_view_dir(training_dir)
 
-        if os.path.exists(training_dir):
-            logger.debug("Removing training images at %s", training_dir)
-            for root, dirs, files in os.walk(training_dir, topdown=False):
-                for file in files:
-                    os.remove(os.path.join(root, file))
-                for dir in dirs:
-                    os.rmdir(os.path.join(root, dir))
-            os.rmdir(training_dir)
-
-        # Remove thumbnail
-        if medicine.image_path and os.path.exists(medicine.image_path):
+        # Remove thumbnail and its variants
+        if medicine.image_path:
             logger.debug("Removing thumbnail at %s", medicine.image_path)
-            os.remove(medicine.image_path)
+            await ThumbnailService.delete(medicine.image_path)
 
         return medicine
     except ValueError as e:
@@ -251,8 +250,28 @@ async def delete_medicine(medicine_id: int, db=fastapi.Depends(db.get_db)):
 
 @router.get("/uploads/thumbnails/{filename}")
 async def get_thumbnail(filename: str):
-    file_path = os.path.join("uploads", "thumbnails", filename)
-    if not os.path.exists(file_path):
+    if ThumbnailService.is_variant(filename):
+        data = await ThumbnailService.get_variant(filename)
+        if data is None:
+            raise HTTPException(status_code=404, detail="Thumbnail not found")
+        # Variant names are content hashes, so a URL always maps to the same bytes.
+        return fastapi.Response(
+            content=data,
+            media_type=ThumbnailService.media_type(filename),
+            headers={"Cache-Control": IMMUTABLE_CACHE_CONTROL, "ETag": f'"{filename}"'},
+        )
+
+    blob_id = os.path.splitext(filename)[0]
+    if is_blob_id(blob_id):
+        data = await ThumbnailService.get_original(blob_id)
+        if data is None:
+            raise HTTPException(status_code=404, detail="Thumbnail not found")
+        return fastapi.Response(
+            content=data, media_type="image/jpeg", headers={"Cache-Control": IMMUTABLE_CACHE_CONTROL}
+        )
+
+    file_path = os.path.join("uploads", "thumbnails", os.path.basename(filename))
+    if not await fs.isfile(file_path):
         raise HTTPException(status_code=404, detail="Thumbnail not found")
     return fastapi.responses.FileResponse(file_path)
 
@@ -268,12 +287,20 @@ async def recognize_medicine(image: UploadFile):
                 status_code=400, detail="Invalid file type. Please upload an image."
             )
 
-        # Convert to numpy array
-        image_data = cv2.imdecode(
-            np.frombuffer(await image.read(), np.uint8), cv2.IMREAD_COLOR
-        )
+        content = await image.read()
 
-        results = await ObjectDetectionService.detect_medicines(image_data)
+        # Decoded just large enough for the detector; crops come back in original coordinates.
+        frame = await DecodedFrame.decode(content, config.DETECTION_DECODE_SIZE, RECOGNIZE_ENDPOINT)
+        if frame is None:
+            raise HTTPException(status_code=400, detail="Failed to decode image")
+
+        cache_key = recognition_cache.frame_key(frame.image) if recognition_cache.enabled else None
+        cached = recognition_cache.get(RECOGNIZE_ENDPOINT, cache_key) if cache_key is not None else None
+        if cached is not None:
+            return fastapi.responses.JSONResponse(content=cached)
+
+        with metrics.stage(RECOGNIZE_ENDPOINT, "detection", "detection"):
+            results = await ObjectDetectionService.detect_medicines(frame.image)
 
         detection_with_classification = []
         for result in results:
@@ -282,27 +309,36 @@ async def recognize_medicine(image: UploadFile):
             bbox = result["bbox"]
 
             # Crop the detected medicine from the image
-            x1, y1, x2, y2 = map(int, bbox)
-            cropped_image = image_data[y1:y2, x1:x2]
+            x1, y1, x2, y2 = frame.to_original(bbox)
+            cropped_image = await frame.crop(x1, y1, x2, y2, config.CLASSIFICATION_MIN_CROP)
+
+            detection = {
+                "label": class_id,
+                "confidence": confidence,
+                "bbox": {
+                    "x": x1,
+                    "y": y1,
+                    "width": x2 - x1,
+                    "height": y2 - y1,
+                },
+            }
+
+            if config.CLASSIFICATION_MODE == "prototype":
+                with metrics.stage(RECOGNIZE_ENDPOINT, "classification", "prototype"):
+                    classify_result = await prototype_service.classify(cropped_image)
+                detection_with_classification.append({"detection": detection, "classify": classify_result})
+                continue
 
             # Classify the cropped image
-            classification = await cls_service.classify(cropped_image)
+            with metrics.stage(RECOGNIZE_ENDPOINT, "classification", "classification"):
+                classification = await cls_service.classify(cropped_image)
 
             result["classification"] = classification
             for classify in classification:
                 probs: Probs = classify.probs
                 detection_with_classification.append(
                     {
-                        "detection": {
-                            "label": class_id,
-                            "confidence": confidence,
-                            "bbox": {
-                                "x": x1,
-                                "y": y1,
-                                "width": x2 - x1,
-                                "height": y2 - y1,
-                            },
-                        },
+                        "detection": detection,
                         "classify": {
                             "product": classify.names[probs.top1],
                             "confidence": float(probs.top1conf),
@@ -312,7 +348,11 @@ async def recognize_medicine(image: UploadFile):
 
         logger.info(f"Received image: {image.filename}")
 
-        return {"results": detection_with_classification}
+        with metrics.stage(RECOGNIZE_ENDPOINT, "serialization"):
+            content = jsonable_encoder({"results": detection_with_classification})
+            if cache_key is not None:
+                recognition_cache.put(RECOGNIZE_ENDPOINT, cache_key, content)
+            return fastapi.responses.JSONResponse(content=content)
     except cv2.error as e:
         logger.error(f"OpenCV error in recognize_medicine: {e}")
         raise HTTPException(status_code=400, detail="Error processing image for recognition. The image might be corrupted.")
@@ -9,8 +9,12 @@ from app.database import database
 from app.database.models import User
 from app.database.schemas import UserSchema, UserInputSchema
 
+from app.services import fs
+from app.services.blob_store import blob_store
+from app.services.face_gallery import EnrollmentRejectedError, face_gallery
 from app.services.user_service import UserService
 from app.types.UserInput import UserInput
+from app.utils import conditional
 
 router = fastapi.APIRouter()
 
@@ -19,14 +23,48 @@ class ToggleUserActiveStatus(BaseModel):
     is_active: bool
 
 
+class SelfieRejection(BaseModel):
+    filename: str | None
+    reason: str
+
+
+class AddPhotosResult(BaseModel):
+    accepted: List[str | None]
+    rejected: List[SelfieRejection]
+
+
 @router.get("/all", response_model=List[UserSchema])
-async def get_users(db=fastapi.Depends(database.get_db)):
+async def get_users(request: fastapi.Request, response: fastapi.Response, db=fastapi.Depends(database.get_db)):
+    version, last_modified = await UserService.users_version(db)
+    etag = conditional.make_etag("users", version)
+    if conditional.is_not_modified(request, etag):
+        return conditional.not_modified(etag, last_modified)
+
+    conditional.set_validators(response, etag, last_modified)
     return await UserService.get_users(db)
 
 
 @router.post("/create", response_model=UserSchema)
-async def create_user(selfie_image: UploadFile, db=fastapi.Depends(database.get_db), user: UserInput = Depends()):
-    return await UserService.create_user(db, UserInputSchema(**user.dict()), selfie_image)
+async def create_user(selfie_image: List[UploadFile], db=fastapi.Depends(database.get_db),
+                      user: UserInput = Depends()):
+    try:
+        return await UserService.create_user(db, UserInputSchema(**user.dict()), selfie_image)
+    except fs.UploadTooLargeError as e:
+        raise fastapi.HTTPException(status_code=413, detail=str(e))
+    except EnrollmentRejectedError as e:
+        raise fastapi.HTTPException(status_code=400, detail={"message": str(e), "rejected": e.rejected})
+
+
+@router.post("/{user_id}/photos", response_model=AddPhotosResult)
+async def add_photos(user_id: int, selfie_images: List[UploadFile], db=fastapi.Depends(database.get_db)):
+    try:
+        return await UserService.add_photos(db, user_id, selfie_images)
+    except fs.UploadTooLargeError as e:
+        raise fastapi.HTTPException(status_code=413, detail=str(e))
+    except EnrollmentRejectedError as e:
+        raise fastapi.HTTPException(status_code=400, detail={"message": str(e), "rejected": e.rejected})
+    except ValueError as e:
+        raise fastapi.HTTPException(status_code=404, detail=str(e))
 
 
 @router.delete("/delete/{user_id}", response_model=UserSchema)
@@ -37,13 +75,8 @@ async def delete_user(user_id: int, db=fastapi.Depends(database.get_db)):
         if not user:
             raise ValueError("User not found.")
 
-        face_folder_path = os.path.join("db", user.face_name)
-        if os.path.exists(face_folder_path):
-            for filename in os.listdir(face_folder_path):
-                file_path = os.path.join(face_folder_path, filename)
-                if os.path.isfile(file_path):
-                    os.remove(file_path)
-            os.rmdir(face_folder_path)
+        await blob_store.remove_view_dir(os.path.join("db", user.face_name))
+        await face_gallery.remove(user.face_name)
 
         return user
     except ValueError as e:
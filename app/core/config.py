@@ -4,6 +4,11 @@ import dotenv
 
 dotenv.load_dotenv()
 
+
+def _env_flag(name: str, default: str) -> bool:
+    return os.getenv(name, default).lower() in {"1", "true", "yes", "on"}
+
+
 SECRET_KEY = os.getenv("SECRET_KEY", "default")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
@@ -12,11 +17,176 @@ DETECTION_CONFIDENCE = float(os.getenv("DETECTION_CONFIDENCE", 0.8))
 CLASSIFICATION_CONFIDENCE = float(os.getenv("CLASSIFICATION_CONFIDENCE", 0.8))
 FACE_RECOGNITION_CONF = float(os.getenv("FACE_RECOGNITION_CONFIDENCE", 0.75))
 
-ENABLE_SERIAL_UNLOCK = os.getenv("ENABLE_SERIAL_UNLOCK", "true").lower() in {
-    "1",
-    "true",
-    "yes",
-    "on",
-}
+ENABLE_SERIAL_UNLOCK = _env_flag("ENABLE_SERIAL_UNLOCK", "true")
 SERIAL_PORT = os.getenv("SERIAL_PORT", "")
 SERIAL_BAUDRATE = int(os.getenv("SERIAL_BAUDRATE", os.getenv("SERIAL_BAUD_RATE", 9600)))
+
+# Classification retraining
+# When enabled, augmentations are generated on the fly inside the dataloader workers
+# instead of writing n_aug JPEG copies of every crop to uploads/training_aug.
+STREAMING_AUGMENTATION = _env_flag("STREAMING_AUGMENTATION", "false")
+TRAINING_AUGMENTATIONS_PER_IMAGE = int(os.getenv("TRAINING_AUGMENTATIONS_PER_IMAGE", 20))
+TRAINING_WORKERS = int(os.getenv("TRAINING_WORKERS", 4))
+
+# "full" retrains every class from the current weights; "incremental" grows the
+# classifier head for newly added medicines and fine-tunes it on replayed samples,
+# falling back to a full retrain if accuracy on the existing classes drops. That
+# accuracy is measured on INCREMENTAL_HOLDOUT_FRACTION of each existing class's
+# crops, which are kept out of the replay set.
+CLASSIFICATION_TRAINING_MODE = os.getenv("CLASSIFICATION_TRAINING_MODE", "full").lower()
+INCREMENTAL_EPOCHS = int(os.getenv("INCREMENTAL_EPOCHS", 5))
+INCREMENTAL_REPLAY_PER_CLASS = int(os.getenv("INCREMENTAL_REPLAY_PER_CLASS", 20))
+INCREMENTAL_MAX_ACCURACY_DROP = float(os.getenv("INCREMENTAL_MAX_ACCURACY_DROP", 0.02))
+INCREMENTAL_HOLDOUT_FRACTION = float(os.getenv("INCREMENTAL_HOLDOUT_FRACTION", 0.2))
+
+# "closed" uses the YOLO classifier head; "prototype" matches backbone embeddings
+# against per-medicine prototypes so new medicines work without retraining.
+CLASSIFICATION_MODE = os.getenv("CLASSIFICATION_MODE", "closed").lower()
+PROTOTYPE_INDEX_PATH = os.getenv("PROTOTYPE_INDEX_PATH", "models/prototypes.npz")
+PROTOTYPE_UNKNOWN_THRESHOLD = float(os.getenv("PROTOTYPE_UNKNOWN_THRESHOLD", 0.6))
+
+# Blocking model calls (YOLO, decoding) run on this many threads, off the event loop.
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", 2))
+# Training uploads are decoded and detected in batches of this size.
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", 8))
+
+# Training crops within this many bits (of 64) of an existing crop of the same
+# medicine are treated as near-duplicates and dropped. Negative disables dedupe.
+DEDUPE_MAX_HAMMING_DISTANCE = int(os.getenv("DEDUPE_MAX_HAMMING_DISTANCE", 6))
+
+# Request tracing. Sampling is decided per request; spans are appended as
+# OTLP/JSON lines to TRACE_EXPORT_PATH and, if set, POSTed to an OTLP/HTTP
+# collector endpoint such as http://localhost:4318/v1/traces.
+TRACING_ENABLED = _env_flag("TRACING_ENABLED", "false")
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", 0.1))
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH", "traces/spans.jsonl")
+TRACE_COLLECTOR_URL = os.getenv("TRACE_COLLECTOR_URL", "")
+
+# SQL instrumentation. DB_ECHO logs every statement (development only). Statements
+# slower than SLOW_QUERY_MS are logged without their parameters; with
+# SLOW_QUERY_EXPLAIN, SELECTs also get their EXPLAIN plan, taken in a savepoint of
+# the request's transaction. Requests issuing more than QUERY_COUNT_WARN
+# statements are logged as likely N+1s. DEBUG adds X-Query-Count/X-Query-Time-Ms response headers.
+DEBUG = _env_flag("DEBUG", "false")
+DB_ECHO = _env_flag("DB_ECHO", "false")
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", 200))
+SLOW_QUERY_EXPLAIN = _env_flag("SLOW_QUERY_EXPLAIN", "false")
+QUERY_COUNT_WARN = int(os.getenv("QUERY_COUNT_WARN", 25))
+
+# Admin profiling endpoints under /debug. Per-request cProfile (X-Profile: 1 header)
+# is only honoured when PROFILING_ENABLED is set.
+PROFILING_ENABLED = _env_flag("PROFILING_ENABLED", "false")
+PROFILE_OUTPUT_DIR = os.getenv("PROFILE_OUTPUT_DIR", "profiles")
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", 60))
+
+# bcrypt runs on PASSWORD_HASH_WORKERS threads with at most PASSWORD_HASH_MAX_PENDING
+# hashes queued or running; further logins wait. Successful verifications are
+# remembered for PASSWORD_CACHE_TTL_SECONDS so repeated kiosk logins skip bcrypt.
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", 2))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", 16))
+PASSWORD_CACHE_TTL_SECONDS = float(os.getenv("PASSWORD_CACHE_TTL_SECONDS", 300))
+PASSWORD_CACHE_SIZE = int(os.getenv("PASSWORD_CACHE_SIZE", 1024))
+
+# Verified access tokens are cached (up to their own expiry, and at most
+# AUTH_CACHE_TTL_SECONDS) so authenticated requests skip JWT decoding and the user lookup.
+# The cache is dropped whenever the users table changes; each worker checks its
+# write counter at most every AUTH_CACHE_RECHECK_SECONDS, which bounds how long a
+# deactivated or demoted user keeps access on another worker (0 checks every request).
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", 4096))
+AUTH_CACHE_TTL_SECONDS = float(os.getenv("AUTH_CACHE_TTL_SECONDS", 300))
+AUTH_CACHE_RECHECK_SECONDS = float(os.getenv("AUTH_CACHE_RECHECK_SECONDS", 1))
+
+# Inventory change push (/events). Events go through the inventory_events table and
+# Postgres NOTIFY, so every worker pushes every change. The last INVENTORY_EVENT_HISTORY
+# events are kept for clients resuming from a sequence number; a client that falls
+# more than INVENTORY_EVENT_QUEUE_SIZE events behind is disconnected and resumes on
+# reconnect. Each worker also polls every INVENTORY_EVENT_POLL_SECONDS in case a
+# notification was missed while its listening connection was down.
+INVENTORY_EVENT_HISTORY = int(os.getenv("INVENTORY_EVENT_HISTORY", 1000))
+INVENTORY_EVENT_QUEUE_SIZE = int(os.getenv("INVENTORY_EVENT_QUEUE_SIZE", 100))
+INVENTORY_EVENT_POLL_SECONDS = float(os.getenv("INVENTORY_EVENT_POLL_SECONDS", 5))
+EVENT_KEEPALIVE_SECONDS = float(os.getenv("EVENT_KEEPALIVE_SECONDS", 15))
+
+# Thumbnails are resized at upload to each of these sizes (longest side, px), as
+# WebP and JPEG, and served from an in-memory LRU of at most THUMBNAIL_CACHE_BYTES.
+THUMBNAIL_SIZES = tuple(int(size) for size in os.getenv("THUMBNAIL_SIZES", "128,256,512").split(","))
+THUMBNAIL_CACHE_BYTES = int(os.getenv("THUMBNAIL_CACHE_BYTES", 64 * 1024 * 1024))
+
+# Content-addressed store for uploaded images (thumbnails, training crops, face
+# gallery). Blobs live under BLOB_STORE_DIR/ab/cd/<sha256>; training and gallery
+# folders hold hard links to them named by blob id.
+BLOB_STORE_DIR = os.getenv("BLOB_STORE_DIR", "uploads/blobs")
+
+# Route-level file I/O runs on its own pool so slow disks never hold up the event
+# loop or queue behind inference. Uploads are streamed in UPLOAD_CHUNK_BYTES pieces
+# and rejected above MAX_UPLOAD_BYTES each, or MAX_REQUEST_UPLOAD_BYTES for all
+# files of one request together.
+IO_WORKERS = int(os.getenv("IO_WORKERS", 4))
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", 1024 * 1024))
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", 25 * 1024 * 1024))
+MAX_REQUEST_UPLOAD_BYTES = int(os.getenv("MAX_REQUEST_UPLOAD_BYTES", 200 * 1024 * 1024))
+
+# Uploaded frames are decoded at reduced resolution (libjpeg DCT scaling, or a
+# resize for other formats) so their longest side is still at least the model's
+# working size. Crops smaller than the classifier / face-embedding input at that
+# resolution are taken from a full-resolution decode instead.
+DETECTION_DECODE_SIZE = int(os.getenv("DETECTION_DECODE_SIZE", 640))
+FACE_DECODE_SIZE = int(os.getenv("FACE_DECODE_SIZE", 1280))
+CLASSIFICATION_MIN_CROP = int(os.getenv("CLASSIFICATION_MIN_CROP", 128))
+FACE_MIN_CROP = int(os.getenv("FACE_MIN_CROP", 160))
+
+# Face quality gate, applied before embedding/matching. Faces narrower than
+# FACE_QUALITY_MIN_SIZE px (original image), with a Laplacian variance below
+# FACE_QUALITY_MIN_SHARPNESS (measured at FACE_QUALITY_BLUR_SIZE px), eyes closer
+# than FACE_QUALITY_MIN_EYE_DISTANCE px, or turned beyond the roll/yaw limits are
+# rejected. Yaw is the eye midpoint's horizontal offset from the box centre as a
+# fraction of the face width.
+FACE_QUALITY_GATE = _env_flag("FACE_QUALITY_GATE", "true")
+FACE_QUALITY_MIN_SIZE = int(os.getenv("FACE_QUALITY_MIN_SIZE", 80))
+FACE_QUALITY_BLUR_SIZE = int(os.getenv("FACE_QUALITY_BLUR_SIZE", 112))
+FACE_QUALITY_MIN_SHARPNESS = float(os.getenv("FACE_QUALITY_MIN_SHARPNESS", 40.0))
+FACE_QUALITY_MIN_EYE_DISTANCE = int(os.getenv("FACE_QUALITY_MIN_EYE_DISTANCE", 20))
+FACE_QUALITY_MAX_ROLL_DEGREES = float(os.getenv("FACE_QUALITY_MAX_ROLL_DEGREES", 20.0))
+FACE_QUALITY_MAX_YAW = float(os.getenv("FACE_QUALITY_MAX_YAW", 0.15))
+
+# /faces/stream. Only the newest frame is processed, frames arriving meanwhile
+# are skipped. Faces are tracked by box overlap (FACE_STREAM_IOU) and recognised
+# once per track, again every FACE_STREAM_RETRY_FRAMES processed frames while
+# unrecognised or below FACE_STREAM_RECHECK_CONFIDENCE. Tracks unseen for
+# FACE_STREAM_MAX_MISSED frames are dropped.
+FACE_STREAM_IOU = float(os.getenv("FACE_STREAM_IOU", 0.3))
+FACE_STREAM_MAX_MISSED = int(os.getenv("FACE_STREAM_MAX_MISSED", 5))
+FACE_STREAM_RETRY_FRAMES = int(os.getenv("FACE_STREAM_RETRY_FRAMES", 10))
+FACE_STREAM_RECHECK_CONFIDENCE = float(os.getenv("FACE_STREAM_RECHECK_CONFIDENCE", 0.5))
+
+# Recognition results of /faces/recognize and /medicines/recognize are reused for
+# RECOGNITION_CACHE_TTL_SECONDS when the same frame is sent again, e.g. a kiosk
+# retrying after a serial timeout. Medicines match by a 256-bit difference hash of
+# the decoded image; faces only by identical upload bytes, since their results
+# carry tokens. Cached face results expire no later than the tokens they contain.
+# RECOGNITION_CACHE_SIZE=0 disables the cache.
+RECOGNITION_CACHE_SIZE = int(os.getenv("RECOGNITION_CACHE_SIZE", 256))
+RECOGNITION_CACHE_TTL_SECONDS = float(os.getenv("RECOGNITION_CACHE_TTL_SECONDS", 2.0))
+
+# Face gallery search. Galleries of FACE_INDEX_EXACT_BELOW images or more are
+# searched through an IVF index (sqrt(n) k-means lists, FACE_INDEX_NPROBE of them
+# scanned per query); smaller ones are compared exhaustively.
+FACE_INDEX_EXACT_BELOW = int(os.getenv("FACE_INDEX_EXACT_BELOW", 2000))
+FACE_INDEX_NPROBE = int(os.getenv("FACE_INDEX_NPROBE", 8))
+
+# Face embeddings are kept in a memory-mapped store under EMBEDDING_STORE_DIR
+# (EMBEDDING_STORE_DTYPE is float16 or float32). Enrollments and deletions are
+# appended to a log that is folded into a new snapshot every
+# EMBEDDING_COMPACT_MINUTES, which also embeds gallery images the store is missing.
+EMBEDDING_STORE_DIR = os.getenv("EMBEDDING_STORE_DIR", "uploads/embeddings")
+EMBEDDING_STORE_DTYPE = os.getenv("EMBEDDING_STORE_DTYPE", "float16")
+EMBEDDING_COMPACT_MINUTES = int(os.getenv("EMBEDDING_COMPACT_MINUTES", 10))
+
+# Enrollment (/users/create, /users/{id}/photos) accepts several selfies; each
+# must hold exactly one real face passing the quality gate, and its embedding is
+# stored straight away. FACE_ENROLL_CENTROID keeps one averaged embedding per
+# user instead of one per selfie, which shrinks the gallery at some recall cost
+# for users photographed under very different conditions. The per-selfie
+# embeddings are still kept, under EMBEDDING_STORE_DIR/photos, so adding photos
+# only averages stored vectors instead of embedding every earlier selfie again.
+FACE_ENROLL_CENTROID = _env_flag("FACE_ENROLL_CENTROID", "false")
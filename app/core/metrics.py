@@ -0,0 +1,130 @@
+import time
+from contextlib import contextmanager
+
+import fastapi
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+
+# Sub-millisecond to multi-second: covers a JPEG decode as well as a cold model call.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+PIPELINE_STAGE_SECONDS = Histogram(
+    "biomedix_pipeline_stage_seconds",
+    "Time spent in each stage of the recognition pipelines",
+    ["endpoint", "stage", "model"],
+    buckets=LATENCY_BUCKETS,
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "biomedix_http_request_seconds",
+    "HTTP request latency by route template",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge(
+    "biomedix_http_requests_in_flight",
+    "HTTP requests currently being handled",
+)
+DB_QUERY_SECONDS = Histogram(
+    "biomedix_db_query_seconds",
+    "SQL statement latency by statement type",
+    ["statement"],
+    buckets=LATENCY_BUCKETS,
+)
+IMAGE_DECODED_BYTES = Histogram(
+    "biomedix_image_decoded_bytes",
+    "Size of decoded frame buffers, the bulk of a recognition request's peak memory",
+    ["endpoint", "resolution"],
+    buckets=(64 * 1024, 256 * 1024, 1024 ** 2, 4 * 1024 ** 2, 16 * 1024 ** 2, 36 * 1024 ** 2, 64 * 1024 ** 2),
+)
+RECOGNITION_CACHE_LOOKUPS = Counter(
+    "biomedix_recognition_cache_lookups",
+    "Recognition cache lookups by outcome (hit or miss)",
+    ["endpoint", "result"],
+)
+FACE_EMBEDDINGS = Counter(
+    "biomedix_face_embeddings",
+    "Faces embedded and searched against the gallery",
+    ["endpoint"],
+)
+FACE_QUALITY_REJECTIONS = Counter(
+    "biomedix_face_quality_rejections",
+    "Detected faces dropped by the quality gate before recognition",
+    ["reason"],
+)
+INFERENCE_IN_FLIGHT = Gauge(
+    "biomedix_inference_in_flight",
+    "Calls currently running on the inference pool",
+)
+INFERENCE_QUEUE_DEPTH = Gauge(
+    "biomedix_inference_queue_depth",
+    "Calls waiting for a free inference pool thread",
+)
+
+
+@contextmanager
+def stage(endpoint: str, name: str, model: str = ""):
+    """Record the duration of the enclosed block as one pipeline stage."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        PIPELINE_STAGE_SECONDS.labels(endpoint, name, model).observe(time.perf_counter() - start)
+
+
+class DatabasePoolCollector:
+    """Reads SQLAlchemy pool counters at scrape time instead of tracking every checkout."""
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def collect(self):
+        pool = self.engine.sync_engine.pool
+        for name, documentation, reader in (
+            ("size", "Configured size of the database connection pool", "size"),
+            ("checked_out", "Connections currently checked out of the pool", "checkedout"),
+            ("checked_in", "Idle connections in the pool", "checkedin"),
+            ("overflow", "Connections opened beyond the pool size", "overflow"),
+        ):
+            read = getattr(pool, reader, None)
+            if read is None:
+                continue
+            yield GaugeMetricFamily(f"biomedix_db_pool_{name}", documentation, value=read())
+
+
+def register_db_pool_collector(engine):
+    REGISTRY.register(DatabasePoolCollector(engine))
+
+
+class HTTPMetricsMiddleware:
+    """Request latency until the last body chunk, by route template and status."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        HTTP_REQUESTS_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_REQUESTS_IN_FLIGHT.dec()
+            # Label by route template, not raw path, to keep the series count bounded.
+            route = scope.get("route")
+            route_label = getattr(route, "path", "unmatched")
+            HTTP_REQUEST_SECONDS.labels(scope["method"], route_label, str(status)).observe(time.perf_counter() - start)
+
+
+def metrics_response() -> fastapi.Response:
+    return fastapi.Response(generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
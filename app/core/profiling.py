@@ -0,0 +1,88 @@
+import cProfile
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+
+from app.core import config
+
+_sampler_lock = threading.Lock()
+_cprofile_lock = threading.Lock()
+
+
+class ProfilerBusyError(RuntimeError):
+    pass
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    # Function definition line rather than the current line, so samples aggregate per function.
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def sample_stacks(duration: float, interval: float) -> str:
+    """
+    Sample the Python stack of every thread (event loop, APScheduler, inference pool,
+    ...) every `interval` seconds for `duration` seconds and return the result in
+    collapsed-stack format ("thread;outer;...;inner count"), ready for flamegraph.pl
+    or speedscope. Blocking: run it in a worker thread.
+    """
+    if not _sampler_lock.acquire(blocking=False):
+        raise ProfilerBusyError("A sampling profile is already running")
+
+    try:
+        own_ident = threading.get_ident()
+        counts: Counter[str] = Counter()
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                stack.append(names.get(ident, f"thread-{ident}"))
+                counts[";".join(reversed(stack))] += 1
+            time.sleep(interval)
+    finally:
+        _sampler_lock.release()
+
+    return "\n".join(f"{stack} {count}" for stack, count in counts.most_common()) + "\n"
+
+
+def profile_path(profile_id: str) -> str:
+    return os.path.join(config.PROFILE_OUTPUT_DIR, f"{profile_id}.prof")
+
+
+@contextmanager
+def profiled():
+    """
+    Run the enclosed block under cProfile and dump the stats to PROFILE_OUTPUT_DIR
+    when it finishes. Yields the profile id, or None if another request is
+    already being profiled.
+
+    cProfile hooks the event loop thread, so anything else running on the loop during
+    the request is included too; that's why only one request is profiled at a time.
+    """
+    if not _cprofile_lock.acquire(blocking=False):
+        yield None
+        return
+
+    profile_id = uuid.uuid4().hex
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+        try:
+            yield profile_id
+        finally:
+            profiler.disable()
+    finally:
+        _cprofile_lock.release()
+
+    os.makedirs(config.PROFILE_OUTPUT_DIR, exist_ok=True)
+    profiler.dump_stats(profile_path(profile_id))
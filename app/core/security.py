@@ -1,3 +1,11 @@
+import asyncio
+import hashlib
+import hmac
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta, datetime, UTC
 from passlib.context import CryptContext
 from pydantic import BaseModel
@@ -13,6 +21,17 @@ class Token(BaseModel):
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# bcrypt is deliberately slow (~100-300 ms), so it runs on its own small pool rather
+# than on the event loop or the default executor shared with everything else.
+_hash_pool = ThreadPoolExecutor(max_workers=config.PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+_hash_slots = asyncio.Semaphore(config.PASSWORD_HASH_MAX_PENDING)
+
+# (user_id, hash fingerprint) -> (HMAC of the verified plaintext, expiry). The HMAC
+# key only lives in this process, so the cache never holds anything reusable.
+_verified: OrderedDict[tuple[int, str], tuple[bytes, float]] = OrderedDict()
+_verified_lock = threading.Lock()
+_verified_key = secrets.token_bytes(32)
+
 
 async def create_access_token(user_id: int, expires_delta: timedelta | None) -> str:
     expires = datetime.now(UTC) + (
@@ -21,6 +40,12 @@ async def create_access_token(user_id: int, expires_delta: timedelta | None) ->
     return token
 
 
+def token_expires_at(token: str) -> float:
+    """The "exp" of a token this service issued, as unix seconds; 0 if it has none."""
+    payload = jwt.decode(token, options={"verify_signature": False})
+    return float(payload.get("exp", 0))
+
+
 async def verify_access_token(token: str) -> int:
     try:
         payload = jwt.decode(token, "your_secret_key", algorithms=["HS256"])
@@ -44,9 +69,67 @@ async def decode_access_token(token: str) -> Token:
         raise ValueError("Invalid token")
 
 
+async def _run_bcrypt(func, *args):
+    async with _hash_slots:
+        return await asyncio.get_running_loop().run_in_executor(_hash_pool, func, *args)
+
+
+def _verified_entry_key(user_id: int, hashed_password: str) -> tuple[int, str]:
+    # The stored hash changes with the password, so a new password never hits an old entry.
+    return user_id, hashlib.sha256(hashed_password.encode()).hexdigest()
+
+
+def _password_digest(plain_password: str) -> bytes:
+    return hmac.new(_verified_key, plain_password.encode(), hashlib.sha256).digest()
+
+
+def _is_cached_verified(key: tuple[int, str], plain_password: str) -> bool:
+    with _verified_lock:
+        entry = _verified.get(key)
+        if entry is None:
+            return False
+        digest, expires = entry
+        if expires < time.monotonic():
+            del _verified[key]
+            return False
+        _verified.move_to_end(key)
+    return hmac.compare_digest(digest, _password_digest(plain_password))
+
+
+def _remember_verified(key: tuple[int, str], plain_password: str):
+    if config.PASSWORD_CACHE_TTL_SECONDS <= 0:
+        return
+    with _verified_lock:
+        _verified[key] = (_password_digest(plain_password), time.monotonic() + config.PASSWORD_CACHE_TTL_SECONDS)
+        _verified.move_to_end(key)
+        while len(_verified) > config.PASSWORD_CACHE_SIZE:
+            _verified.popitem(last=False)
+
+
+def invalidate_verified_password(user_id: int):
+    """Forget cached verifications of a user, e.g. after a password change or deletion."""
+    with _verified_lock:
+        for key in [key for key in _verified if key[0] == user_id]:
+            del _verified[key]
+
+
 async def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+    return await _run_bcrypt(pwd_context.hash, password)
+
+
+async def verify_password(plain_password: str, hashed_password: str, user_id: int | None = None) -> bool:
+    """
+    Check `plain_password` against a bcrypt hash off the event loop. With `user_id`,
+    a successful check is cached briefly so the same login skips bcrypt next time.
+    """
+    if user_id is None:
+        return await _run_bcrypt(pwd_context.verify, plain_password, hashed_password)
 
+    key = _verified_entry_key(user_id, hashed_password)
+    if _is_cached_verified(key, plain_password):
+        return True
 
-async def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    verified = await _run_bcrypt(pwd_context.verify, plain_password, hashed_password)
+    if verified:
+        _remember_verified(key, plain_password)
+    return verified
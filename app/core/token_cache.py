@@ -0,0 +1,87 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from app.core import config
+
+
+@dataclass(frozen=True)
+class CachedIdentity:
+    user_id: int
+    role: str
+    is_active: bool
+    expires_at: float  # token "exp", unix seconds
+
+
+_entries: OrderedDict[str, tuple[CachedIdentity, float]] = OrderedDict()
+_tokens_by_user: dict[int, set[str]] = {}
+_lock = threading.Lock()
+# Write counter of the users table the entries were read under. Every change to
+# a user, made by any worker, bumps it; invalidate_user() only reaches this one.
+_users_version: int | None = None
+_users_version_checked_at = float("-inf")
+
+
+def _drop(token: str):
+    entry = _entries.pop(token, None)
+    if entry is None:
+        return
+    tokens = _tokens_by_user.get(entry[0].user_id)
+    if tokens is not None:
+        tokens.discard(token)
+        if not tokens:
+            del _tokens_by_user[entry[0].user_id]
+
+
+def get(token: str) -> CachedIdentity | None:
+    with _lock:
+        entry = _entries.get(token)
+        if entry is None:
+            return None
+        identity, stale_at = entry
+        if min(identity.expires_at, stale_at) <= time.time():
+            _drop(token)
+            return None
+        _entries.move_to_end(token)
+        return identity
+
+
+def users_version_due() -> bool:
+    return time.monotonic() - _users_version_checked_at >= config.AUTH_CACHE_RECHECK_SECONDS
+
+
+def users_version() -> int | None:
+    return _users_version
+
+
+def observe_users_version(version: int):
+    """Record the current users write counter; if it moved, every entry is dropped."""
+    global _users_version, _users_version_checked_at
+    with _lock:
+        _users_version_checked_at = time.monotonic()
+        if version != _users_version:
+            _entries.clear()
+            _tokens_by_user.clear()
+            _users_version = version
+
+
+def put(token: str, identity: CachedIdentity, version: int | None):
+    """Cache an identity read while the users write counter was at `version`."""
+    if config.AUTH_CACHE_SIZE <= 0:
+        return
+    with _lock:
+        if version is None or version != _users_version:
+            return  # users changed since the lookup; the identity may already be stale
+        _drop(token)
+        _entries[token] = (identity, time.time() + config.AUTH_CACHE_TTL_SECONDS)
+        _tokens_by_user.setdefault(identity.user_id, set()).add(token)
+        while len(_entries) > config.AUTH_CACHE_SIZE:
+            _drop(next(iter(_entries)))
+
+
+def invalidate_user(user_id: int):
+    """Forget every cached token of a user whose status, role or existence changed."""
+    with _lock:
+        for token in list(_tokens_by_user.get(user_id, ())):
+            _drop(token)
@@ -0,0 +1,224 @@
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from app.core import config
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = "biomedix-backend"
+EXPORT_BATCH_SIZE = 512
+EXPORT_INTERVAL_SECONDS = 1.0
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: str | None
+    sampled: bool
+    start_ns: int = 0
+    end_ns: int = 0
+    attributes: dict = field(default_factory=dict)
+    error: str | None = None
+
+    def set_attribute(self, key: str, value):
+        if self.sampled:
+            self.attributes[key] = value
+
+
+_current_span: ContextVar[Span | None] = ContextVar("current_span", default=None)
+
+
+def _new_id(n_bytes: int) -> str:
+    return random.getrandbits(n_bytes * 8).to_bytes(n_bytes, "big").hex()
+
+
+def current_span() -> Span | None:
+    return _current_span.get()
+
+
+def start_span(name: str, **attributes) -> Span | None:
+    """
+    Create a span under the current one without making it current; for leaf spans
+    opened and closed from callbacks (e.g. SQLAlchemy events). Pair with end_span().
+    The sampling decision is taken once per trace, at its root span.
+    """
+    if not config.TRACING_ENABLED:
+        return None
+
+    parent = _current_span.get()
+    if parent is None:
+        trace_id, parent_id = _new_id(16), None
+        sampled = random.random() < config.TRACE_SAMPLE_RATE
+    else:
+        trace_id, parent_id, sampled = parent.trace_id, parent.span_id, parent.sampled
+
+    span = Span(name=name, trace_id=trace_id, span_id=_new_id(8), parent_id=parent_id, sampled=sampled)
+    if sampled:
+        span.start_ns = time.time_ns()
+        span.attributes.update(attributes)
+    return span
+
+
+def end_span(span: Span | None, error: BaseException | None = None):
+    if span is None or not span.sampled:
+        return
+    span.end_ns = time.time_ns()
+    if error is not None:
+        span.error = f"{type(error).__name__}: {error}"
+    _exporter.export(span)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Trace the enclosed block as a child of the current span."""
+    created = start_span(name, **attributes)
+    if created is None:
+        yield None
+        return
+
+    token = _current_span.set(created)
+    try:
+        yield created
+    except BaseException as e:
+        end_span(created, e)
+        raise
+    else:
+        end_span(created)
+    finally:
+        _current_span.reset(token)
+
+
+def _otlp_attribute(key: str, value) -> dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+def _otlp_span(span: Span) -> dict:
+    encoded = {
+        "traceId": span.trace_id,
+        "spanId": span.span_id,
+        "name": span.name,
+        "kind": 1,  # SPAN_KIND_INTERNAL
+        "startTimeUnixNano": str(span.start_ns),
+        "endTimeUnixNano": str(span.end_ns),
+        "attributes": [_otlp_attribute(key, value) for key, value in span.attributes.items()],
+        "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+    }
+    if span.parent_id:
+        encoded["parentSpanId"] = span.parent_id
+    return encoded
+
+
+class _SpanExporter:
+    """
+    Batches finished spans on a daemon thread and writes them as OTLP/JSON
+    ExportTraceServiceRequest lines to TRACE_EXPORT_PATH, and optionally POSTs them
+    to an OTLP/HTTP collector. Spans are dropped rather than blocking the caller
+    when the queue is full.
+    """
+
+    def __init__(self):
+        self._queue: queue.Queue[Span] = queue.Queue(maxsize=10_000)
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def export(self, span: Span):
+        if self._thread is None:
+            self._start()
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + EXPORT_INTERVAL_SECONDS
+            while len(batch) < EXPORT_BATCH_SIZE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            except Exception as e:
+                logger.warning("Failed to export %d spans: %s", len(batch), e)
+
+    def _write(self, batch: list[Span]):
+        payload = json.dumps({
+            "resourceSpans": [{
+                "resource": {"attributes": [_otlp_attribute("service.name", SERVICE_NAME)]},
+                "scopeSpans": [{"scope": {"name": __name__}, "spans": [_otlp_span(span) for span in batch]}],
+            }]
+        })
+
+        if config.TRACE_EXPORT_PATH:
+            os.makedirs(os.path.dirname(config.TRACE_EXPORT_PATH) or ".", exist_ok=True)
+            with open(config.TRACE_EXPORT_PATH, "a", encoding="utf-8") as f:
+                f.write(payload + "\n")
+
+        if config.TRACE_COLLECTOR_URL:
+            request = urllib.request.Request(
+                config.TRACE_COLLECTOR_URL,
+                data=payload.encode(),
+                headers={"Content-Type": "application/json"},
+                method="POST",
+            )
+            urllib.request.urlopen(request, timeout=5).close()
+
+
+_exporter = _SpanExporter()
+
+
+class TracingMiddleware:
+    """Open the root span of every request; everything awaited inside becomes its child."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with span("http.request", **{"http.method": scope["method"], "http.target": scope["path"]}) as root:
+            if root is None:
+                await self.app(scope, receive, send)
+                return
+
+            async def send_with_status(message):
+                if message["type"] == "http.response.start":
+                    root.set_attribute("http.status_code", message["status"])
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_status)
+            finally:
+                route = scope.get("route")
+                root.name = f"{scope['method']} {getattr(route, 'path', scope['path'])}"
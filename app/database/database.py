@@ -3,6 +3,9 @@ from sqlalchemy.orm import sessionmaker, declarative_base
 import os
 from dotenv import load_dotenv
 
+from app.core import config
+from app.database import instrumentation
+
 load_dotenv()
 
 DB_USER = os.getenv("DB_USER", "postgres")
@@ -12,7 +15,8 @@ DB_PORT = os.getenv("DB_PORT", "5432")
 DB_NAME = os.getenv("DB_NAME", "postgres")
 DATABASE_URL = os.getenv("DATABASE_URL", f"postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}")
 
-engine = create_async_engine(DATABASE_URL, echo=True, future=True)
+engine = create_async_engine(DATABASE_URL, echo=config.DB_ECHO, future=True)
+instrumentation.install(engine)
 
 AsyncSessionLocal = sessionmaker(
     bind=engine,
@@ -0,0 +1,144 @@
+import logging
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from sqlalchemy import event
+from starlette.datastructures import MutableHeaders
+
+from app.core import config, metrics, tracing
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class QueryStats:
+    count: int = 0
+    seconds: float = 0.0
+
+
+# Set per request by QueryStatsMiddleware; SQLAlchemy's greenlets share the
+# caller's context, so statements executed for the request are counted here.
+_request_stats: ContextVar[QueryStats | None] = ContextVar("request_query_stats", default=None)
+
+
+def _statement_name(statement: str) -> str:
+    return statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "SQL"
+
+
+def _explain(conn, statement: str, parameters) -> str:
+    """
+    EXPLAIN on the statement's own connection. Inside a transaction it runs in a
+    savepoint, so a failing EXPLAIN does not abort the request's transaction.
+    """
+    savepoint = conn.in_transaction()
+    cursor = conn.connection.cursor()
+    try:
+        if savepoint:
+            cursor.execute("SAVEPOINT slow_query_explain")
+        try:
+            cursor.execute(f"EXPLAIN {statement}", parameters)
+            plan = "\n".join(str(row[0]) for row in cursor.fetchall())
+        except Exception:
+            if savepoint:
+                cursor.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+                cursor.execute("RELEASE SAVEPOINT slow_query_explain")
+            raise
+        if savepoint:
+            cursor.execute("RELEASE SAVEPOINT slow_query_explain")
+        return plan
+    finally:
+        cursor.close()
+
+
+def _log_slow_query(conn, statement: str, parameters, executemany: bool, elapsed: float):
+    plan = None
+    if config.SLOW_QUERY_EXPLAIN and not executemany and _statement_name(statement) == "SELECT":
+        try:
+            plan = _explain(conn, statement, parameters)
+        except Exception as e:
+            plan = f"<EXPLAIN failed: {e}>"
+
+    # Parameters are left out: they include emails and password hashes.
+    logger.warning(
+        "Slow query (%.1f ms): %s%s",
+        elapsed * 1000,
+        statement,
+        f"\nPlan:\n{plan}" if plan else "",
+    )
+
+
+def install(engine):
+    """
+    Hook cursor-level events on `engine` to time every statement, count statements per
+    request, log slow ones and give each a tracing span.
+    """
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._trace_span = tracing.start_span(
+            f"db.{_statement_name(statement)}",
+            **{"db.system": "postgresql", "db.statement": statement},
+        )
+        context._query_start = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._query_start
+        tracing.end_span(getattr(context, "_trace_span", None))
+        metrics.DB_QUERY_SECONDS.labels(_statement_name(statement)).observe(elapsed)
+
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.count += 1
+            stats.seconds += elapsed
+
+        if elapsed * 1000 >= config.SLOW_QUERY_MS:
+            _log_slow_query(conn, statement, parameters, executemany, elapsed)
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _handle_error(exception_context):
+        context = exception_context.execution_context
+        if context is not None:
+            tracing.end_span(getattr(context, "_trace_span", None), exception_context.original_exception)
+
+
+class QueryStatsMiddleware:
+    """
+    Count the statements of each request and warn about likely N+1 patterns. With
+    DEBUG the counts so far are also sent as X-Query-* response headers.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats()
+
+        async def send_with_stats(message):
+            if config.DEBUG and message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers["X-Query-Count"] = str(stats.count)
+                headers["X-Query-Time-Ms"] = f"{stats.seconds * 1000:.1f}"
+            await send(message)
+
+        token = _request_stats.set(stats)
+        try:
+            await self.app(scope, receive, send_with_stats)
+        finally:
+            _request_stats.reset(token)
+
+        if stats.count > config.QUERY_COUNT_WARN:
+            route = scope.get("route")
+            logger.warning(
+                "%s %s issued %d queries (%.1f ms), possible N+1",
+                scope["method"],
+                getattr(route, "path", scope["path"]),
+                stats.count,
+                stats.seconds * 1000,
+            )
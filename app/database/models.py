@@ -1,7 +1,8 @@
 from datetime import datetime
 from typing import List
 
-from sqlalchemy import Integer, String, ForeignKey, DateTime, func
+from sqlalchemy import BigInteger, Integer, String, ForeignKey, DateTime, func
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import mapped_column, DeclarativeBase, Mapped, relationship
 
 
@@ -83,3 +84,21 @@ class AccessLog(Base):
     timestamp: Mapped[datetime] = mapped_column(server_default=func.now())
     created_at: Mapped[datetime] = mapped_column(server_default=func.now())
 
+
+
+class TableVersion(Base):
+    """Write counter per table, maintained by triggers (sql/5. create_table_versions.sql)."""
+    __tablename__ = "table_versions"
+
+    name: Mapped[str] = mapped_column(String(64), primary_key=True)
+    version: Mapped[int] = mapped_column(BigInteger, default=0)
+
+
+class InventoryEventRecord(Base):
+    """Published inventory change (sql/6. create_inventory_events.sql)."""
+    __tablename__ = "inventory_events"
+
+    seq: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=False)
+    type: Mapped[str] = mapped_column(String(32))
+    data: Mapped[dict] = mapped_column(JSONB)
+    created_at: Mapped[datetime] = mapped_column(server_default=func.now())
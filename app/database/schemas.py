@@ -5,6 +5,8 @@ import pydantic
 from pydantic import BaseModel, Field
 from datetime import datetime
 
+from app.services.thumbnail_service import variant_urls
+
 """
 This module defines Pydantic schemas for the database models.
 These schemas are used for data validation and serialization.
@@ -63,6 +65,12 @@ class MedicineSchema(pydantic.BaseModel):
     created_at: datetime = Field(...)
     updated_at: datetime = Field(...)
 
+    @pydantic.computed_field
+    @property
+    def thumbnails(self) -> dict[str, dict[str, str]]:
+        """Resized thumbnail URLs by size and format, e.g. thumbnails["128"]["webp"]."""
+        return variant_urls(self.image_path)
+
     model_config = {
         "from_attributes": True
     }
@@ -1,5 +1,6 @@
 import logging
 from contextlib import asynccontextmanager
+from datetime import datetime
 import fastapi
 from fastapi import FastAPI, Depends
 from starlette.middleware.cors import CORSMiddleware
@@ -10,7 +11,14 @@ from app.api.routes_medicine import router as medicine_routes
 from app.api.routes_face_recognition import router as face_recognition_routes
 from app.api.routes_transactions import router as transactions_routes
 from app.api.routes_access_logs import router as access_logs_routes
+from app.api.routes_debug import router as debug_routes, CProfileMiddleware
+from app.api.routes_events import router as events_routes
+from app.core import config, metrics, tracing
+from app.database import instrumentation
+from app.database.database import engine
 from app.scheduler.scheduler import start_scheduler, scheduler
+from app.scheduler.tasks import compact_face_embeddings
+from app.services.inventory_events import event_bus
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -29,10 +37,22 @@ async def lifespan(app: FastAPI):
     # Startup code
     logger.info("Starting up...")
     start_scheduler()
+    # Also runs right away, so galleries enrolled before the embedding store are picked up.
+    scheduler.add_job(
+        compact_face_embeddings,
+        "interval",
+        minutes=config.EMBEDDING_COMPACT_MINUTES,
+        id="compact_face_embeddings",
+        replace_existing=True,
+        next_run_time=datetime.now(),
+    )
+
+    await event_bus.start(engine)
 
     yield
 
     # Shutdown code
+    await event_bus.stop()
     scheduler.shutdown()
     logger.info("Shutting down...")
 
@@ -46,6 +66,13 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Pure ASGI, so streamed responses (SSE) and WebSockets are not buffered or
+# re-wrapped per layer the way app.middleware("http") does.
+app.add_middleware(CProfileMiddleware)
+app.add_middleware(metrics.HTTPMetricsMiddleware)
+app.add_middleware(instrumentation.QueryStatsMiddleware)
+app.add_middleware(tracing.TracingMiddleware)
+metrics.register_db_pool_collector(engine)
 
 
 @app.exception_handler(Exception)
@@ -62,8 +89,15 @@ app.include_router(medicine_routes, prefix="/medicines", tags=["medicines"])
 app.include_router(face_recognition_routes, prefix="/faces", tags=["faces"])
 app.include_router(transactions_routes, prefix="/transactions", tags=["transactions"])
 app.include_router(access_logs_routes, prefix="/access-logs", tags=["access-logs"])
+app.include_router(events_routes, prefix="/events", tags=["events"])
+app.include_router(debug_routes, prefix="/debug", tags=["debug"])
 
 
 @app.get("/")
 async def health_check():
     return {"status": True}
+
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    return metrics.metrics_response()
@@ -0,0 +1,132 @@
+import logging
+from functools import partial
+from typing import Callable
+
+import cv2
+import torch
+import ultralytics
+
+from app.scheduler.streaming_dataset import StreamingClassificationTrainer, list_class_samples, split_holdout
+
+logger = logging.getLogger(__name__)
+
+
+def expand_classifier_head(model: ultralytics.YOLO, class_names: list[str]) -> None:
+    """
+    Resize the Classify head to `class_names`, keeping the learned weights of every
+    class the model already knows (matched by name, since indices follow sort order).
+    Rows for new classes start near zero so they don't disturb existing predictions.
+    """
+    head = model.model.model[-1]
+    old_linear = head.linear
+    old_index = {name: index for index, name in model.names.items()}
+
+    new_linear = torch.nn.Linear(old_linear.in_features, len(class_names))
+    with torch.no_grad():
+        new_linear.weight.normal_(0.0, 0.01)
+        new_linear.bias.zero_()
+        for index, name in enumerate(class_names):
+            if name in old_index:
+                new_linear.weight[index] = old_linear.weight[old_index[name]]
+                new_linear.bias[index] = old_linear.bias[old_index[name]]
+
+    head.linear = new_linear
+    model.model.names = dict(enumerate(class_names))
+    model.model.yaml["nc"] = len(class_names)
+
+
+def class_accuracy(model: ultralytics.YOLO, samples: list[tuple[str, str]], batch_size: int = 32) -> float:
+    """Top-1 accuracy of `model` over (image_path, class_name) pairs."""
+    correct = 0
+    total = 0
+    for start in range(0, len(samples), batch_size):
+        batch = [(cv2.imread(path), name) for path, name in samples[start:start + batch_size]]
+        batch = [(image, name) for image, name in batch if image is not None]
+        if not batch:
+            continue
+
+        results = model([image for image, _ in batch], device="cpu", verbose=False)
+        for result, (_, name) in zip(results, batch):
+            correct += int(result.names[result.probs.top1] == name)
+            total += 1
+
+    return correct / total if total else 1.0
+
+
+def finetune_new_classes(
+    model_path: str,
+    data_dir: str,
+    augmentor: Callable,
+    n_aug: int,
+    epochs: int,
+    replay_per_class: int,
+    max_accuracy_drop: float,
+    holdout_fraction: float = 0.2,
+    batch_size: int = 16,
+    workers: int = 0,
+    max_hamming_distance: int = -1,
+) -> bool:
+    """
+    Warm-start the classifier for medicines it has not seen yet.
+
+    Only the Classify head is trained, on every crop of the new classes plus a
+    replay subset of the existing ones. The result is saved to `model_path` only if
+    top-1 accuracy on the existing classes does not drop by more than
+    `max_accuracy_drop`, measured on `holdout_fraction` of their crops that the
+    fine-tune never sees. Returns False whenever a full retrain is needed instead.
+    """
+    model = ultralytics.YOLO(model_path)
+    known_names = set(model.names.values())
+    class_names, samples = list_class_samples(data_dir)
+
+    new_classes = tuple(name for name in class_names if name not in known_names)
+    if not new_classes:
+        logger.info("No new classes to add incrementally")
+        return False
+    if not known_names.issubset(class_names):
+        logger.info("Classes were removed since the last training, a full retrain is required")
+        return False
+
+    known_indices = {index for index, name in enumerate(class_names) if name in known_names}
+    _, held_out = split_holdout(samples, known_indices, holdout_fraction)
+    old_samples = [(path, class_names[index]) for path, index in held_out]
+    if not old_samples:
+        logger.info("Existing classes have too few crops to hold any out, a full retrain is required")
+        return False
+    baseline = class_accuracy(model, old_samples)
+
+    expand_classifier_head(model, class_names)
+    model.train(
+        data=data_dir,
+        trainer=partial(
+            StreamingClassificationTrainer,
+            augmentor=augmentor,
+            n_aug=n_aug,
+            replay_per_class=replay_per_class,
+            new_classes=new_classes,
+            max_hamming_distance=max_hamming_distance,
+            exclude=frozenset(path for path, _ in held_out),
+        ),
+        epochs=epochs,
+        batch=batch_size,
+        imgsz=128,
+        workers=workers,
+        freeze=len(model.model.model) - 1,  # everything but the Classify head
+        optimizer="AdamW",
+        lr0=0.001,
+        warmup_epochs=0,
+    )
+
+    accuracy = class_accuracy(model, old_samples)
+    logger.info(
+        "Incremental fine-tune for %s: accuracy on existing classes %.4f -> %.4f",
+        new_classes,
+        baseline,
+        accuracy,
+    )
+    if baseline - accuracy > max_accuracy_drop:
+        logger.warning("Incremental fine-tune regressed existing classes, discarding it")
+        return False
+
+    model.save(model_path)
+    return True
@@ -0,0 +1,221 @@
+import logging
+import os
+import random
+from typing import Callable
+
+import cv2
+import numpy as np
+import torch
+from PIL import Image
+from ultralytics.data.augment import classify_transforms
+from ultralytics.models.yolo.classify import ClassificationTrainer
+from ultralytics.utils import DEFAULT_CFG
+
+from app.utils.image_hash import PerceptualHashIndex, dhash
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+
+
+def list_class_samples(root: str) -> tuple[list[str], list[tuple[str, int]]]:
+    """
+    Scan an ImageFolder-style directory (root/<class_name>/<image>) and return the
+    sorted class names together with (path, class_index) pairs.
+    Classes without any image are skipped so they don't end up as dead outputs.
+    """
+    class_names: list[str] = []
+    samples: list[tuple[str, int]] = []
+    for class_name in sorted(os.listdir(root)):
+        class_dir = os.path.join(root, class_name)
+        if not os.path.isdir(class_dir):
+            continue
+
+        files = [
+            os.path.join(class_dir, filename)
+            for filename in sorted(os.listdir(class_dir))
+            if os.path.splitext(filename)[1].lower() in IMAGE_EXTENSIONS
+        ]
+        if not files:
+            continue
+
+        class_index = len(class_names)
+        class_names.append(class_name)
+        samples.extend((file_path, class_index) for file_path in files)
+
+    return class_names, samples
+
+
+def select_replay_samples(
+    samples: list[tuple[str, int]], keep_all: set[int], per_class: int, seed: int = 0
+) -> list[tuple[str, int]]:
+    """
+    Keep every sample of the classes in `keep_all` and at most `per_class`
+    randomly chosen samples of every other class.
+    """
+    by_class: dict[int, list[tuple[str, int]]] = {}
+    for sample in samples:
+        by_class.setdefault(sample[1], []).append(sample)
+
+    rng = random.Random(seed)
+    selected: list[tuple[str, int]] = []
+    for class_index, class_samples in by_class.items():
+        if class_index in keep_all or len(class_samples) <= per_class:
+            selected.extend(class_samples)
+        else:
+            selected.extend(rng.sample(class_samples, per_class))
+    return selected
+
+
+def split_holdout(
+    samples: list[tuple[str, int]], classes: set[int], fraction: float, seed: int = 0
+) -> tuple[list[tuple[str, int]], list[tuple[str, int]]]:
+    """
+    Set aside `fraction` of the samples of every class in `classes` (at least one,
+    as long as one stays behind for training). Returns (rest, held out).
+    """
+    by_class: dict[int, list[tuple[str, int]]] = {}
+    for sample in samples:
+        by_class.setdefault(sample[1], []).append(sample)
+
+    rng = random.Random(seed)
+    held_out: set[tuple[str, int]] = set()
+    for class_index, class_samples in by_class.items():
+        if class_index not in classes or len(class_samples) < 2:
+            continue
+        count = min(len(class_samples) - 1, max(1, round(len(class_samples) * fraction)))
+        held_out.update(rng.sample(class_samples, count))
+    rest = [sample for sample in samples if sample not in held_out]
+    return rest, [sample for sample in samples if sample in held_out]
+
+
+def _load_images(samples: list[tuple[str, int]]) -> list[tuple[np.ndarray, int]]:
+    images = []
+    for file_path, class_index in samples:
+        image = cv2.imread(file_path)
+        if image is None:
+            logger.warning("Skipping unreadable training image %s", file_path)
+            continue
+        images.append((image, class_index))
+    return images
+
+
+def drop_near_duplicates(
+    images: list[tuple[np.ndarray, int]], max_distance: int
+) -> tuple[list[tuple[np.ndarray, int]], int]:
+    """Keep the first of every group of per-class near-duplicate images (dHash)."""
+    indexes: dict[int, PerceptualHashIndex] = {}
+    kept = []
+    for image, class_index in images:
+        index = indexes.setdefault(class_index, PerceptualHashIndex(max_distance))
+        if index.add_if_novel(dhash(image)):
+            kept.append((image, class_index))
+    return kept, len(images) - len(kept)
+
+
+class StreamingAugmentationDataset(torch.utils.data.Dataset):
+    """
+    Serves `n_aug` augmented views of every source crop per epoch.
+    Source crops are decoded once and kept in memory; dataloader workers are forked
+    after construction so they share those pages and only run the augmentation.
+    """
+
+    def __init__(self, samples: list[tuple[str, int]], augmentor: Callable, n_aug: int,
+                 max_hamming_distance: int = -1):
+        self.samples = samples
+        self.images = _load_images(samples)
+        if max_hamming_distance >= 0:
+            self.images, dropped = drop_near_duplicates(self.images, max_hamming_distance)
+            logger.info("Dropped %d near-duplicate training images", dropped)
+        self.augmentor = augmentor
+        self.n_aug = n_aug
+
+    def __len__(self) -> int:
+        return len(self.images) * self.n_aug
+
+    def __getitem__(self, index: int) -> dict:
+        image, class_index = self.images[index % len(self.images)]
+        augmented = self.augmentor(image=image)["image"]
+        rgb = cv2.cvtColor(augmented, cv2.COLOR_BGR2RGB)
+        sample = torch.from_numpy(np.ascontiguousarray(rgb.transpose(2, 0, 1))).float().div_(255.0)
+        return {"img": sample, "cls": class_index}
+
+
+class SourceCropDataset(torch.utils.data.Dataset):
+    """
+    Validation view over the untouched source crops, using the same inference
+    transforms ultralytics attaches to the trained model.
+    """
+
+    def __init__(self, samples: list[tuple[str, int]], imgsz: int):
+        self.samples = samples
+        self.images = _load_images(samples)
+        self.torch_transforms = classify_transforms(size=imgsz)
+
+    def __len__(self) -> int:
+        return len(self.images)
+
+    def __getitem__(self, index: int) -> dict:
+        image, class_index = self.images[index]
+        sample = self.torch_transforms(Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB)))
+        return {"img": sample, "cls": class_index}
+
+
+class StreamingClassificationTrainer(ClassificationTrainer):
+    """
+    ClassificationTrainer that reads the source crops in `data` directly and
+    augments them on the fly, so no augmented copy of the dataset is written to disk.
+
+    With `replay_per_class` set, only the classes named in `new_classes` are trained
+    on all of their crops; every other class contributes a replay subset. Paths in
+    `exclude` (crops held out for a later check) are neither trained nor validated
+    on, so checkpoint selection cannot favour them.
+    """
+
+    def __init__(self, cfg=DEFAULT_CFG, overrides=None, _callbacks=None, augmentor: Callable | None = None,
+                 n_aug: int = 20, replay_per_class: int | None = None, new_classes: tuple[str, ...] = (),
+                 max_hamming_distance: int = -1, exclude: frozenset[str] = frozenset()):
+        if augmentor is None:
+            raise ValueError("StreamingClassificationTrainer requires an augmentor")
+        # get_dataset() runs inside BaseTrainer.__init__, so these must exist first.
+        self.augmentor = augmentor
+        self.n_aug = n_aug
+        self.replay_per_class = replay_per_class
+        self.new_classes = new_classes
+        self.max_hamming_distance = max_hamming_distance
+        self.exclude = exclude
+        self.samples: list[tuple[str, int]] = []
+        self.train_samples: list[tuple[str, int]] = []
+        super().__init__(cfg, overrides, _callbacks)
+
+    def get_dataset(self):
+        root = str(self.args.data)
+        class_names, self.samples = list_class_samples(root)
+        if not self.samples:
+            raise FileNotFoundError(f"No training images found in {root}")
+
+        self.train_samples = [sample for sample in self.samples if sample[0] not in self.exclude]
+        if self.replay_per_class is not None:
+            keep_all = {index for index, name in enumerate(class_names) if name in self.new_classes}
+            self.train_samples = select_replay_samples(self.train_samples, keep_all, self.replay_per_class)
+
+        logger.info(
+            "Streaming %d source crops across %d classes (%d augmentations each)",
+            len(self.train_samples),
+            len(class_names),
+            self.n_aug,
+        )
+        return {
+            "train": root,
+            "val": root,
+            "nc": len(class_names),
+            "names": dict(enumerate(class_names)),
+            "channels": 3,
+        }
+
+    def build_dataset(self, img_path: str, mode: str = "train", batch=None):
+        if mode == "train":
+            return StreamingAugmentationDataset(
+                self.train_samples, self.augmentor, self.n_aug, self.max_hamming_distance
+            )
+        return SourceCropDataset([sample for sample in self.samples if sample[0] not in self.exclude], self.args.imgsz)
@@ -1,10 +1,18 @@
 import os
 import uuid
+from functools import partial
 
 import albumentations as A
 import cv2
 import ultralytics
 
+from app.core import config
+from app.scheduler.incremental import finetune_new_classes
+from app.scheduler.streaming_dataset import StreamingClassificationTrainer
+from app.services.embedding_store import embedding_store, photo_embedding_store
+from app.services.face_gallery import face_gallery
+from app.utils.image_hash import PerceptualHashIndex, dhash
+
 augmentor = A.Compose([
     # Orientation
     A.HorizontalFlip(p=0.5),
@@ -35,11 +43,18 @@ augmentor = A.Compose([
 ])
 
 
-def augment_training_data(input_dir="uploads/training", output_dir="uploads/training_aug", n_aug=10):
+def augment_training_data(input_dir="uploads/training", output_dir="uploads/training_aug", n_aug=10,
+                          max_hamming_distance=None):
     """
     Augment training images and save them into output_dir,
     preserving class folder structure.
+    Near-duplicate source images (dHash within max_hamming_distance bits of an
+    image already kept for the class) are skipped. Returns the number dropped.
     """
+    if max_hamming_distance is None:
+        max_hamming_distance = config.DEDUPE_MAX_HAMMING_DISTANCE
+    total_dropped = 0
+
     # Remove existing augmented data if any
     if os.path.exists(output_dir):
         import shutil
@@ -56,7 +71,9 @@ def augment_training_data(input_dir="uploads/training", output_dir="uploads/trai
         os.makedirs(out_class_dir, exist_ok=True)
 
         print(f"🔄 Augmenting class: {class_name}")
-        for filename in os.listdir(class_dir):
+        hash_index = PerceptualHashIndex(max_hamming_distance)
+        dropped = 0
+        for filename in sorted(os.listdir(class_dir)):
             file_path = os.path.join(class_dir, filename)
 
             # Read image
@@ -64,6 +81,11 @@ def augment_training_data(input_dir="uploads/training", output_dir="uploads/trai
             if image is None:
                 continue
 
+            # Skip near-duplicates, they add augmentation and training time but no information
+            if max_hamming_distance >= 0 and not hash_index.add_if_novel(dhash(image)):
+                dropped += 1
+                continue
+
             # Apply augmentations multiple times
             for _ in range(n_aug):
                 augmented = augmentor(image=image)
@@ -74,24 +96,78 @@ def augment_training_data(input_dir="uploads/training", output_dir="uploads/trai
                 aug_path = os.path.join(out_class_dir, aug_filename)
                 cv2.imwrite(aug_path, aug_image)
 
-        print(f"✅ Finished augmenting {class_name}")
+        total_dropped += dropped
+        print(f"✅ Finished augmenting {class_name} ({dropped} near-duplicates dropped)")
+
+    return total_dropped
 
 
 def retrain_classification_model():
-    model = ultralytics.YOLO("models/classification.pt")
+    n_aug = config.TRAINING_AUGMENTATIONS_PER_IMAGE
+
+    if config.CLASSIFICATION_TRAINING_MODE == "incremental":
+        finetuned = finetune_new_classes(
+            model_path="models/classification.pt",
+            data_dir="uploads/training",
+            augmentor=augmentor,
+            n_aug=n_aug,
+            epochs=config.INCREMENTAL_EPOCHS,
+            replay_per_class=config.INCREMENTAL_REPLAY_PER_CLASS,
+            max_accuracy_drop=config.INCREMENTAL_MAX_ACCURACY_DROP,
+            holdout_fraction=config.INCREMENTAL_HOLDOUT_FRACTION,
+            workers=config.TRAINING_WORKERS,
+            max_hamming_distance=config.DEDUPE_MAX_HAMMING_DISTANCE,
+        )
+        if finetuned:
+            print("✅ Incremental fine-tune accepted")
+            return
+        print("🔄 Falling back to full retraining")
 
-    augment_training_data(input_dir="uploads/training", n_aug=20)
+    model = ultralytics.YOLO("models/classification.pt")
 
-    data_path = 'uploads/training_aug'
     epochs = 75
     batch_size = 16
 
-    model.train(
-        data=data_path,
-        epochs=epochs,
-        batch=batch_size,
-        imgsz=128,
-        patience=10,
-    )
+    if config.STREAMING_AUGMENTATION:
+        # Augment inside the dataloader workers straight from the source crops.
+        model.train(
+            data="uploads/training",
+            trainer=partial(
+                StreamingClassificationTrainer,
+                augmentor=augmentor,
+                n_aug=n_aug,
+                max_hamming_distance=config.DEDUPE_MAX_HAMMING_DISTANCE,
+            ),
+            epochs=epochs,
+            batch=batch_size,
+            imgsz=128,
+            patience=10,
+            workers=config.TRAINING_WORKERS,
+        )
+    else:
+        dropped = augment_training_data(input_dir="uploads/training", n_aug=n_aug)
+        print(f"🧹 Dropped {dropped} near-duplicate training images")
+
+        data_path = 'uploads/training_aug'
+        model.train(
+            data=data_path,
+            epochs=epochs,
+            batch=batch_size,
+            imgsz=128,
+            patience=10,
+        )
 
     model.save('models/classification.pt')
+
+
+def compact_face_embeddings():
+    added, removed = face_gallery.reconcile_sync()
+    if added or removed:
+        print(f"🔄 Face gallery reconciled: {added} embedded, {removed} removed")
+
+    if any(embedding_store.pending_sync()):
+        version = embedding_store.compact_sync()
+        if version is not None:
+            print(f"✅ Face embeddings compacted to snapshot {version} ({len(embedding_store)} rows)")
+    if any(photo_embedding_store.pending_sync()):
+        photo_embedding_store.compact_sync()
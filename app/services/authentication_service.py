@@ -20,7 +20,7 @@ class AuthenticationService:
         if result is None:
             return MessageResponse(ok=False, message="User not found")
 
-        if not await security.verify_password(password, result.password):
+        if not await security.verify_password(password, result.password, user_id=result.id):
             return MessageResponse(ok=False, message="Incorrect password")
 
         access_token = await security.create_access_token(user_id=result.id, expires_delta=None)
@@ -0,0 +1,207 @@
+import hashlib
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import uuid
+
+from fastapi import UploadFile
+
+from app.core import config, tracing
+from app.services import fs
+
+logger = logging.getLogger(__name__)
+
+BLOB_ID_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+
+def is_blob_id(value: str | None) -> bool:
+    return bool(value) and BLOB_ID_PATTERN.match(value) is not None
+
+
+def blob_id_of_view(path: str) -> str | None:
+    """Blob id a view file is named after, or None for files written before the store."""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return stem if is_blob_id(stem) else None
+
+
+class BlobStore:
+    """
+    Content-addressed, reference-counted file store.
+
+    A blob's id is the SHA-256 of its content and it lives at root/ab/cd/<id>, so
+    identical uploads are stored once and no directory grows too large to list.
+    Every put() takes a reference and every release() drops one; the file is
+    removed when the last reference goes. Reference counts are kept in a SQLite
+    index next to the blobs, shared by every worker process: each change is one
+    statement in a BEGIN IMMEDIATE transaction, which also covers the file move or
+    delete that depends on it.
+
+    Folders that other libraries scan (training classes, the DeepFace gallery)
+    are "views": hard links to blobs named <id><ext>. The blocking methods are
+    meant for worker threads; the async wrappers offload them.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+        # Autocommit mode, so transactions are only the explicit BEGIN IMMEDIATE ones.
+        self._db = sqlite3.connect(
+            os.path.join(root, "index.sqlite"), check_same_thread=False, isolation_level=None, timeout=30
+        )
+        self._db.execute("CREATE TABLE IF NOT EXISTS blobs (id TEXT PRIMARY KEY, size INTEGER, refcount INTEGER)")
+
+    def path(self, blob_id: str) -> str:
+        if not is_blob_id(blob_id):
+            raise ValueError(f"Invalid blob id: {blob_id!r}")
+        return os.path.join(self.root, blob_id[:2], blob_id[2:4], blob_id)
+
+    def refcount(self, blob_id: str) -> int:
+        with self._lock:
+            row = self._db.execute("SELECT refcount FROM blobs WHERE id = ?", (blob_id,)).fetchone()
+        return row[0] if row else 0
+
+    @property
+    def staging_dir(self) -> str:
+        """Where uploads are streamed before adopt_sync(); on the same filesystem, so moves are renames."""
+        return os.path.join(self.root, "staging")
+
+    def _transaction(self):
+        """Write transaction on the index, exclusive across processes until it ends."""
+        self._db.execute("BEGIN IMMEDIATE")
+        return self._db
+
+    def adopt_sync(self, tmp_path: str, blob_id: str) -> str:
+        """Take a reference on `blob_id`, moving the fully written `tmp_path` into place or dropping it as a duplicate."""
+        path = self.path(blob_id)
+        with self._lock, self._transaction() as db:
+            (refcount,) = db.execute(
+                "INSERT INTO blobs (id, size, refcount) VALUES (?, ?, 1) "
+                "ON CONFLICT (id) DO UPDATE SET refcount = refcount + 1 RETURNING refcount",
+                (blob_id, os.path.getsize(tmp_path)),
+            ).fetchone()
+            if refcount == 1 or not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+            else:
+                os.remove(tmp_path)
+        return blob_id
+
+    def put_sync(self, content: bytes) -> str:
+        blob_id = hashlib.sha256(content).hexdigest()
+        # Written to a temporary name first so a crash never leaves a truncated blob.
+        os.makedirs(self.staging_dir, exist_ok=True)
+        tmp_path = os.path.join(self.staging_dir, f"{uuid.uuid4().hex}.tmp")
+        with tracing.span("fs.write", path=tmp_path), open(tmp_path, "wb") as f:
+            f.write(content)
+        return self.adopt_sync(tmp_path, blob_id)
+
+    def get_sync(self, blob_id: str) -> bytes | None:
+        try:
+            with open(self.path(blob_id), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def release_sync(self, blob_id: str) -> int:
+        """Drop one reference and return how many are left; the blob is deleted at zero."""
+        with self._lock, self._transaction() as db:
+            row = db.execute(
+                "UPDATE blobs SET refcount = refcount - 1 WHERE id = ? RETURNING refcount", (blob_id,)
+            ).fetchone()
+            if row is None:
+                return 0
+            remaining = row[0]
+            if remaining <= 0:
+                db.execute("DELETE FROM blobs WHERE id = ?", (blob_id,))
+                path = self.path(blob_id)
+                with tracing.span("fs.delete", path=path):
+                    if os.path.exists(path):
+                        os.remove(path)
+        return max(remaining, 0)
+
+    def link_sync(self, blob_id: str, view_path: str) -> bool:
+        """
+        Expose a blob at `view_path`. Returns False if the view already exists (the
+        same content is already in that folder), in which case the caller should
+        release the reference it took for it.
+        """
+        os.makedirs(os.path.dirname(view_path), exist_ok=True)
+        if os.path.exists(view_path):
+            return False
+        try:
+            os.link(self.path(blob_id), view_path)
+        except OSError:
+            # Hard links are not available across filesystems (or on some mounts).
+            shutil.copyfile(self.path(blob_id), view_path)
+        return True
+
+    def remove_view_dir_sync(self, view_dir: str):
+        """Delete a folder of views, releasing the blob behind each of them."""
+        if not os.path.isdir(view_dir):
+            return
+        with tracing.span("fs.delete", path=view_dir):
+            for root, dirs, files in os.walk(view_dir, topdown=False):
+                for file in files:
+                    file_path = os.path.join(root, file)
+                    os.remove(file_path)
+                    blob_id = blob_id_of_view(file_path)
+                    if blob_id:
+                        self.release_sync(blob_id)
+                for directory in dirs:
+                    os.rmdir(os.path.join(root, directory))
+            os.rmdir(view_dir)
+
+    def _link_view_sync(self, blob_id: str, view_dir: str, extension: str) -> str:
+        if not self.link_sync(blob_id, os.path.join(view_dir, f"{blob_id}{extension}")):
+            self.release_sync(blob_id)
+        return blob_id
+
+    def put_view_sync(self, content: bytes, view_dir: str, extension: str = ".jpg") -> str:
+        """Store `content` and link it into `view_dir` as <blob id><extension>."""
+        return self._link_view_sync(self.put_sync(content), view_dir, extension)
+
+    async def put(self, content: bytes) -> str:
+        return await fs.run_io(self.put_sync, content)
+
+    async def get(self, blob_id: str) -> bytes | None:
+        return await fs.run_io(self.get_sync, blob_id)
+
+    async def release(self, blob_id: str) -> int:
+        return await fs.run_io(self.release_sync, blob_id)
+
+    async def put_view(self, content: bytes, view_dir: str, extension: str = ".jpg") -> str:
+        return await fs.run_io(self.put_view_sync, content, view_dir, extension)
+
+    async def stage_upload(self, upload: UploadFile) -> tuple[str, str]:
+        """
+        Stream an upload into the staging area without reading it into memory.
+        Returns (staged path, blob id); finish with put_staged_view() or discard_staged().
+        """
+        return await fs.save_upload(upload, self.staging_dir)
+
+    async def adopt(self, staged_path: str, blob_id: str) -> str:
+        return await fs.run_io(self.adopt_sync, staged_path, blob_id)
+
+    async def put_staged_view(self, staged_path: str, blob_id: str, view_dir: str, extension: str = ".jpg") -> str:
+        await fs.run_io(self.adopt_sync, staged_path, blob_id)
+        return await fs.run_io(self._link_view_sync, blob_id, view_dir, extension)
+
+    @staticmethod
+    def _discard_staged_sync(staged_path: str):
+        try:
+            os.remove(staged_path)
+        except FileNotFoundError:
+            pass
+
+    async def discard_staged(self, staged_path: str):
+        await fs.run_io(self._discard_staged_sync, staged_path)
+
+    async def remove_view_dir(self, view_dir: str):
+        await fs.run_io(self.remove_view_dir_sync, view_dir)
+
+
+blob_store = BlobStore(config.BLOB_STORE_DIR)
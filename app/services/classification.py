@@ -1,11 +1,14 @@
 import asyncio
 import os
 import asyncio
+import threading
 
 from datetime import datetime, timedelta
 from ultralytics import YOLO
 import numpy as np
 
+from app.core import tracing
+from app.services.inference_pool import run_inference
 
 
 class ClassificationService:
@@ -15,6 +18,8 @@ class ClassificationService:
         loop = asyncio.get_event_loop()
         loop.create_task(self._periodic_model_check())
         self.model = YOLO("models/classification.pt")
+        # Ultralytics predictors are not thread-safe, so calls on the model are serialised.
+        self._model_lock = threading.Lock()
 
     async def _periodic_model_check(self):
         while True:
@@ -41,6 +46,26 @@ class ClassificationService:
             self.model = YOLO(model_path)
             self._last_model_mtime = current_mtime
 
+    @property
+    def model_version(self) -> float:
+        """Modification time of the weights currently loaded, changes on every reload."""
+        return self._last_model_mtime
+
+    def _predict(self, images):
+        with tracing.span("model.classify", model="classification"), self._model_lock:
+            return self.model(images, device="cpu")
+
+    def _embed(self, images):
+        with tracing.span("model.embed", model="classification", batch_size=len(images)), self._model_lock:
+            return self.model.embed(images, device="cpu", verbose=False)
+
     async def classify(self, cropped_image: np.ndarray):
-        results = self.model(cropped_image, device="cpu")
+        results = await run_inference(self._predict, cropped_image)
         return results
+
+    async def embed(self, images: list[np.ndarray]) -> np.ndarray:
+        """Pooled backbone features (layer before the Classify head) for each image."""
+        embeddings = await run_inference(self._embed, images)
+        return np.concatenate(
+            [embedding.cpu().numpy().reshape(-1, embedding.shape[-1]) for embedding in embeddings]
+        ).astype(np.float32)
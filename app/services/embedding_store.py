@@ -0,0 +1,390 @@
+import base64
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from app.core import config, tracing
+from app.services import fs
+from app.services.face_index import IVFIndex, normalize
+
+try:
+    import fcntl
+except ImportError:  # Windows: only threads within one process are serialised.
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Delta:
+    """Rows appended since the snapshot; offsets are each row's byte offset in the delta file."""
+    keys: list[str] = field(default_factory=list)
+    face_names: list[str] = field(default_factory=list)
+    vectors: list[np.ndarray] = field(default_factory=list)
+    offsets: list[int] = field(default_factory=list)
+    read_bytes: int = 0
+
+
+class EmbeddingStore:
+    """
+    On-disk face embeddings shared by every worker.
+
+    The bulk lives in an immutable snapshot, snapshot-<v>.npy, opened with
+    mmap so workers share its pages and startup does not read it. Rows are
+    normalised and already grouped by IVF list (centroids and list offsets sit
+    next to it), so the index is used straight from the mapped file. The key
+    (face_name/blob id) and face name of each row are in snapshot-<v>.json.
+
+    Enrollments are appended to delta-<v>.jsonl and deletions to
+    tombstones-<v>.jsonl, one JSON line each, so a crash can at worst lose a
+    partial last line. A tombstone only hides rows written before it, so a face
+    name can be enrolled again after being deleted. compact_sync() folds the
+    delta and tombstones into snapshot <v+1> and switches CURRENT to it; readers
+    notice on their next refresh_sync() and reopen.
+
+    Writers in any process are serialised with a file lock. The blocking
+    methods are meant for worker threads; the async wrappers offload them.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._write_mutex = threading.Lock()
+        self._version = -1
+        self._snapshot_keys: list[str] = []
+        self._snapshot_names: list[str] = []
+        self._snapshot_name_array = np.zeros(0, dtype=object)
+        self._snapshot_key_array = np.zeros(0, dtype=object)
+        self._snapshot_index = IVFIndex(config.FACE_INDEX_NPROBE, config.FACE_INDEX_EXACT_BELOW)
+        self._snapshot_dead = np.zeros(0, dtype=bool)
+        self._delta = _Delta()
+        self._delta_dead: list[bool] = []
+        self._tombstones_read = 0
+
+    # Files
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    def _current_version(self) -> int:
+        try:
+            with open(self._path("CURRENT")) as f:
+                return int(f.read().strip())
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    @contextmanager
+    def _write_lock(self):
+        with self._write_mutex, open(self._path("lock"), "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _append_line(path: str, record: dict) -> int:
+        """Append one JSON line; returns the file size before it."""
+        with open(path, "ab") as f:
+            offset = f.tell()
+            f.write(json.dumps(record).encode() + b"\n")
+            f.flush()
+            os.fsync(f.fileno())
+        return offset
+
+    @staticmethod
+    def _read_lines(path: str, start: int, end: int | None = None) -> tuple[list[tuple[int, dict]], int]:
+        """Complete lines from byte `start` (to `end`) as (offset, record); returns them and where reading stopped."""
+        try:
+            with open(path, "rb") as f:
+                f.seek(start)
+                data = f.read() if end is None else f.read(max(0, end - start))
+        except FileNotFoundError:
+            return [], start
+        records = []
+        position = start
+        for line in data.split(b"\n")[:-1]:  # anything after the last newline is still being written
+            if line.strip():
+                records.append((position, json.loads(line)))
+            position += len(line) + 1
+        return records, position
+
+    @staticmethod
+    def _encode(vector: np.ndarray) -> str:
+        return base64.b64encode(normalize(vector).astype(np.float32).tobytes()).decode()
+
+    @staticmethod
+    def _decode(data: str) -> np.ndarray:
+        return np.frombuffer(base64.b64decode(data), dtype=np.float32)
+
+    # Writers
+
+    def append_sync(self, key: str, face_name: str, embedding: np.ndarray):
+        with self._write_lock():
+            version = self._current_version()
+            self._append_line(
+                self._path(f"delta-{version}.jsonl"),
+                {"key": key, "face_name": face_name, "embedding": self._encode(embedding)},
+            )
+
+    def tombstone_sync(self, face_name: str | None = None, key: str | None = None):
+        """Hide every row of a face name (or a single key) written so far."""
+        with self._write_lock():
+            version = self._current_version()
+            delta_path = self._path(f"delta-{version}.jsonl")
+            delta_bytes = os.path.getsize(delta_path) if os.path.exists(delta_path) else 0
+            self._append_line(
+                self._path(f"tombstones-{version}.jsonl"),
+                {"face_name": face_name, "key": key, "delta_bytes": delta_bytes},
+            )
+
+    # Readers
+
+    @staticmethod
+    def _kills(tombstone: dict, key: str, face_name: str) -> bool:
+        return (tombstone.get("face_name") is not None and tombstone["face_name"] == face_name) or \
+            (tombstone.get("key") is not None and tombstone["key"] == key)
+
+    def _apply_tombstone(self, tombstone: dict):
+        # Snapshot rows always predate the tombstones of their version.
+        if tombstone.get("face_name") is not None:
+            self._snapshot_dead |= self._snapshot_name_array == tombstone["face_name"]
+        if tombstone.get("key") is not None:
+            self._snapshot_dead |= self._snapshot_key_array == tombstone["key"]
+        for i, (key, face_name) in enumerate(zip(self._delta.keys, self._delta.face_names)):
+            if self._delta.offsets[i] < tombstone["delta_bytes"] and self._kills(tombstone, key, face_name):
+                self._delta_dead[i] = True
+
+    def _open_snapshot(self, version: int):
+        meta_path = self._path(f"snapshot-{version}.json")
+        keys, names, index = [], [], IVFIndex(config.FACE_INDEX_NPROBE, config.FACE_INDEX_EXACT_BELOW)
+        meta = {}
+        if version and os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+        if meta.get("keys"):
+            keys, names = meta["keys"], meta["face_names"]
+            vectors = np.load(self._path(f"snapshot-{version}.npy"), mmap_mode="r")
+            centroids_path = self._path(f"snapshot-{version}.centroids.npy")
+            centroids = np.load(centroids_path) if os.path.exists(centroids_path) else None
+            index = IVFIndex.from_layout(
+                vectors, centroids, meta.get("offsets"), config.FACE_INDEX_NPROBE, config.FACE_INDEX_EXACT_BELOW
+            )
+        self._snapshot_keys, self._snapshot_names, self._snapshot_index = keys, names, index
+        self._snapshot_key_array = np.asarray(keys, dtype=object)
+        self._snapshot_name_array = np.asarray(names, dtype=object)
+        self._snapshot_dead = np.zeros(len(keys), dtype=bool)
+        self._delta = _Delta()
+        self._delta_dead = []
+        self._tombstones_read = 0
+        self._version = version
+
+    def _catch_up(self, version: int) -> bool:
+        changed = version != self._version
+        if changed:
+            self._open_snapshot(version)
+
+        records, self._delta.read_bytes = self._read_lines(
+            self._path(f"delta-{version}.jsonl"), self._delta.read_bytes
+        )
+        for offset, record in records:
+            self._delta.keys.append(record["key"])
+            self._delta.face_names.append(record["face_name"])
+            self._delta.vectors.append(self._decode(record["embedding"]))
+            self._delta.offsets.append(offset)
+            self._delta_dead.append(False)
+
+        tombstones, self._tombstones_read = self._read_lines(
+            self._path(f"tombstones-{version}.jsonl"), self._tombstones_read
+        )
+        for _, tombstone in tombstones:
+            self._apply_tombstone(tombstone)
+        return changed or bool(records) or bool(tombstones)
+
+    def refresh_sync(self) -> bool:
+        """Pick up a new snapshot, appended rows and tombstones; returns whether anything changed."""
+        with self._lock:
+            changed = False
+            while True:
+                version = self._current_version()
+                try:
+                    changed = self._catch_up(version) or changed
+                except FileNotFoundError:
+                    if self._current_version() == version:
+                        raise
+                    continue  # compacted while reading: its files are gone, read the new version
+                # compact_sync() only removes a version's files after moving CURRENT
+                # past it, so if CURRENT has not moved, nothing read was missing.
+                if self._current_version() == version:
+                    return changed
+
+    def __len__(self) -> int:
+        return int((~self._snapshot_dead).sum()) + self._delta_dead.count(False)
+
+    def keys(self) -> set[str]:
+        """Keys of the rows that are not deleted."""
+        with self._lock:
+            live = {key for key, dead in zip(self._snapshot_keys, self._snapshot_dead) if not dead}
+            live.update(key for key, dead in zip(self._delta.keys, self._delta_dead) if not dead)
+            return live
+
+    def vectors(self, face_name: str) -> list[np.ndarray]:
+        """Normalised embeddings of the live rows of a face name."""
+        with self._lock:
+            snapshot_vectors = self._snapshot_index.layout()[0]
+            rows = np.flatnonzero((self._snapshot_name_array == face_name) & ~self._snapshot_dead)
+            vectors = [np.asarray(snapshot_vectors[i], dtype=np.float32) for i in rows]
+            vectors.extend(
+                vector for vector, name, dead in zip(self._delta.vectors, self._delta.face_names, self._delta_dead)
+                if name == face_name and not dead
+            )
+            return vectors
+
+    def search(self, embedding: np.ndarray, k: int = 5) -> list[tuple[str, float]]:
+        """(face_name, cosine distance) of the k nearest live rows, nearest first."""
+        with self._lock:
+            names, index, valid = self._snapshot_names, self._snapshot_index, ~self._snapshot_dead
+            delta_names = [name for name, dead in zip(self._delta.face_names, self._delta_dead) if not dead]
+            delta_vectors = [vector for vector, dead in zip(self._delta.vectors, self._delta_dead) if not dead]
+
+        matches = []
+        ids, distances = index.search(embedding, k, valid)
+        matches.extend((names[i], float(distance)) for i, distance in zip(ids, distances))
+        if delta_vectors:
+            distances = 1.0 - np.stack(delta_vectors) @ normalize(embedding)
+            matches.extend((name, float(distance)) for name, distance in zip(delta_names, distances))
+        return sorted(matches, key=lambda match: match[1])[:k]
+
+    # Compaction
+
+    def _live_rows(self, version: int, delta_end: int, tombstones_end: int):
+        """Rows of snapshot <version> plus its delta up to delta_end, minus tombstones up to tombstones_end."""
+        meta_path = self._path(f"snapshot-{version}.json")
+        keys, names, vectors = [], [], []
+        if version and os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+        if version and os.path.exists(meta_path) and meta["keys"]:
+            snapshot = np.load(self._path(f"snapshot-{version}.npy"), mmap_mode="r")
+            keys, names = list(meta["keys"]), list(meta["face_names"])
+            vectors = [snapshot[i] for i in range(len(keys))]
+        snapshot_rows = len(keys)
+
+        records, _ = self._read_lines(self._path(f"delta-{version}.jsonl"), 0, delta_end)
+        offsets = [-1] * snapshot_rows
+        for offset, record in records:
+            keys.append(record["key"])
+            names.append(record["face_name"])
+            vectors.append(self._decode(record["embedding"]))
+            offsets.append(offset)
+
+        tombstones, _ = self._read_lines(self._path(f"tombstones-{version}.jsonl"), 0, tombstones_end)
+        live = [
+            i for i in range(len(keys))
+            if not any(
+                offsets[i] < tombstone["delta_bytes"] and self._kills(tombstone, keys[i], names[i])
+                for _, tombstone in tombstones
+            )
+        ]
+        return [keys[i] for i in live], [names[i] for i in live], [vectors[i] for i in live]
+
+    def pending_sync(self) -> tuple[int, int]:
+        """(delta bytes, tombstone bytes) waiting to be compacted."""
+        version = self._current_version()
+        sizes = []
+        for name in (f"delta-{version}.jsonl", f"tombstones-{version}.jsonl"):
+            path = self._path(name)
+            sizes.append(os.path.getsize(path) if os.path.exists(path) else 0)
+        return sizes[0], sizes[1]
+
+    def compact_sync(self) -> int | None:
+        """
+        Fold the delta and tombstones into a new snapshot; returns its version,
+        or None if another process is already compacting.
+        """
+        with open(self._path("compact.lock"), "a") as lock_file:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return None
+            try:
+                return self._compact()
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _compact(self) -> int:
+        # The snapshot is built without holding the write lock, so enrollments are
+        # not blocked by it; anything appended meanwhile is carried over.
+        with self._write_lock():
+            version = self._current_version()
+            delta_end, tombstones_end = self.pending_sync()
+
+        keys, names, vectors = self._live_rows(version, delta_end, tombstones_end)
+        new_version = version + 1
+        dtype = np.float16 if config.EMBEDDING_STORE_DTYPE == "float16" else np.float32
+
+        with tracing.span("fs.write", path=self.root):
+            index = IVFIndex(config.FACE_INDEX_NPROBE, config.FACE_INDEX_EXACT_BELOW)
+            if vectors:
+                index.build(np.stack(vectors))
+            ordered, ids, centroids, offsets = index.layout()
+            tmp = self._path(f".snapshot-{new_version}.npy.tmp")
+            with open(tmp, "wb") as f:
+                np.save(f, np.asarray(ordered, dtype=dtype) if len(ids) else np.zeros((0, 0), dtype=dtype))
+            os.replace(tmp, self._path(f"snapshot-{new_version}.npy"))
+            if centroids is not None:
+                np.save(self._path(f"snapshot-{new_version}.centroids.npy"), centroids)
+            meta = {
+                "keys": [keys[i] for i in ids],
+                "face_names": [names[i] for i in ids],
+                "offsets": offsets.tolist() if centroids is not None else None,
+                "dtype": np.dtype(dtype).name,
+            }
+            tmp = self._path(f".snapshot-{new_version}.json.tmp")
+            with open(tmp, "w") as f:
+                json.dump(meta, f)
+            os.replace(tmp, self._path(f"snapshot-{new_version}.json"))
+
+        with self._write_lock():
+            # Carry over what was appended while the snapshot was being built.
+            for name, end in (("delta", delta_end), ("tombstones", tombstones_end)):
+                tail, _ = self._read_lines(self._path(f"{name}-{version}.jsonl"), end)
+                for _, record in tail:
+                    if name == "tombstones":
+                        record["delta_bytes"] = max(0, record["delta_bytes"] - delta_end)
+                    self._append_line(self._path(f"{name}-{new_version}.jsonl"), record)
+            tmp = self._path(".CURRENT.tmp")
+            with open(tmp, "w") as f:
+                f.write(str(new_version))
+            os.replace(tmp, self._path("CURRENT"))
+
+        # Readers still mapping the old snapshot keep their pages until they reopen.
+        for name in os.listdir(self.root):
+            if name.split(".")[0].rsplit("-", 1)[-1] == str(version) and not name.startswith("."):
+                os.remove(self._path(name))
+        logger.info("Compacted face embeddings to snapshot %d (%d rows)", new_version, len(keys))
+        return new_version
+
+    async def refresh(self) -> bool:
+        return await fs.run_io(self.refresh_sync)
+
+    async def append(self, key: str, face_name: str, embedding: np.ndarray):
+        await fs.run_io(self.append_sync, key, face_name, embedding)
+
+    async def tombstone(self, face_name: str | None = None, key: str | None = None):
+        await fs.run_io(self.tombstone_sync, face_name, key)
+
+
+embedding_store = EmbeddingStore(config.EMBEDDING_STORE_DIR)
+# Per-selfie embeddings behind the FACE_ENROLL_CENTROID rows; never searched.
+photo_embedding_store = EmbeddingStore(os.path.join(config.EMBEDDING_STORE_DIR, "photos"))
@@ -0,0 +1,271 @@
+import functools
+import logging
+import os
+from pathlib import Path
+
+import cv2
+import numpy as np
+from deepface import DeepFace
+from deepface.models.spoofing.FasNet import Fasnet
+from deepface.modules import verification
+
+from app.core import config, tracing
+from app.services.embedding_store import EmbeddingStore, embedding_store, photo_embedding_store
+from app.services.face_index import normalize
+from app.services.face_quality import FaceQualityService
+from app.services.inference_pool import run_inference
+
+logger = logging.getLogger(__name__)
+
+GALLERY_DIR = "./db"
+MODEL_NAME = "Facenet512"
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+# DeepFace.find's cut-off for this model; no match further away than this is
+# accepted, whatever FACE_RECOGNITION_CONF says.
+MAX_DISTANCE = verification.find_threshold(MODEL_NAME, "cosine")
+# Key of the single averaged row kept per user when FACE_ENROLL_CENTROID is on.
+CENTROID = "centroid"
+
+UNREADABLE = "unreadable"
+NO_FACE = "no_face"
+MULTIPLE_FACES = "multiple_faces"
+SPOOF = "spoof"
+
+
+class EnrollmentRejectedError(ValueError):
+    """None of the selfies of an enrollment were usable; `rejected` holds the reasons."""
+
+    def __init__(self, rejected: list[dict]):
+        super().__init__("No usable selfie: " + ", ".join(f"{r['filename']} ({r['reason']})" for r in rejected))
+        self.rejected = rejected
+
+
+def embed(image, anti_spoofing: bool = False) -> np.ndarray | None:
+    """
+    Facenet512 embedding of the most confident face in an image (path or BGR
+    array), detected the way the gallery always has been (ssd, aligned). None if
+    no face was found; raises ValueError if anti-spoofing rejects it.
+    """
+    with tracing.span("model.represent", model=MODEL_NAME):
+        faces = DeepFace.represent(
+            img_path=image,
+            model_name=MODEL_NAME,
+            detector_backend="ssd",
+            enforce_detection=False,
+            align=True,
+            anti_spoofing=anti_spoofing,
+        )
+    if not faces:
+        return None
+    best = max(faces, key=lambda face: face.get("face_confidence", 0))
+    return np.asarray(best["embedding"], dtype=np.float32)
+
+
+def embed_aligned(face: np.ndarray) -> np.ndarray:
+    """
+    Facenet512 embedding of a face crop that extract_faces() already detected and
+    aligned (RGB, scaled to 0-1), without running detection again.
+    """
+    bgr = (np.clip(face[:, :, ::-1], 0.0, 1.0) * 255).astype(np.uint8)
+    with tracing.span("model.represent", model=MODEL_NAME):
+        faces = DeepFace.represent(
+            img_path=bgr,
+            model_name=MODEL_NAME,
+            detector_backend="skip",
+            enforce_detection=False,
+            align=False,
+        )
+    return np.asarray(faces[0]["embedding"], dtype=np.float32)
+
+
+@functools.lru_cache(maxsize=1)
+def _spoofing_model() -> Fasnet:
+    return Fasnet()
+
+
+def is_real_face(image: np.ndarray, box: tuple[int, int, int, int]) -> tuple[bool, float]:
+    """
+    (is real, score) of the face at `box` (x, y, w, h) of a BGR image: the same
+    Fasnet check extract_faces(anti_spoofing=True) runs, for a face already found.
+    """
+    with tracing.span("model.anti_spoofing", model="Fasnet"):
+        is_real, score = _spoofing_model().analyze(img=image, facial_area=tuple(box))
+    return bool(is_real), float(score)
+
+
+def gallery_key(face_name: str, image_path: str) -> str:
+    return f"{face_name}/{os.path.basename(image_path)}"
+
+
+def centroid_key(face_name: str) -> str:
+    return f"{face_name}/{CENTROID}"
+
+
+def evaluate_selfie(path: str) -> tuple[np.ndarray | None, str | None]:
+    """
+    Embedding of an enrollment selfie, or why it cannot be used: it must hold
+    exactly one real face that passes the same quality gate as recognition.
+    """
+    image = cv2.imread(path)
+    if image is None:
+        return None, UNREADABLE
+    try:
+        with tracing.span("model.represent", model=MODEL_NAME):
+            faces = DeepFace.represent(
+                img_path=image,
+                model_name=MODEL_NAME,
+                detector_backend="ssd",
+                enforce_detection=True,
+                align=True,
+                anti_spoofing=True,
+            )
+    except ValueError as e:
+        return None, SPOOF if "spoof" in str(e).lower() else NO_FACE
+    if len(faces) != 1:
+        return None, MULTIPLE_FACES if faces else NO_FACE
+
+    area = faces[0]["facial_area"]
+    x, y, w, h = area["x"], area["y"], area["w"], area["h"]
+    if config.FACE_QUALITY_GATE:
+        reason = FaceQualityService.check(
+            [(x, y, w, h)], [(area.get("left_eye"), area.get("right_eye"))], [image[y:y + h, x:x + w]]
+        )[0]
+        if reason is not None:
+            return None, reason
+    return np.asarray(faces[0]["embedding"], dtype=np.float32), None
+
+
+def scanned_key(path: str) -> str | None:
+    """Key _scan() files an image under, or None if the scan skips it."""
+    if not path.lower().endswith(IMAGE_EXTENSIONS):
+        return None
+    return gallery_key(Path(path).parent.name, path)
+
+
+def _scan(root: str) -> dict[str, tuple[str, str]]:
+    """{key: (face_name, path)} of every image under ./db/<face_name>/."""
+    images = {}
+    if not os.path.isdir(root):
+        return images
+    for directory, _, files in os.walk(root):
+        for file in files:
+            path = os.path.join(directory, file)
+            key = scanned_key(path)
+            if key is not None:
+                images[key] = (Path(path).parent.name, path)
+    return images
+
+
+class FaceGallery:
+    """
+    The enrolled faces: selfies under ./db/<face_name>/ and their embeddings in
+    the EmbeddingStore. Embeddings are computed at enrollment (see
+    evaluate_selfie) so recognition never embeds gallery images, and are hidden
+    on delete; reconcile_sync() catches up with images the store does not know about (for
+    example galleries from before the store) and with removed ones. With
+    FACE_ENROLL_CENTROID the searched store holds one centroid per user and the
+    per-selfie embeddings it is averaged from are kept in `photos`.
+    """
+
+    def __init__(self, root: str, store: EmbeddingStore, photos: EmbeddingStore):
+        self.root = root
+        self.store = store
+        self.photos = photos
+
+    def __len__(self) -> int:
+        return len(self.store)
+
+    async def refresh(self) -> bool:
+        """Pick up enrollments and deletions made by any worker."""
+        return await self.store.refresh()
+
+    def search(self, embedding: np.ndarray, k: int = 5) -> list[tuple[str, float]]:
+        """(face_name, cosine distance) of the k nearest gallery images, nearest first."""
+        return self.store.search(embedding, k)
+
+    def _embed_missing_sync(self, face_name: str, known: set[str]) -> list[tuple[str, np.ndarray]]:
+        """(key, embedding) of the user's images not in `known`, e.g. enrolled before `photos` existed."""
+        embeddings = []
+        for key, (_, path) in _scan(os.path.join(self.root, face_name)).items():
+            if key in known:
+                continue
+            embedding = embed(path)
+            if embedding is not None:
+                embeddings.append((key, embedding))
+        return embeddings
+
+    async def add(self, face_name: str, images: list[tuple[str, np.ndarray]]):
+        """
+        Add the precomputed embeddings of gallery images, given as (path,
+        embedding). With FACE_ENROLL_CENTROID the user is instead represented by
+        one row, the mean over all of their photos, replaced on every add.
+        """
+        for path, _ in images:
+            # A row under any other key is re-embedded and tombstoned by the next reconcile_sync().
+            if scanned_key(path) != gallery_key(face_name, path):
+                raise ValueError(f"{path} is not an image in the gallery folder of {face_name}")
+        images = list({gallery_key(face_name, path): (path, embedding) for path, embedding in images}.values())
+        if not images:
+            return
+        if not config.FACE_ENROLL_CENTROID:
+            for path, embedding in images:
+                await self.store.append(gallery_key(face_name, path), face_name, embedding)
+            return
+
+        # The centroid covers every photo of the user: the earlier ones come from
+        # `photos`, and only images it has never seen are embedded.
+        await self.photos.refresh()
+        known = self.photos.keys()
+        new = {gallery_key(face_name, path): embedding for path, embedding in images}
+        missing = await run_inference(self._embed_missing_sync, face_name, known | new.keys())
+        for key, embedding in [*new.items(), *missing]:
+            if key not in known:
+                await self.photos.append(key, face_name, embedding)
+        await self.photos.refresh()
+
+        vectors = normalize(np.stack(self.photos.vectors(face_name)))
+        await self.store.tombstone(key=centroid_key(face_name))
+        await self.store.append(centroid_key(face_name), face_name, normalize(vectors.mean(axis=0)))
+
+    async def remove(self, face_name: str):
+        await self.store.tombstone(face_name=face_name)
+        await self.photos.tombstone(face_name=face_name)
+
+    def reconcile_sync(self) -> tuple[int, int]:
+        """Embed images missing from the store and hide rows whose image is gone; returns (added, removed)."""
+        self.store.refresh_sync()
+        images = _scan(self.root)
+        known = self.store.keys()
+        centroids = {key for key in known if key.endswith(f"/{CENTROID}")}
+        with_centroid = {key.split("/", 1)[0] for key in centroids}
+        with_images = {face_name for face_name, _ in images.values()}
+
+        added = 0
+        for key in sorted(images.keys() - known):
+            if images[key][0] in with_centroid:
+                continue  # already represented by the centroid
+            face_name, path = images[key]
+            try:
+                embedding = embed(path)
+            except Exception as e:
+                logger.warning("Could not embed gallery image %s: %s", path, e)
+                continue
+            if embedding is None:
+                logger.warning("No face found in gallery image %s", path)
+                continue
+            self.store.append_sync(key, face_name, embedding)
+            added += 1
+
+        removed = (known - centroids - images.keys()) | {
+            key for key in centroids if key.split("/", 1)[0] not in with_images
+        }
+        for key in removed:
+            self.store.tombstone_sync(key=key)
+
+        self.photos.refresh_sync()
+        for key in self.photos.keys() - images.keys():
+            self.photos.tombstone_sync(key=key)
+        return added, len(removed)
+
+
+face_gallery = FaceGallery(GALLERY_DIR, embedding_store, photo_embedding_store)
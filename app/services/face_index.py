@@ -0,0 +1,138 @@
+import numpy as np
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalise rows (or a single vector) so a dot product is the cosine similarity."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _top_k(similarities: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k largest similarities, best first."""
+    k = min(k, len(similarities))
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    top = np.argpartition(-similarities, k - 1)[:k]
+    return top[np.argsort(-similarities[top])]
+
+
+def kmeans(vectors: np.ndarray, k: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """Spherical k-means on normalised vectors (k-means++ seeding); returns (k, dim) unit centroids."""
+    rng = np.random.default_rng(seed)
+    centroids = np.empty((k, vectors.shape[1]), dtype=np.float32)
+    centroids[0] = vectors[rng.integers(len(vectors))]
+    closest = 1 - vectors @ centroids[0]
+    for i in range(1, k):
+        weights = np.maximum(closest, 0) ** 2
+        total = weights.sum()
+        pick = rng.choice(len(vectors), p=weights / total) if total > 0 else rng.integers(len(vectors))
+        centroids[i] = vectors[pick]
+        closest = np.minimum(closest, 1 - vectors @ centroids[i])
+
+    for _ in range(iterations):
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        counts = np.bincount(assignment, minlength=k)
+        # Empty lists keep their old centroid.
+        centroids = np.where(counts[:, None] > 0, normalize(sums), centroids)
+    return centroids
+
+
+class IVFIndex:
+    """
+    Inverted-file index over normalised embeddings, searched by cosine distance.
+
+    The vectors are clustered into `nlist` lists with k-means; a query only
+    scans the `nprobe` lists whose centroids are closest to it, so search cost
+    grows with n / nlist * nprobe instead of n. Below `exact_below` vectors the
+    lists are skipped and every vector is compared, which is both exact and
+    faster at that size. Vectors are stored grouped by list so each probe is a
+    contiguous slice.
+    """
+
+    def __init__(self, nprobe: int = 8, exact_below: int = 2000, nlist: int | None = None):
+        self.nprobe = nprobe
+        self.exact_below = exact_below
+        self.nlist = nlist
+        self._vectors = np.zeros((0, 0), dtype=np.float32)
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._centroids: np.ndarray | None = None
+        self._offsets = np.zeros(1, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    @property
+    def is_exact(self) -> bool:
+        return self._centroids is None
+
+    @classmethod
+    def from_layout(cls, vectors: np.ndarray, centroids: np.ndarray | None, offsets: np.ndarray | None,
+                    nprobe: int = 8, exact_below: int = 2000) -> "IVFIndex":
+        """
+        Wrap vectors already normalised and grouped by list (see layout()) without
+        copying them, e.g. a read-only memmap shared between processes.
+        """
+        index = cls(nprobe, exact_below)
+        index._vectors = vectors
+        index._ids = np.arange(len(vectors))
+        index._centroids = centroids
+        index._offsets = np.asarray(offsets if offsets is not None else [0, len(vectors)], dtype=np.int64)
+        return index
+
+    def layout(self) -> tuple[np.ndarray, np.ndarray, np.ndarray | None, np.ndarray]:
+        """(vectors in list order, their ids, centroids or None if exact, list offsets)."""
+        return self._vectors, self._ids, self._centroids, self._offsets
+
+    def build(self, vectors: np.ndarray, ids: np.ndarray | None = None) -> "IVFIndex":
+        vectors = normalize(vectors)
+        ids = np.arange(len(vectors)) if ids is None else np.asarray(ids, dtype=np.int64)
+        if len(vectors) < max(self.exact_below, 1):
+            self._vectors, self._ids, self._centroids = vectors, ids, None
+            return self
+
+        nlist = self.nlist or int(np.sqrt(len(vectors)))
+        # k-means on a sample is plenty to place the centroids.
+        rng = np.random.default_rng(0)
+        sample = vectors[rng.choice(len(vectors), min(len(vectors), nlist * 64), replace=False)]
+        centroids = kmeans(sample, nlist)
+
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        order = np.argsort(assignment, kind="stable")
+        self._vectors = np.ascontiguousarray(vectors[order])
+        self._ids = ids[order]
+        self._centroids = centroids
+        self._offsets = np.concatenate(([0], np.cumsum(np.bincount(assignment, minlength=nlist))))
+        return self
+
+    def search(self, query: np.ndarray, k: int = 5, valid: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        (ids, cosine distances) of the k nearest vectors, nearest first. `valid`,
+        indexed by id, excludes vectors that are False (e.g. deleted ones).
+        """
+        if not len(self._ids):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        query = normalize(query)
+
+        if self._centroids is None:
+            candidates = np.arange(len(self._ids))
+            similarities = np.asarray(self._vectors, dtype=np.float32) @ query
+        else:
+            lists = _top_k(self._centroids @ query, self.nprobe)
+            candidates = np.concatenate([np.arange(self._offsets[i], self._offsets[i + 1]) for i in lists])
+            similarities = np.asarray(self._vectors[candidates], dtype=np.float32) @ query
+
+        if valid is not None:
+            keep = valid[self._ids[candidates]]
+            candidates, similarities = candidates[keep], similarities[keep]
+        top = _top_k(similarities, k)
+        return self._ids[candidates[top]], 1.0 - similarities[top]
+
+
+def exact_search(vectors: np.ndarray, query: np.ndarray, k: int = 5) -> tuple[np.ndarray, np.ndarray]:
+    """Brute-force reference for IVFIndex.search over already normalised vectors."""
+    similarities = vectors @ normalize(query)
+    top = _top_k(similarities, k)
+    return top, 1.0 - similarities[top]
@@ -0,0 +1,87 @@
+import cv2
+import numpy as np
+
+from app.core import config, metrics
+
+TOO_SMALL = "too_small"
+BLURRY = "blurry"
+EYES_TOO_CLOSE = "eyes_too_close"
+ROLL = "roll"
+YAW = "yaw"
+
+
+def sharpness(face_img: np.ndarray) -> float:
+    """
+    Variance of the Laplacian of a face crop resized to FACE_QUALITY_BLUR_SIZE; low
+    means blurry. The crop is either BGR uint8, as cut from an OpenCV image, or a
+    face from DeepFace.extract_faces (RGB floats in [0, 1]).
+    """
+    if face_img.size == 0:
+        return 0.0
+    if face_img.dtype != np.uint8:
+        face_img = (np.clip(face_img, 0, 1) * 255).astype(np.uint8)
+        if face_img.ndim == 3:
+            face_img = face_img[:, :, ::-1]
+    gray = cv2.cvtColor(face_img, cv2.COLOR_BGR2GRAY) if face_img.ndim == 3 else face_img
+    size = config.FACE_QUALITY_BLUR_SIZE
+    gray = cv2.resize(gray, (size, size), interpolation=cv2.INTER_AREA)
+    return float(cv2.Laplacian(gray, cv2.CV_64F).var())
+
+
+class FaceQualityService:
+    """
+    Cheap checks on detected faces so blurry, tiny or turned-away faces are
+    dropped before the Facenet512 embedding and gallery search. Geometry comes
+    from the detector's box and eye landmarks, in original image coordinates.
+    """
+
+    @staticmethod
+    def check(
+            boxes: list[tuple[int, int, int, int]],
+            eyes: list[tuple[tuple[int, int] | None, tuple[int, int] | None]],
+            face_images: list[np.ndarray],
+    ) -> list[str | None]:
+        """
+        Returns, per face, the reason it was rejected or None if it passed. Size
+        and pose are checked for all faces at once; the blur check only runs on
+        faces that passed them.
+        """
+        if not boxes:
+            return []
+        reasons: list[str | None] = [None] * len(boxes)
+
+        box = np.asarray(boxes, dtype=np.float64)
+        widths = box[:, 2]
+        for i in np.flatnonzero(widths < config.FACE_QUALITY_MIN_SIZE):
+            reasons[i] = TOO_SMALL
+
+        # Pose only for faces where the detector found both eyes.
+        with_eyes = [i for i, (left, right) in enumerate(eyes) if left is not None and right is not None]
+        if with_eyes:
+            left = np.asarray([eyes[i][0] for i in with_eyes], dtype=np.float64)
+            right = np.asarray([eyes[i][1] for i in with_eyes], dtype=np.float64)
+            delta = right - left
+            distance = np.hypot(delta[:, 0], delta[:, 1])
+            # Angle of the eye line from horizontal, whichever way round the eyes are labelled.
+            roll = np.degrees(np.arctan2(np.abs(delta[:, 1]), np.abs(delta[:, 0])))
+            centre_x = box[with_eyes, 0] + widths[with_eyes] / 2
+            yaw = np.abs((left[:, 0] + right[:, 0]) / 2 - centre_x) / np.maximum(widths[with_eyes], 1)
+
+            for j, i in enumerate(with_eyes):
+                if reasons[i] is not None:
+                    continue
+                if distance[j] < config.FACE_QUALITY_MIN_EYE_DISTANCE:
+                    reasons[i] = EYES_TOO_CLOSE
+                elif roll[j] > config.FACE_QUALITY_MAX_ROLL_DEGREES:
+                    reasons[i] = ROLL
+                elif yaw[j] > config.FACE_QUALITY_MAX_YAW:
+                    reasons[i] = YAW
+
+        for i, face_img in enumerate(face_images):
+            if reasons[i] is None and sharpness(face_img) < config.FACE_QUALITY_MIN_SHARPNESS:
+                reasons[i] = BLURRY
+
+        for reason in reasons:
+            if reason is not None:
+                metrics.FACE_QUALITY_REJECTIONS.labels(reason).inc()
+        return reasons
@@ -0,0 +1,87 @@
+from dataclasses import dataclass
+from typing import Any
+
+import numpy as np
+
+
+@dataclass
+class Track:
+    track_id: int
+    box: tuple[int, int, int, int]  # x, y, w, h
+    missed: int = 0
+    # Latest recognition for this face, if any, and how sure it was (0-1).
+    result: Any = None
+    confidence: float = 0.0
+    attempts: int = 0
+    frames_since_attempt: int = 0
+
+
+def iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Pairwise IoU of (n, 4) and (m, 4) arrays of x, y, w, h boxes."""
+    ax1, ay1 = a[:, 0:1], a[:, 1:2]
+    ax2, ay2 = ax1 + a[:, 2:3], ay1 + a[:, 3:4]
+    bx1, by1 = b[:, 0], b[:, 1]
+    bx2, by2 = bx1 + b[:, 2], by1 + b[:, 3]
+    inter_w = np.clip(np.minimum(ax2, bx2) - np.maximum(ax1, bx1), 0, None)
+    inter_h = np.clip(np.minimum(ay2, by2) - np.maximum(ay1, by1), 0, None)
+    inter = inter_w * inter_h
+    union = a[:, 2:3] * a[:, 3:4] + b[:, 2] * b[:, 3] - inter
+    return inter / np.maximum(union, 1e-9)
+
+
+class IoUTracker:
+    """
+    Follows faces across frames of one stream by box overlap, so a face only
+    needs recognising when it first appears. Detections are matched greedily to
+    the live track they overlap most (at least `iou_threshold`); unmatched
+    detections start new tracks and tracks unmatched for more than `max_missed`
+    frames are dropped.
+    """
+
+    def __init__(self, iou_threshold: float, max_missed: int):
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.tracks: list[Track] = []
+        self._next_id = 1
+
+    def update(self, boxes: list[tuple[int, int, int, int]]) -> list[Track]:
+        """Match this frame's boxes; returns the track of each box, in order."""
+        assigned: list[Track | None] = [None] * len(boxes)
+        matched_tracks = set()
+
+        if boxes and self.tracks:
+            iou = iou_matrix(
+                np.asarray([track.box for track in self.tracks], dtype=np.float64),
+                np.asarray(boxes, dtype=np.float64),
+            )
+            # Best overlaps first; each track and each box is used at most once.
+            for flat in np.argsort(iou, axis=None)[::-1]:
+                t, d = np.unravel_index(flat, iou.shape)
+                if iou[t, d] < self.iou_threshold:
+                    break
+                if t in matched_tracks or assigned[d] is not None:
+                    continue
+                matched_tracks.add(t)
+                assigned[d] = self.tracks[t]
+
+        survivors = []
+        for t, track in enumerate(self.tracks):
+            if t in matched_tracks:
+                track.missed = 0
+                survivors.append(track)
+            elif track.missed < self.max_missed:
+                track.missed += 1
+                survivors.append(track)
+
+        for d, box in enumerate(boxes):
+            track = assigned[d]
+            if track is None:
+                track = Track(track_id=self._next_id, box=box)
+                self._next_id += 1
+                survivors.append(track)
+                assigned[d] = track
+            track.box = box
+            track.frames_since_attempt += 1
+
+        self.tracks = survivors
+        return assigned
@@ -0,0 +1,110 @@
+import cv2
+import numpy as np
+
+from app.core import metrics
+from app.services.inference_pool import run_inference
+
+# libjpeg can decode straight to 1/2, 1/4 or 1/8 scale, skipping most of the IDCT work.
+REDUCED_FLAGS = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2))
+# Start-of-frame markers carry the image size; C4 (DHT), C8 (JPG) and CC (DAC) share the range.
+_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def jpeg_size(content: bytes) -> tuple[int, int] | None:
+    """(width, height) from a JPEG header without decoding it, or None if not a JPEG."""
+    if content[:2] != b"\xff\xd8":
+        return None
+    i = 2
+    while i + 9 <= len(content):
+        if content[i] != 0xFF:
+            return None
+        marker = content[i + 1]
+        if marker == 0xFF:  # fill byte
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:  # markers without a length
+            i += 2
+            continue
+        if marker in _SOF_MARKERS:
+            height = int.from_bytes(content[i + 5:i + 7], "big")
+            width = int.from_bytes(content[i + 7:i + 9], "big")
+            return width, height
+        i += 2 + int.from_bytes(content[i + 2:i + 4], "big")
+    return None
+
+
+def _decode(content: bytes, target_size: int) -> tuple[np.ndarray | None, float, np.ndarray | None]:
+    """Returns (working image, original px per working px, full image if it had to be decoded anyway)."""
+    buffer = np.frombuffer(content, np.uint8)
+
+    size = jpeg_size(content)
+    if size is not None:
+        longest = max(size)
+        for factor, flag in REDUCED_FLAGS:
+            if longest // factor >= target_size:
+                return cv2.imdecode(buffer, flag), float(factor), None
+        return cv2.imdecode(buffer, cv2.IMREAD_COLOR), 1.0, None
+
+    # Other formats have no reduced decode: decode fully, then downscale for the model.
+    full = cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+    if full is None:
+        return None, 1.0, None
+    longest = max(full.shape[:2])
+    if longest <= target_size:
+        return full, 1.0, None
+    scale = longest / target_size
+    height, width = full.shape[:2]
+    reduced = cv2.resize(full, (round(width / scale), round(height / scale)), interpolation=cv2.INTER_AREA)
+    return reduced, scale, full
+
+
+class DecodedFrame:
+    """
+    An uploaded frame decoded at the resolution the detectors need. Coordinates
+    passed in and returned are in the original image; crops that would be too
+    small at the working resolution come from a full-resolution decode, done at
+    most once and only when needed.
+    """
+
+    def __init__(self, content: bytes, image: np.ndarray, scale: float, endpoint: str, full: np.ndarray | None):
+        self.content = content
+        self.image = image
+        self.scale = scale
+        self.endpoint = endpoint
+        self._full = full
+
+    @classmethod
+    async def decode(cls, content: bytes, target_size: int, endpoint: str) -> "DecodedFrame | None":
+        """Decode `content` so its longest side is at least `target_size`; None if it is not an image."""
+        with metrics.stage(endpoint, "decode"):
+            image, scale, full = await run_inference(_decode, content, target_size)
+        if image is None:
+            return None
+        metrics.IMAGE_DECODED_BYTES.labels(endpoint, "reduced" if scale > 1 else "full").observe(
+            image.nbytes + (full.nbytes if full is not None else 0)
+        )
+        return cls(content, image, scale, endpoint, full)
+
+    async def full(self) -> np.ndarray:
+        if self.scale == 1.0:
+            return self.image
+        if self._full is None:
+            with metrics.stage(self.endpoint, "decode_full"):
+                self._full = await run_inference(
+                    cv2.imdecode, np.frombuffer(self.content, np.uint8), cv2.IMREAD_COLOR
+                )
+            metrics.IMAGE_DECODED_BYTES.labels(self.endpoint, "full").observe(self._full.nbytes)
+        return self._full
+
+    def to_original(self, box: tuple[float, ...]) -> tuple[int, ...]:
+        """Scale a box or point from working-resolution to original coordinates."""
+        return tuple(int(round(value * self.scale)) for value in box)
+
+    async def crop(self, x1: int, y1: int, x2: int, y2: int, min_side: int) -> np.ndarray:
+        """Crop an original-coordinate region, at full resolution if it would be under `min_side` px."""
+        if self.scale > 1 and min(x2 - x1, y2 - y1) / self.scale >= min_side:
+            return self.image[
+                int(y1 / self.scale):int(y2 / self.scale), int(x1 / self.scale):int(x2 / self.scale)
+            ]
+        full = await self.full()
+        return full[max(0, y1):y2, max(0, x1):x2]
@@ -0,0 +1,115 @@
+import asyncio
+import contextvars
+import functools
+import hashlib
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import UploadFile
+
+from app.core import config, tracing
+
+_executor = ThreadPoolExecutor(max_workers=config.IO_WORKERS, thread_name_prefix="fs-io")
+
+
+class UploadTooLargeError(ValueError):
+    pass
+
+
+async def run_io(func, /, *args, **kwargs):
+    """Run blocking file I/O on the I/O pool, carrying context variables over like asyncio.to_thread."""
+    loop = asyncio.get_running_loop()
+    call = functools.partial(contextvars.copy_context().run, func, *args, **kwargs)
+    return await loop.run_in_executor(_executor, call)
+
+
+async def exists(path: str) -> bool:
+    return await run_io(os.path.exists, path)
+
+
+async def isfile(path: str) -> bool:
+    return await run_io(os.path.isfile, path)
+
+
+def _read_bytes(path: str) -> bytes | None:
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+async def read_bytes(path: str) -> bytes | None:
+    """File contents, or None if it does not exist."""
+    return await run_io(_read_bytes, path)
+
+
+async def read_upload(upload: UploadFile, max_bytes: int = config.MAX_UPLOAD_BYTES) -> bytes:
+    """
+    Read an upload chunk by chunk, failing as soon as it exceeds `max_bytes`
+    instead of after buffering all of it.
+    """
+    chunks = []
+    size = 0
+    while chunk := await upload.read(config.UPLOAD_CHUNK_BYTES):
+        size += len(chunk)
+        if size > max_bytes:
+            raise UploadTooLargeError(f"{upload.filename} is larger than {max_bytes} bytes")
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+async def save_upload(upload: UploadFile, directory: str, max_bytes: int = config.MAX_UPLOAD_BYTES) -> tuple[str, str]:
+    """
+    Stream an upload to a temporary file in `directory` without holding it in
+    memory. Returns (temporary path, SHA-256 of the content); the caller moves or
+    deletes the file.
+    """
+    await run_io(os.makedirs, directory, exist_ok=True)
+    path = os.path.join(directory, f".upload-{uuid.uuid4().hex}.tmp")
+    digest = hashlib.sha256()
+    size = 0
+
+    f = await run_io(open, path, "wb")
+    try:
+        with tracing.span("fs.write", path=path):
+            while chunk := await upload.read(config.UPLOAD_CHUNK_BYTES):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLargeError(f"{upload.filename} is larger than {max_bytes} bytes")
+                digest.update(chunk)
+                await run_io(f.write, chunk)
+    except BaseException:
+        await run_io(f.close)
+        await run_io(os.remove, path)
+        raise
+    await run_io(f.close)
+    return path, digest.hexdigest()
+
+
+async def save_uploads(
+    uploads: list[UploadFile], directory: str, max_total_bytes: int = config.MAX_REQUEST_UPLOAD_BYTES
+) -> list[tuple[str, str]]:
+    """
+    save_upload() for several uploads, also capping their combined size. Returns
+    (temporary path, SHA-256) per upload; on failure the files saved so far are removed.
+    """
+    saved = []
+    remaining = max_total_bytes
+    try:
+        for upload in uploads:
+            limit = min(config.MAX_UPLOAD_BYTES, remaining)
+            try:
+                path, digest = await save_upload(upload, directory, limit)
+            except UploadTooLargeError:
+                if limit < config.MAX_UPLOAD_BYTES:
+                    raise UploadTooLargeError(f"Uploads are larger than {max_total_bytes} bytes in total")
+                raise
+            saved.append((path, digest))
+            remaining -= await run_io(os.path.getsize, path)
+    except BaseException:
+        for path, _ in saved:
+            await run_io(os.remove, path)
+        raise
+    return saved
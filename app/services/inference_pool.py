@@ -0,0 +1,30 @@
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from app.core import config
+from app.core.metrics import INFERENCE_IN_FLIGHT, INFERENCE_QUEUE_DEPTH
+
+_executor = ThreadPoolExecutor(max_workers=config.INFERENCE_WORKERS, thread_name_prefix="inference")
+
+
+def _instrumented(call):
+    INFERENCE_QUEUE_DEPTH.dec()
+    INFERENCE_IN_FLIGHT.inc()
+    try:
+        return call()
+    finally:
+        INFERENCE_IN_FLIGHT.dec()
+
+
+async def run_inference(func, /, *args, **kwargs):
+    """
+    Run a blocking model/decoding call on the inference pool so it doesn't stall the
+    event loop. Context variables are carried over, like asyncio.to_thread does.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    call = functools.partial(context.run, func, *args, **kwargs)
+    INFERENCE_QUEUE_DEPTH.inc()
+    return await loop.run_in_executor(_executor, _instrumented, call)
@@ -0,0 +1,208 @@
+import asyncio
+import logging
+from datetime import datetime
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, AsyncSession
+
+from app.core import config
+from app.database.models import InventoryEventRecord, TableVersion
+
+logger = logging.getLogger(__name__)
+
+# NOTIFY channel, and the table_versions counter the sequence numbers come from.
+CHANNEL = "inventory_events"
+
+
+class InventoryEvent(BaseModel):
+    seq: int
+    type: str  # stock_changed | transaction_created | medicine_added | medicine_deleted | reset
+    data: dict
+    timestamp: datetime
+
+
+class Subscription:
+    def __init__(self, queue_size: int, after: int = 0):
+        self.queue: asyncio.Queue[InventoryEvent] = asyncio.Queue(maxsize=queue_size)
+        self.overflowed = False
+        # Events up to here were already seen, e.g. through a worker further ahead.
+        self.after = after
+
+    async def next(self, timeout: float) -> InventoryEvent | None:
+        """Next live event, or None if nothing arrived within `timeout` seconds."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+def _to_event(row) -> InventoryEvent:
+    return InventoryEvent(seq=row.seq, type=row.type, data=row.data, timestamp=row.created_at)
+
+
+class InventoryEventBus:
+    """
+    Fan-out of inventory changes to push subscribers (SSE / WebSocket), shared
+    by all workers through Postgres.
+
+    publish() writes the event to the inventory_events table in the caller's
+    transaction and NOTIFYs the channel, so an event exists exactly when the
+    change it describes was committed. Each worker keeps one connection
+    LISTENing (start()) and hands every new row, in sequence order, to its own
+    subscribers; sequence numbers are shared, so a client can resume from the
+    last one it saw on any worker. Each subscriber has a bounded queue; one that
+    cannot keep up is cut off instead of buffering without limit, and catches up
+    from the table when it reconnects. Subscribing happens on the event loop thread.
+    """
+
+    def __init__(self, history: int, queue_size: int, poll_seconds: float):
+        self.history = history
+        self.queue_size = queue_size
+        self.poll_seconds = poll_seconds
+        self._subscribers: set[Subscription] = set()
+        self._seq = 0
+        self._engine: AsyncEngine | None = None
+        self._wake: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+
+    @property
+    def last_seq(self) -> int:
+        """Last sequence number handed to this worker's subscribers."""
+        return self._seq
+
+    async def publish(self, db: AsyncSession, event_type: str, data: dict) -> int:
+        """
+        Record an event in `db`'s transaction and return its sequence number.
+        Call it before the commit: subscribers only see it once that succeeds.
+        """
+        # Pending rows first, so every writer locks its tables before the event counter.
+        await db.flush()
+        seq = (await db.execute(
+            update(TableVersion)
+            .where(TableVersion.name == CHANNEL)
+            .values(version=TableVersion.version + 1)
+            .returning(TableVersion.version)
+        )).scalar_one()
+        await db.execute(
+            InventoryEventRecord.__table__.insert().values(seq=seq, type=event_type, data=jsonable_encoder(data))
+        )
+        await db.execute(delete(InventoryEventRecord).where(InventoryEventRecord.seq <= seq - self.history))
+        await db.execute(select(func.pg_notify(CHANNEL, str(seq))))
+        return seq
+
+    def _dispatch(self, event: InventoryEvent):
+        self._seq = event.seq
+        for subscription in list(self._subscribers):
+            if event.seq <= subscription.after:
+                continue
+            try:
+                subscription.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                logger.warning("Dropping slow inventory event subscriber at seq %d", event.seq)
+                subscription.overflowed = True
+                self._subscribers.discard(subscription)
+
+    async def _deliver_new(self, conn: AsyncConnection):
+        result = await conn.execute(
+            select(InventoryEventRecord.__table__)
+            .where(InventoryEventRecord.seq > self._seq)
+            .order_by(InventoryEventRecord.seq)
+        )
+        rows = result.all()
+        await conn.rollback()  # don't sit idle in a transaction between notifications
+        if rows and rows[0].seq != self._seq + 1:
+            # More than INVENTORY_EVENT_HISTORY events while the listener was down.
+            logger.warning("Inventory events %d-%d were pruned before delivery", self._seq + 1, rows[0].seq - 1)
+            self._dispatch(InventoryEvent(seq=rows[0].seq - 1, type="reset", data={}, timestamp=datetime.now()))
+        for row in rows:
+            self._dispatch(_to_event(row))
+
+    def _on_notify(self, *_):
+        self._wake.set()
+
+    async def _listen(self, engine: AsyncEngine):
+        while True:
+            try:
+                async with engine.connect() as conn:
+                    try:
+                        driver = (await conn.get_raw_connection()).driver_connection
+                        await driver.add_listener(CHANNEL, self._on_notify)
+                        # Catches up with whatever was published while not listening.
+                        self._wake.set()
+                        while True:
+                            try:
+                                await asyncio.wait_for(self._wake.wait(), self.poll_seconds)
+                            except asyncio.TimeoutError:
+                                pass  # a poll also notices a dropped connection
+                            self._wake.clear()
+                            await self._deliver_new(conn)
+                    finally:
+                        # Never hand a LISTENing connection back to the pool.
+                        await conn.invalidate()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Inventory event listener failed, reconnecting")
+                await asyncio.sleep(self.poll_seconds)
+
+    async def start(self, engine: AsyncEngine):
+        """Start following the channel; events published before this are only replayed."""
+        async with engine.connect() as conn:
+            result = await conn.execute(select(TableVersion.version).where(TableVersion.name == CHANNEL))
+            self._seq = result.scalar_one_or_none() or 0
+        self._engine = engine
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._listen(engine))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _replay(self, since: int, until: int) -> list[InventoryEvent]:
+        # Own short-lived connection: the caller goes on streaming for a long time.
+        async with self._engine.connect() as conn:
+            result = await conn.execute(
+                select(InventoryEventRecord.__table__)
+                .where(InventoryEventRecord.seq > since, InventoryEventRecord.seq <= until)
+                .order_by(InventoryEventRecord.seq)
+            )
+            rows = result.all()
+            published = (await conn.execute(
+                select(TableVersion.version).where(TableVersion.name == CHANNEL)
+            )).scalar_one_or_none() or 0
+        if since > published or (since < until and (not rows or rows[0].seq != since + 1)):
+            # Unknown position (a sequence from another database, or the gap was
+            # pruned): the client has to reload its snapshot before applying
+            # further events.
+            return [InventoryEvent(seq=until, type="reset", data={}, timestamp=datetime.now())]
+        return [_to_event(row) for row in rows]
+
+    async def subscribe(self, since: int | None = None) -> tuple[Subscription, list[InventoryEvent]]:
+        """Register a subscriber and return it with the events it missed after `since`."""
+        subscription = Subscription(self.queue_size, since or 0)
+        self._subscribers.add(subscription)
+        # Later events reach the queue, so the replay stops where the queue starts.
+        until = self._seq
+        try:
+            replay = [] if since is None else await self._replay(since, until)
+        except BaseException:
+            self._subscribers.discard(subscription)
+            raise
+        if replay and replay[0].type == "reset":
+            subscription.after = replay[0].seq
+        return subscription, replay
+
+    def unsubscribe(self, subscription: Subscription):
+        self._subscribers.discard(subscription)
+
+
+event_bus = InventoryEventBus(
+    config.INVENTORY_EVENT_HISTORY, config.INVENTORY_EVENT_QUEUE_SIZE, config.INVENTORY_EVENT_POLL_SECONDS
+)
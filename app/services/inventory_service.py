@@ -3,7 +3,8 @@ from datetime import datetime
 from sqlalchemy import func, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database.models import Medicine, Transaction, TransactionDetail
+from app.database.models import Medicine, TableVersion, Transaction, TransactionDetail
+from app.services.inventory_events import event_bus
 from app.types.MedicineInput import MedicineInput
 
 
@@ -15,6 +16,17 @@ class InventoryService:
             raise ValueError("Medicine name cannot be empty")
         return normalized
 
+    @staticmethod
+    def _medicine_event_data(medicine: Medicine) -> dict:
+        # Only columns already loaded; timestamps are server-side and not known yet.
+        return {
+            "id": medicine.id,
+            "name": medicine.name,
+            "description": medicine.description,
+            "stock": medicine.stock,
+            "image_path": medicine.image_path,
+        }
+
     @staticmethod
     async def log_transaction(db: AsyncSession, medicine_id: int, quantity: int, user_id: int, mode: str):
         transaction = Transaction(user_id=user_id, transaction_date=datetime.now(), mode=mode)
@@ -28,6 +40,14 @@ class InventoryService:
         )
 
         db.add(detail)
+        await event_bus.publish(db, "transaction_created", {
+            "id": transaction.id,
+            "mode": transaction.mode,
+            "transaction_date": transaction.transaction_date,
+            "user_id": user_id,
+            "medicine_id": medicine_id,
+            "quantity": quantity,
+        })
         await db.commit()
         await db.refresh(transaction)
         return transaction
@@ -44,6 +64,7 @@ class InventoryService:
             raise ValueError("Medicine not found")
 
         medicine.stock += increment
+        await event_bus.publish(db, "stock_changed", InventoryService._medicine_event_data(medicine))
         await db.commit()
         transaction = await InventoryService.log_transaction(db, medicine.id, increment, user_id, mode='IN')
 
@@ -64,6 +85,7 @@ class InventoryService:
         if medicine.stock < decrement:
             raise ValueError("Insufficient stock")
         medicine.stock -= decrement
+        await event_bus.publish(db, "stock_changed", InventoryService._medicine_event_data(medicine))
         await db.commit()
         transaction = await InventoryService.log_transaction(db, medicine.id, decrement, user_id, mode='OUT')
         return {
@@ -71,6 +93,26 @@ class InventoryService:
             "transaction": transaction
         }
 
+    @staticmethod
+    async def catalog_version(db: AsyncSession) -> tuple[int, datetime | None]:
+        """
+        Write counter and latest updated_at of the catalog. The counter changes on
+        every committed insert, update or delete; updated_at is only for display.
+        """
+        result = await db.execute(
+            select(
+                select(TableVersion.version).where(TableVersion.name == Medicine.__tablename__).scalar_subquery(),
+                func.max(Medicine.updated_at),
+            )
+        )
+        version, last_modified = result.one()
+        return version or 0, last_modified
+
+    @staticmethod
+    async def medicine_version(db: AsyncSession, medicine_id: int) -> datetime | None:
+        result = await db.execute(select(Medicine.updated_at).where(Medicine.id == medicine_id))
+        return result.scalar_one_or_none()
+
     @staticmethod
     async def list_all(db: AsyncSession, limit: int = 100, offset: int = 0):
         result = await db.execute(
@@ -110,6 +152,8 @@ class InventoryService:
         new_medicine = Medicine(name=medicine.name, description=medicine.description, stock=medicine.stock,
                                 image_path=thumbnail_path)
         db.add(new_medicine)
+        await db.flush()
+        await event_bus.publish(db, "medicine_added", InventoryService._medicine_event_data(new_medicine))
         await db.commit()
         await db.refresh(new_medicine)
         return new_medicine
@@ -125,5 +169,6 @@ class InventoryService:
             raise ValueError("Medicine not found")
 
         await db.delete(medicine)
+        await event_bus.publish(db, "medicine_deleted", InventoryService._medicine_event_data(medicine))
         await db.commit()
         return medicine
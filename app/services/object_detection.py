@@ -1,27 +1,54 @@
 import os
+import threading
 
 os.environ["CUDA_VISIBLE_DEVICES"] = "-1"
 
+import numpy as np
 from ultralytics import YOLO
 
+from app.core import tracing
+from app.services.inference_pool import run_inference
+
 model = YOLO("models/detection.pt")
+# Ultralytics predictors are not thread-safe, so calls on the shared model are serialised.
+model_lock = threading.Lock()
 CONFIDENCE_THRESHOLD = 0.7
 
 
+def _predict(images):
+    batch_size = len(images) if isinstance(images, list) else 1
+    with tracing.span("model.detect", model="detection", batch_size=batch_size), model_lock:
+        return model(images, device="cpu", verbose=False)
+
+
 class ObjectDetectionService:
+    @staticmethod
+    def _parse_result(result) -> list[dict]:
+        detected = []
+        for box in result.boxes:
+            confidence = box.conf[0].item()
+            if confidence > CONFIDENCE_THRESHOLD:
+                detected.append({
+                    "label": model.names[int(box.cls[0].item())],
+                    "confidence": confidence,
+                    "bbox": box.xyxy[0].tolist()
+                })
+        return detected
+
     @staticmethod
     async def detect_medicines(image):
-        results = model(image, device="cpu")
+        results = await run_inference(_predict, image)
 
         detected = []
         for result in results:
-            for box in result.boxes:
-                confidence = box.conf[0].item()
-                if confidence > CONFIDENCE_THRESHOLD:
-                    detected.append({
-                        "label": model.names[int(box.cls[0].item())],
-                        "confidence": confidence,
-                        "bbox": box.xyxy[0].tolist()
-                    })
+            detected.extend(ObjectDetectionService._parse_result(result))
 
         return detected
+
+    @staticmethod
+    async def detect_medicines_batch(images: list[np.ndarray]) -> list[list[dict]]:
+        """Detect medicines in several images with a single batched model call."""
+        if not images:
+            return []
+        results = await run_inference(_predict, images)
+        return [ObjectDetectionService._parse_result(result) for result in results]
@@ -0,0 +1,163 @@
+import asyncio
+import logging
+import os
+
+import cv2
+import numpy as np
+
+from app.core import config
+from app.scheduler.streaming_dataset import list_class_samples
+from app.services import fs
+from app.services.classification import ClassificationService
+
+logger = logging.getLogger(__name__)
+
+UNKNOWN_PRODUCT = "unknown"
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _read_class_crops(training_dir: str) -> list[tuple[str, list[np.ndarray]]]:
+    """(medicine name, readable crops) for every class folder under `training_dir`."""
+    if not os.path.isdir(training_dir):
+        return []
+    class_names, samples = list_class_samples(training_dir)
+    classes = []
+    for class_index, name in enumerate(class_names):
+        crops = [cv2.imread(path) for path, index in samples if index == class_index]
+        classes.append((name, [crop for crop in crops if crop is not None]))
+    return classes
+
+
+def _accumulate(names: list[str], sums: np.ndarray, counts: np.ndarray, name: str, embeddings: np.ndarray):
+    """Fold `embeddings` into the running sum of `name`; returns the updated (names, sums, counts)."""
+    embeddings = _normalize(embeddings)
+    if sums.size == 0:
+        sums = np.zeros((0, embeddings.shape[1]), dtype=np.float32)
+
+    if name in names:
+        row = names.index(name)
+        sums[row] += embeddings.sum(axis=0)
+        counts[row] += len(embeddings)
+    else:
+        names = names + [name]
+        sums = np.vstack([sums, embeddings.sum(axis=0, keepdims=True)])
+        counts = np.append(counts, len(embeddings))
+    return names, sums, counts
+
+
+class PrototypeClassificationService:
+    """
+    Open-set medicine classifier.
+
+    Every medicine is represented by the mean of the L2-normalised backbone embeddings
+    of its training crops. A crop is assigned to the most similar prototype (cosine),
+    or to "unknown" when the best similarity is below PROTOTYPE_UNKNOWN_THRESHOLD.
+    Prototypes are kept as running sums so adding samples is a single vector update.
+    Rebuilds read and embed the crops off the event loop and only take the lock to
+    swap the result in.
+    """
+
+    def __init__(self, cls_service: ClassificationService, index_path: str = config.PROTOTYPE_INDEX_PATH):
+        self.cls_service = cls_service
+        self.index_path = index_path
+        self.names: list[str] = []
+        self.sums = np.zeros((0, 0), dtype=np.float32)
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.prototypes = np.zeros((0, 0), dtype=np.float32)
+        self.model_version: float | None = None
+        self._lock = asyncio.Lock()
+        self._rebuild_lock = asyncio.Lock()
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.index_path):
+            return
+        with np.load(self.index_path) as index:
+            self.names = [str(name) for name in index["names"]]
+            self.sums = index["sums"].astype(np.float32)
+            self.counts = index["counts"].astype(np.int64)
+            self.model_version = float(index["model_version"])
+        self.prototypes = _normalize(self.sums)
+        logger.info("Loaded %d medicine prototypes from %s", len(self.names), self.index_path)
+
+    def _save_sync(self, names: list[str], sums: np.ndarray, counts: np.ndarray, model_version: float | None):
+        os.makedirs(os.path.dirname(self.index_path) or ".", exist_ok=True)
+        tmp_path = f"{self.index_path}.tmp.npz"
+        np.savez(
+            tmp_path,
+            names=np.array(names, dtype=str),
+            sums=sums,
+            counts=counts,
+            model_version=np.float64(model_version or 0.0),
+        )
+        os.replace(tmp_path, self.index_path)
+
+    async def _save(self):
+        """Persist the current state; call with the lock held."""
+        await fs.run_io(self._save_sync, list(self.names), self.sums.copy(), self.counts.copy(), self.model_version)
+
+    async def _ensure_current(self):
+        """Embeddings from different weights aren't comparable, so rebuild after a model reload."""
+        if self.model_version != self.cls_service.model_version:
+            await self.rebuild()
+
+    async def rebuild(self, training_dir: str = "uploads/training"):
+        async with self._rebuild_lock:
+            model_version = self.cls_service.model_version
+            if self.model_version == model_version:
+                return
+
+            logger.info("Rebuilding medicine prototypes from %s", training_dir)
+            names: list[str] = []
+            sums = np.zeros((0, 0), dtype=np.float32)
+            counts = np.zeros(0, dtype=np.int64)
+            for name, crops in await fs.run_io(_read_class_crops, training_dir):
+                if crops:
+                    embeddings = await self.cls_service.embed(crops)
+                    names, sums, counts = _accumulate(names, sums, counts, name, embeddings)
+
+            async with self._lock:
+                self.names, self.sums, self.counts = names, sums, counts
+                self.model_version = model_version
+                self.prototypes = _normalize(self.sums) if self.names else self.sums
+                await self._save()
+
+    async def add_samples(self, name: str, crops: list[np.ndarray]):
+        """Fold the embeddings of `crops` into the prototype of `name`."""
+        if not crops:
+            return
+        await self._ensure_current()
+        embeddings = await self.cls_service.embed(crops)
+        async with self._lock:
+            self.names, self.sums, self.counts = _accumulate(self.names, self.sums, self.counts, name, embeddings)
+            self.prototypes = _normalize(self.sums)
+            await self._save()
+        logger.info("Added %d samples to prototype '%s'", len(crops), name)
+
+    async def remove(self, name: str):
+        async with self._lock:
+            if name not in self.names:
+                return
+            row = self.names.index(name)
+            del self.names[row]
+            self.sums = np.delete(self.sums, row, axis=0)
+            self.counts = np.delete(self.counts, row)
+            self.prototypes = np.delete(self.prototypes, row, axis=0)
+            await self._save()
+
+    async def classify(self, cropped_image: np.ndarray) -> dict:
+        await self._ensure_current()
+        if not self.names:
+            return {"product": UNKNOWN_PRODUCT, "confidence": 0.0}
+
+        embedding = _normalize(await self.cls_service.embed([cropped_image]))[0]
+        similarities = self.prototypes @ embedding
+        best = int(np.argmax(similarities))
+        confidence = float(similarities[best])
+        if confidence < config.PROTOTYPE_UNKNOWN_THRESHOLD:
+            return {"product": UNKNOWN_PRODUCT, "confidence": confidence}
+        return {"product": self.names[best], "confidence": confidence}
@@ -0,0 +1,76 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+
+import numpy as np
+
+from app.core import config, metrics
+from app.utils.image_hash import dhash
+
+# 256 bits: a 64-bit hash of a whole kiosk frame is too coarse to tell people apart.
+HASH_SIZE = 16
+
+
+class RecognitionCache:
+    """
+    Short-lived LRU of recognition results keyed by endpoint and frame hash, so a
+    frame that is sent again straight away is answered without running the
+    models. Results that grant access (face tokens) must use content_key(), as a
+    perceptual hash can match a different person in the same spot. Entries expire after the TTL or at their own `expires_at`, whichever
+    comes first; results tied to a user are dropped when that user changes.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[tuple[str, int], tuple[Any, float, frozenset[int]]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.ttl_seconds > 0
+
+    @staticmethod
+    def frame_key(image: np.ndarray) -> int:
+        return dhash(image, HASH_SIZE)
+
+    @staticmethod
+    def content_key(content: bytes) -> int:
+        """Key matching only byte-identical uploads."""
+        return int.from_bytes(hashlib.sha256(content).digest()[:16], "big")
+
+    def get(self, endpoint: str, key: int) -> Any | None:
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get((endpoint, key))
+            if entry is not None and entry[1] <= time.time():
+                del self._entries[(endpoint, key)]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end((endpoint, key))
+        metrics.RECOGNITION_CACHE_LOOKUPS.labels(endpoint, "miss" if entry is None else "hit").inc()
+        return None if entry is None else entry[0]
+
+    def put(self, endpoint: str, key: int, value: Any, expires_at: float | None = None, user_ids=()):
+        if not self.enabled:
+            return
+        stale_at = time.time() + self.ttl_seconds
+        if expires_at is not None:
+            stale_at = min(stale_at, expires_at)
+        with self._lock:
+            self._entries.pop((endpoint, key), None)
+            self._entries[(endpoint, key)] = (value, stale_at, frozenset(user_ids))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_user(self, user_id: int):
+        """Forget results that identify a user whose status, role or existence changed."""
+        with self._lock:
+            for cache_key in [k for k, entry in self._entries.items() if user_id in entry[2]]:
+                del self._entries[cache_key]
+
+
+recognition_cache = RecognitionCache(config.RECOGNITION_CACHE_SIZE, config.RECOGNITION_CACHE_TTL_SECONDS)
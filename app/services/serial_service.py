@@ -4,7 +4,7 @@ import time
 import serial
 import serial.tools.list_ports
 
-from app.core import config
+from app.core import config, tracing
 
 logger = logging.getLogger(__name__)
 
@@ -41,6 +41,11 @@ class SerialService:
 
     @staticmethod
     def send_command(command: str) -> None:
+        with tracing.span("serial.send_command", command=command):
+            SerialService._send_command(command)
+
+    @staticmethod
+    def _send_command(command: str) -> None:
         if not config.ENABLE_SERIAL_UNLOCK:
             logger.info("Serial unlock is disabled.")
             return
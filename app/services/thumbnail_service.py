@@ -0,0 +1,191 @@
+import glob
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import cv2
+
+from app.core import config, tracing
+from app.services import fs
+from app.services.blob_store import blob_store, is_blob_id
+from app.services.inference_pool import run_inference
+
+THUMBNAIL_DIR = os.path.join("uploads", "thumbnails")
+THUMBNAIL_URL_PREFIX = "/medicines/uploads/thumbnails/"
+VARIANT_FORMATS = {
+    "webp": (".webp", [cv2.IMWRITE_WEBP_QUALITY, 80]),
+    "jpg": (".jpg", [cv2.IMWRITE_JPEG_QUALITY, 85]),
+}
+MEDIA_TYPES = {"webp": "image/webp", "jpg": "image/jpeg"}
+# {digest}-{size}.{format}; the digest changes with the content, so variants never change.
+VARIANT_PATTERN = re.compile(r"^(?P<digest>[0-9a-f]{16})-(?P<size>\d+)\.(?P<format>webp|jpg)$")
+DIGEST_PATTERN = re.compile(r"^[0-9a-f]{16}$")
+
+
+class _ByteLRU:
+    """LRU of encoded images bounded by their total size in bytes."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[str, bytes] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: str, value: bytes):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._entries[key] = value
+            self._size += len(value)
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def discard_prefix(self, prefix: str):
+        with self._lock:
+            for key in [key for key in self._entries if key.startswith(prefix)]:
+                self._size -= len(self._entries.pop(key))
+
+
+def variant_filename(digest: str, size: int, image_format: str) -> str:
+    return f"{digest}-{size}.{image_format}"
+
+
+def _variant_digest(image_path: str | None) -> str | None:
+    """Variant prefix of a thumbnail: blob ids, or older {digest}.jpg paths; None if it has no variants."""
+    if not image_path:
+        return None
+    if is_blob_id(image_path):
+        return image_path[:16]
+    digest = os.path.splitext(os.path.basename(image_path))[0]
+    return digest if DIGEST_PATTERN.match(digest) else None
+
+
+def variant_urls(image_path: str | None) -> dict[str, dict[str, str]]:
+    """{size: {format: url}} for a thumbnail, empty for legacy ones without variants."""
+    digest = _variant_digest(image_path)
+    if digest is None:
+        return {}
+    return {
+        str(size): {
+            image_format: THUMBNAIL_URL_PREFIX + variant_filename(digest, size, image_format)
+            for image_format in VARIANT_FORMATS
+        }
+        for size in config.THUMBNAIL_SIZES
+    }
+
+
+def _render_variants(path: str, digest: str) -> dict[str, bytes]:
+    image = cv2.imread(path, cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("Could not decode thumbnail image")
+
+    height, width = image.shape[:2]
+    variants = {}
+    for size in config.THUMBNAIL_SIZES:
+        scale = min(1.0, size / max(height, width))  # never upscale
+        resized = image if scale == 1.0 else cv2.resize(
+            image, (max(1, round(width * scale)), max(1, round(height * scale))), interpolation=cv2.INTER_AREA
+        )
+        for image_format, (extension, params) in VARIANT_FORMATS.items():
+            ok, encoded = cv2.imencode(extension, resized, params)
+            if not ok:
+                raise ValueError(f"Failed to encode {image_format} thumbnail")
+            variants[variant_filename(digest, size, image_format)] = encoded.tobytes()
+    return variants
+
+
+def _write_variants(variants: dict[str, bytes]):
+    os.makedirs(THUMBNAIL_DIR, exist_ok=True)
+    with tracing.span("fs.write", path=THUMBNAIL_DIR):
+        for filename, data in variants.items():
+            path = os.path.join(THUMBNAIL_DIR, filename)
+            if not os.path.exists(path):  # shared with another medicine using the same photo
+                with open(path, "wb") as f:
+                    f.write(data)
+
+
+def _delete_thumbnail(image_path: str) -> bool:
+    """Delete a thumbnail and its variants; False if another medicine still uses them."""
+    paths = []
+    if is_blob_id(image_path):
+        if blob_store.release_sync(image_path) > 0:
+            return False
+    else:
+        paths.append(image_path)
+
+    digest = _variant_digest(image_path)
+    if digest is not None:
+        paths.extend(glob.glob(os.path.join(THUMBNAIL_DIR, f"{digest}-*")))
+    with tracing.span("fs.delete", path=image_path):
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+    return True
+
+
+class ThumbnailService:
+    """
+    Medicine thumbnails. The uploaded original goes to the blob store (medicines
+    keep its blob id as image_path) and is pre-rendered at upload into
+    THUMBNAIL_SIZES, as WebP and JPEG, so dashboards download small tiles that can
+    be cached forever.
+    """
+
+    _cache = _ByteLRU(config.THUMBNAIL_CACHE_BYTES)
+
+    @staticmethod
+    async def render(staged_path: str, blob_id: str) -> dict[str, bytes]:
+        """
+        Render the variants of a thumbnail staged with blob_store.stage_upload();
+        raises ValueError if the upload is not a decodable image.
+        """
+        return await run_inference(_render_variants, staged_path, blob_id[:16])
+
+    @staticmethod
+    async def save(staged_path: str, blob_id: str, variants: dict[str, bytes]) -> str:
+        """Move the staged original into the blob store and write its variants."""
+        await blob_store.adopt(staged_path, blob_id)
+        await fs.run_io(_write_variants, variants)
+        for filename, data in variants.items():
+            ThumbnailService._cache.put(filename, data)
+        return blob_id
+
+    @staticmethod
+    async def delete(image_path: str):
+        deleted = await fs.run_io(_delete_thumbnail, image_path)
+        digest = _variant_digest(image_path)
+        if deleted and digest is not None:
+            ThumbnailService._cache.discard_prefix(f"{digest}-")
+
+    @staticmethod
+    async def get_original(blob_id: str) -> bytes | None:
+        return await blob_store.get(blob_id)
+
+    @staticmethod
+    def is_variant(filename: str) -> bool:
+        return VARIANT_PATTERN.match(filename) is not None
+
+    @staticmethod
+    def media_type(filename: str) -> str:
+        return MEDIA_TYPES[VARIANT_PATTERN.match(filename).group("format")]
+
+    @staticmethod
+    async def get_variant(filename: str) -> bytes | None:
+        data = ThumbnailService._cache.get(filename)
+        if data is None:
+            data = await fs.read_bytes(os.path.join(THUMBNAIL_DIR, filename))
+            if data is not None:
+                ThumbnailService._cache.put(filename, data)
+        return data
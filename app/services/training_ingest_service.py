@@ -0,0 +1,257 @@
+import asyncio
+import contextvars
+import logging
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Awaitable, Callable
+
+import cv2
+import numpy as np
+from pydantic import BaseModel
+
+from app.core import config
+from app.services import fs
+from app.services.blob_store import blob_store
+from app.services.inference_pool import run_inference
+from app.services.object_detection import ObjectDetectionService
+from app.utils.image_hash import PerceptualHashIndex, dhash
+
+logger = logging.getLogger(__name__)
+
+MAX_RETAINED_JOBS = 100
+
+
+class IngestFileStatus(BaseModel):
+    filename: str
+    status: str = "pending"  # pending | saved | duplicate | no_detection | invalid | failed
+    detail: str | None = None
+
+
+class IngestJob(BaseModel):
+    job_id: str
+    medicine_name: str
+    status: str = "pending"  # pending | running | completed | failed
+    files: list[IngestFileStatus]
+    duplicates_dropped: int = 0
+    created_at: datetime
+    finished_at: datetime | None = None
+
+
+def _decode(path: str) -> np.ndarray | None:
+    try:
+        return cv2.imread(path, cv2.IMREAD_COLOR)
+    except cv2.error:
+        return None
+
+
+def _decode_batch(paths: list[str]) -> list[np.ndarray | None]:
+    return [_decode(path) for path in paths]
+
+
+def _remove_staged(paths: list[str]):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _build_hash_index(training_location: str) -> PerceptualHashIndex:
+    index = PerceptualHashIndex(config.DEDUPE_MAX_HAMMING_DISTANCE)
+    if os.path.isdir(training_location):
+        for filename in os.listdir(training_location):
+            image = cv2.imread(os.path.join(training_location, filename))
+            if image is not None:
+                index.add(dhash(image))
+    return index
+
+
+def _write_crop(training_location: str, extension: str, crop: np.ndarray) -> str:
+    ok, encoded = cv2.imencode(extension, crop)
+    if not ok:
+        raise OSError(f"Failed to encode crop as {extension}")
+    return blob_store.put_view_sync(encoded.tobytes(), training_location, extension)
+
+
+class TrainingIngestService:
+    """
+    Turns uploaded training photos into classifier crops in the background.
+
+    Uploads are staged on disk by the request, then decoded and run through the
+    detector in batches on the inference pool, and crops are written by a single background writer thread, so the
+    request that submitted them returns immediately with a job handle.
+    """
+
+    _jobs: dict[str, IngestJob] = {}
+    _tasks: set[asyncio.Task] = set()
+    _writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="crop-writer")
+    # Per-medicine hashes of the crops already on disk, built lazily on first ingest.
+    _hash_indexes: dict[str, PerceptualHashIndex] = {}
+
+    @staticmethod
+    async def _hash_index(medicine_name: str, training_location: str) -> PerceptualHashIndex:
+        index = TrainingIngestService._hash_indexes.get(medicine_name)
+        if index is None:
+            index = await fs.run_io(_build_hash_index, training_location)
+            TrainingIngestService._hash_indexes[medicine_name] = index
+        return index
+
+    @staticmethod
+    def forget(medicine_name: str):
+        """Drop cached state for a medicine whose training crops were deleted."""
+        TrainingIngestService._hash_indexes.pop(medicine_name, None)
+
+    @staticmethod
+    def get_job(job_id: str) -> IngestJob | None:
+        return TrainingIngestService._jobs.get(job_id)
+
+    @staticmethod
+    def _evict_finished_jobs():
+        jobs = TrainingIngestService._jobs
+        finished = [job for job in jobs.values() if job.finished_at is not None]
+        finished.sort(key=lambda job: job.finished_at)
+        while len(jobs) >= MAX_RETAINED_JOBS and finished:
+            jobs.pop(finished.pop(0).job_id, None)
+
+    @staticmethod
+    def submit(
+        medicine_name: str,
+        uploads: list[tuple[str, str]],
+        on_complete: Callable[[IngestJob, list[np.ndarray]], Awaitable[None]] | None = None,
+    ) -> IngestJob:
+        """
+        Queue (filename, staged path) pairs for processing and return the job
+        handle. The staged files belong to the job and are deleted when it ends.
+        `on_complete` receives the finished job and the saved crops.
+        """
+        TrainingIngestService._evict_finished_jobs()
+        job = IngestJob(
+            job_id=uuid.uuid4().hex,
+            medicine_name=medicine_name,
+            files=[IngestFileStatus(filename=filename) for filename, _ in uploads],
+            created_at=datetime.now(),
+        )
+        TrainingIngestService._jobs[job.job_id] = job
+
+        task = asyncio.create_task(
+            TrainingIngestService._run(job, [path for _, path in uploads], on_complete)
+        )
+        TrainingIngestService._tasks.add(task)
+        task.add_done_callback(TrainingIngestService._tasks.discard)
+        return job
+
+    @staticmethod
+    async def _run(
+        job: IngestJob,
+        paths: list[str],
+        on_complete: Callable[[IngestJob, list[np.ndarray]], Awaitable[None]] | None,
+    ):
+        job.status = "running"
+        training_location = f"uploads/training/{job.medicine_name}/"
+
+        saved_crops: list[np.ndarray] = []
+        batch_size = max(1, config.INGEST_BATCH_SIZE)
+        # Crops of one batch are written while the next batch is being detected.
+        writes = []
+        error = None
+        try:
+            await fs.run_io(os.makedirs, training_location, exist_ok=True)
+            hash_index = None
+            if config.DEDUPE_MAX_HAMMING_DISTANCE >= 0:
+                hash_index = await TrainingIngestService._hash_index(job.medicine_name, training_location)
+
+            for start in range(0, len(paths), batch_size):
+                batch = paths[start:start + batch_size]
+                statuses = job.files[start:start + batch_size]
+                writes.extend(
+                    await TrainingIngestService._process_batch(training_location, batch, statuses, hash_index)
+                )
+        except Exception as e:
+            logger.error(f"Training ingest job {job.job_id} failed: {e}", exc_info=True)
+            error = e
+
+        try:
+            # Even after a failure, crops already queued end up on disk with their blob
+            # refs taken, so they are waited for and reported like any other.
+            for future, crop, file_status in writes:
+                try:
+                    await future
+                    file_status.status = "saved"
+                    saved_crops.append(crop)
+                except Exception as e:
+                    file_status.status = "failed"
+                    file_status.detail = str(e)
+        finally:
+            job.duplicates_dropped = sum(1 for file_status in job.files if file_status.status == "duplicate")
+            for file_status in job.files:
+                if file_status.status == "pending":
+                    file_status.status = "failed"
+                    file_status.detail = str(error) if error else None
+            job.status = "completed" if saved_crops and error is None else "failed"
+            job.finished_at = datetime.now()
+            await fs.run_io(_remove_staged, paths)
+
+        logger.info(
+            "Ingest job %s for %s finished: %d/%d crops saved, %d near-duplicates dropped",
+            job.job_id,
+            job.medicine_name,
+            len(saved_crops),
+            len(job.files),
+            job.duplicates_dropped,
+        )
+        if on_complete is not None:
+            try:
+                await on_complete(job, saved_crops)
+            except Exception as e:
+                logger.error(f"Post-ingest step for job {job.job_id} failed: {e}", exc_info=True)
+
+    @staticmethod
+    async def _process_batch(
+        training_location: str,
+        paths: list[str],
+        statuses: list[IngestFileStatus],
+        hash_index: PerceptualHashIndex | None = None,
+    ) -> list[tuple[asyncio.Future, np.ndarray, IngestFileStatus]]:
+        """Decode and detect one batch, queue its crops on the writer and return the pending writes."""
+        images = await run_inference(_decode_batch, paths)
+
+        decoded = []
+        for image, file_status in zip(images, statuses):
+            if image is None:
+                file_status.status = "invalid"
+                file_status.detail = "Could not decode image. The file might be corrupted."
+            else:
+                decoded.append((image, file_status))
+
+        detections = await ObjectDetectionService.detect_medicines_batch([image for image, _ in decoded])
+
+        loop = asyncio.get_running_loop()
+        writes = []
+        for (image, file_status), result in zip(decoded, detections):
+            if not result:
+                file_status.status = "no_detection"
+                file_status.detail = "No medicine detected. Please upload a clear image of the medicine."
+                continue
+
+            x1, y1, x2, y2 = map(int, result[0]["bbox"])
+            crop = image[y1:y2, x1:x2]
+            if hash_index is not None and not hash_index.add_if_novel(dhash(crop)):
+                file_status.status = "duplicate"
+                file_status.detail = "Near-duplicate of an existing training image."
+                continue
+
+            ext = os.path.splitext(file_status.filename)[1].lower() or ".jpg"
+            if ext not in {".jpg", ".jpeg", ".png", ".bmp", ".webp"}:
+                ext = ".jpg"
+            future = loop.run_in_executor(
+                TrainingIngestService._writer,
+                contextvars.copy_context().run,
+                _write_crop,
+                training_location,
+                ext,
+                crop,
+            )
+            writes.append((future, crop, file_status))
+        return writes
@@ -1,10 +1,19 @@
-import os
+import logging
+
 import app.core.security as security
+import app.core.token_cache as token_cache
 
 from sqlalchemy import select, Exists, exists, func
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.database.models import User
+from app.database.models import TableVersion, User
 from app.database.schemas import UserInputSchema
+from app.services import fs
+from app.services.blob_store import blob_store
+from app.services.face_gallery import EnrollmentRejectedError, evaluate_selfie, face_gallery
+from app.services.inference_pool import run_inference
+from app.services.recognition_cache import recognition_cache
+
+logger = logging.getLogger(__name__)
 
 
 class UserService:
@@ -23,6 +32,31 @@ class UserService:
         users = result.scalars().fetchall()
         return users
 
+    @staticmethod
+    async def users_version(db: AsyncSession):
+        """Write counter (changes on every commit) and latest updated_at of the users table."""
+        result = await db.execute(
+            select(
+                select(TableVersion.version).where(TableVersion.name == User.__tablename__).scalar_subquery(),
+                func.max(User.updated_at),
+            )
+        )
+        version, last_modified = result.one()
+        return version or 0, last_modified
+
+    @staticmethod
+    async def users_write_counter(db: AsyncSession) -> int:
+        """Just the write counter of users_version(), a primary key lookup."""
+        result = await db.execute(select(TableVersion.version).where(TableVersion.name == User.__tablename__))
+        return result.scalar_one_or_none() or 0
+
+    @staticmethod
+    async def get_user(db: AsyncSession, user_id: int):
+        result = await db.execute(
+            select(User).where(User.id == user_id)
+        )
+        return result.scalar_one_or_none()
+
     @staticmethod
     async def get_user_by_face_name(db: AsyncSession, face_name: str):
         normalized_face_name = UserService._normalize_face_name(face_name)
@@ -46,26 +80,83 @@ class UserService:
         return user
 
     @staticmethod
-    async def create_user(db: AsyncSession, user: UserInputSchema, image):
-        db_user = User(
-            face_name=user.face_name,
-            email=user.email,
-            password=await security.hash_password(user.password),
-            is_active=user.is_active,
-            role=user.role
-        )
-        db.add(db_user)
-        await db.commit()
-        await db.refresh(db_user)
+    async def _stage_selfies(images) -> tuple[list[tuple[str, str, str, object]], list[dict]]:
+        """
+        Stage the selfies and embed them; returns ([(file name, staged path, blob
+        id, embedding)], [{"filename", "reason"}]). Rejected uploads are discarded.
+        """
+        # Streamed to disk first, so an oversized upload fails before anything is embedded.
+        staged = await fs.save_uploads(images, blob_store.staging_dir)
+        pending = [(image.filename, staged_path, blob_id) for image, (staged_path, blob_id) in zip(images, staged)]
+
+        accepted, rejected = [], []
+        try:
+            while pending:
+                filename, staged_path, blob_id = pending[0]
+                embedding, reason = await run_inference(evaluate_selfie, staged_path)
+                pending.pop(0)
+                if reason is None:
+                    accepted.append((filename, staged_path, blob_id, embedding))
+                else:
+                    rejected.append({"filename": filename, "reason": reason})
+                    await blob_store.discard_staged(staged_path)
+        except BaseException:
+            # Rejected files are already gone; only the accepted and unchecked ones are left.
+            for staged_path in [path for _, path, _, _ in accepted] + [path for _, path, _ in pending]:
+                await blob_store.discard_staged(staged_path)
+            raise
+
+        if rejected:
+            logger.info("Rejected %d of %d selfies: %s", len(rejected), len(staged), rejected)
+        return accepted, rejected
 
-        folder_path = f"./db/{user.face_name}"
-        os.makedirs(folder_path, exist_ok=True)
-        image_path = os.path.join(folder_path, f"{user.face_name}.jpg")
-        with open(image_path, "wb") as f:
-            f.write(image.file.read())
+    @staticmethod
+    async def _add_to_gallery(face_name: str, accepted: list[tuple[str, str, str, object]]):
+        # The gallery keeps selfies in ./db/<face_name>/, linked there under their blob id.
+        gallery_dir = f"./db/{face_name}"
+        images = []
+        for _, staged_path, blob_id, embedding in accepted:
+            await blob_store.put_staged_view(staged_path, blob_id, gallery_dir)
+            images.append((f"{gallery_dir}/{blob_id}.jpg", embedding))
+        await face_gallery.add(face_name, images)
 
+    @staticmethod
+    async def create_user(db: AsyncSession, user: UserInputSchema, images):
+        accepted, rejected = await UserService._stage_selfies(images)
+        if not accepted:
+            raise EnrollmentRejectedError(rejected)
+        try:
+            db_user = User(
+                face_name=user.face_name,
+                email=user.email,
+                password=await security.hash_password(user.password),
+                is_active=user.is_active,
+                role=user.role
+            )
+            db.add(db_user)
+            await db.commit()
+            await db.refresh(db_user)
+        except BaseException:
+            for _, staged_path, _, _ in accepted:
+                await blob_store.discard_staged(staged_path)
+            raise
+
+        await UserService._add_to_gallery(user.face_name, accepted)
         return db_user
 
+    @staticmethod
+    async def add_photos(db: AsyncSession, user_id: int, images):
+        """Enroll more selfies of an existing user; returns the accepted and rejected file names."""
+        user = await UserService.get_user(db, user_id)
+        if not user:
+            raise ValueError("User not found")
+
+        accepted, rejected = await UserService._stage_selfies(images)
+        if not accepted:
+            raise EnrollmentRejectedError(rejected)
+        await UserService._add_to_gallery(user.face_name, accepted)
+        return {"accepted": [filename for filename, _, _, _ in accepted], "rejected": rejected}
+
     @staticmethod
     async def delete_user(db: AsyncSession, user_id: int):
         result = await db.execute(
@@ -75,6 +166,9 @@ class UserService:
         if user:
             await db.delete(user)
             await db.commit()
+            security.invalidate_verified_password(user_id)
+            token_cache.invalidate_user(user_id)
+            recognition_cache.invalidate_user(user_id)
         else:
             raise ValueError("User not found")
         return user
@@ -93,6 +187,8 @@ class UserService:
             db.add(user)
             await db.commit()
             await db.refresh(user)
+            token_cache.invalidate_user(user_id)
+            recognition_cache.invalidate_user(user_id)
         else:
             raise ValueError("User not found")
         return user
@@ -0,0 +1,54 @@
+import hashlib
+from datetime import UTC, datetime
+from email.utils import format_datetime
+
+import fastapi
+
+# Clients may cache but must revalidate every time, which is what makes 304s useful.
+CACHE_CONTROL = "private, no-cache"
+
+
+def make_etag(*parts) -> str:
+    """Weak ETag over the given version components (row counts, timestamps, ids)."""
+    digest = hashlib.sha1("|".join(str(part) for part in parts).encode()).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+
+def _as_utc(value: datetime) -> datetime:
+    # Timestamps are stored without a zone; they only need to compare against themselves.
+    return value.replace(tzinfo=UTC) if value.tzinfo is None else value.astimezone(UTC)
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == opaque for candidate in header.split(","))
+
+
+def is_not_modified(request: fastapi.Request, etag: str) -> bool:
+    """
+    Evaluate If-None-Match against the current ETag. If-Modified-Since is not
+    honoured: HTTP dates have whole-second resolution and updated_at is the
+    writing transaction's start time, so a date can miss a committed change.
+    Last-Modified is still sent, for display.
+    """
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, etag)
+    return False
+
+
+def validator_headers(etag: str, last_modified: datetime | None) -> dict[str, str]:
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(_as_utc(last_modified), usegmt=True)
+    return headers
+
+
+def not_modified(etag: str, last_modified: datetime | None) -> fastapi.Response:
+    return fastapi.Response(status_code=304, headers=validator_headers(etag, last_modified))
+
+
+def set_validators(response: fastapi.Response, etag: str, last_modified: datetime | None):
+    response.headers.update(validator_headers(etag, last_modified))
@@ -0,0 +1,50 @@
+import cv2
+import numpy as np
+
+# Popcount of every byte value, used to count differing bits between 64-bit hashes.
+_POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+
+def dhash(image: np.ndarray, hash_size: int = 8) -> int:
+    """
+    Difference hash of hash_size² bits (64 by default): the image is shrunk to
+    (hash_size + 1) x hash_size grayscale and every bit says whether a pixel is
+    brighter than its right neighbour. Robust to rescaling, re-encoding and small
+    exposure changes.
+    """
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    resized = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = resized[:, 1:] > resized[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hamming_distances(hashes: np.ndarray, value: int) -> np.ndarray:
+    """Number of differing bits between `value` and every hash in `hashes` (uint64)."""
+    xor = np.bitwise_xor(hashes, np.uint64(value))
+    return _POPCOUNT[xor.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+class PerceptualHashIndex:
+    """Set of image hashes that answers "is there a near-duplicate within max_distance bits?"."""
+
+    def __init__(self, max_distance: int):
+        self.max_distance = max_distance
+        self._hashes = np.zeros(0, dtype=np.uint64)
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    def contains_near(self, value: int) -> bool:
+        if not len(self._hashes):
+            return False
+        return bool(hamming_distances(self._hashes, value).min() <= self.max_distance)
+
+    def add(self, value: int):
+        self._hashes = np.append(self._hashes, np.uint64(value))
+
+    def add_if_novel(self, value: int) -> bool:
+        """Add `value` unless a near-duplicate is already indexed. Returns True if it was added."""
+        if self.contains_near(value):
+            return False
+        self.add(value)
+        return True
@@ -0,0 +1,143 @@
+"""
+Recall/latency benchmark of the face gallery index against exact search.
+
+Builds synthetic Facenet512-like galleries (one embedding per identity, with
+identities grouped around shared cluster centres so neighbours are not trivially
+far apart) at several sizes, then queries each with fresh noisy samples of
+enrolled identities and of people who never enrolled. For every size it reports:
+  - exact and IVF search latency (p50/p95 per query) and index build time
+  - recall@1: how often the IVF top match is the exact top match
+  - decision agreement: how often IVF and exact search make the same unlock
+    decision under the model's distance cut-off and FACE_RECOGNITION_CONF (same
+    identity, same accept/reject)
+
+Run from the repository root:
+    python -m benchmarks.bench_face_index
+    python -m benchmarks.bench_face_index --sizes 1000 10000 100000 --nprobe 4 8 16 --output index.json
+"""
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+
+from app.core import config
+from app.services.face_index import IVFIndex, exact_search, normalize
+
+DIM = 512
+
+
+def synthetic_gallery(rng: np.random.Generator, identities: int, noise: float, clusters: int = 64, spread: float = 1.0):
+    """(gallery, identity centres): unit vectors, one noisy sample per identity."""
+    cluster_centres = normalize(rng.standard_normal((clusters, DIM)))
+    membership = rng.integers(0, clusters, identities)
+    centres = normalize(cluster_centres[membership] + rng.standard_normal((identities, DIM)) / np.sqrt(DIM) * spread)
+    gallery = normalize(centres + rng.standard_normal((identities, DIM)).astype(np.float32) * noise)
+    return gallery, centres
+
+
+def percentile_ms(samples: list[float], q: float) -> float:
+    return float(np.percentile(np.asarray(samples), q) * 1000)
+
+
+def accepted(distance: float, threshold: float, max_distance: float) -> bool:
+    return distance <= max_distance and 1.0 - distance >= threshold
+
+
+def bench_size(rng, identities: int, queries: int, nprobe_values: list[int], noise: float, threshold: float,
+               max_distance: float) -> dict:
+    # A fifth of the queries are people who never enrolled and must be rejected.
+    impostors = max(1, queries // 5)
+    gallery, centres = synthetic_gallery(rng, identities + impostors, noise)
+    gallery = gallery[:identities]
+    targets = np.concatenate([rng.integers(0, identities, queries - impostors), np.arange(identities, identities + impostors)])
+    probes = normalize(centres[targets] + rng.standard_normal((queries, DIM)).astype(np.float32) * noise)
+
+    exact_times, exact_results = [], []
+    for probe in probes:
+        start = time.perf_counter()
+        ids, distances = exact_search(gallery, probe, k=1)
+        exact_times.append(time.perf_counter() - start)
+        exact_results.append((int(ids[0]), float(distances[0])))
+
+    result = {
+        "identities": identities,
+        "queries": queries,
+        "exact": {"p50_ms": percentile_ms(exact_times, 50), "p95_ms": percentile_ms(exact_times, 95)},
+        "exact_accuracy": float(np.mean([r[0] == t for r, t in zip(exact_results, targets)])),
+        "exact_accept_rate": float(np.mean([accepted(r[1], threshold, max_distance) for r in exact_results])),
+        "ivf": [],
+    }
+
+    start = time.perf_counter()
+    # exact_below=0 forces the IVF path so small galleries are measured too.
+    index = IVFIndex(exact_below=0).build(gallery)
+    build_seconds = time.perf_counter() - start
+
+    for nprobe in nprobe_values:
+        index.nprobe = nprobe
+        times, same_top, same_decision = [], 0, 0
+        for probe, (exact_id, exact_distance) in zip(probes, exact_results):
+            start = time.perf_counter()
+            ids, distances = index.search(probe, k=1)
+            times.append(time.perf_counter() - start)
+            ivf_id, ivf_distance = (int(ids[0]), float(distances[0])) if len(ids) else (-1, 1.0)
+            same_top += ivf_id == exact_id
+            exact_accept = accepted(exact_distance, threshold, max_distance)
+            ivf_accept = accepted(ivf_distance, threshold, max_distance)
+            same_decision += exact_accept == ivf_accept and (not exact_accept or ivf_id == exact_id)
+        result["ivf"].append({
+            "nprobe": nprobe,
+            "nlist": len(index._offsets) - 1,
+            "build_seconds": build_seconds,
+            "p50_ms": percentile_ms(times, 50),
+            "p95_ms": percentile_ms(times, 95),
+            "recall_at_1": same_top / queries,
+            "decision_agreement": same_decision / queries,
+        })
+    return result
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[config.FACE_INDEX_NPROBE])
+    parser.add_argument("--noise", type=float, default=0.02,
+                        help="Per-dimension noise between samples of one identity")
+    # face_gallery.MAX_DISTANCE (DeepFace's Facenet512 cosine threshold), kept
+    # literal so the benchmark runs without DeepFace installed.
+    parser.add_argument("--max-distance", type=float, default=0.30,
+                        help="Model distance cut-off applied before FACE_RECOGNITION_CONF")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the results as JSON to this path")
+    args = parser.parse_args(argv)
+
+    threshold = config.FACE_RECOGNITION_CONF / 100 if config.FACE_RECOGNITION_CONF > 1 else config.FACE_RECOGNITION_CONF
+    rng = np.random.default_rng(args.seed)
+    results = []
+    for size in args.sizes:
+        result = bench_size(rng, size, args.queries, args.nprobe, args.noise, threshold, args.max_distance)
+        results.append(result)
+        exact = result["exact"]
+        print(
+            f"{size:>7} identities  exact p50 {exact['p50_ms']:.3f} ms  p95 {exact['p95_ms']:.3f} ms  "
+            f"accuracy {result['exact_accuracy']:.3f}  accepted {result['exact_accept_rate']:.3f}"
+        )
+        for ivf in result["ivf"]:
+            print(
+                f"{'':>7}  ivf nprobe={ivf['nprobe']:<3} nlist={ivf['nlist']:<4} "
+                f"p50 {ivf['p50_ms']:.3f} ms  p95 {ivf['p95_ms']:.3f} ms  "
+                f"recall@1 {ivf['recall_at_1']:.3f}  decisions {ivf['decision_agreement']:.3f}  "
+                f"build {ivf['build_seconds']:.1f}s"
+            )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"threshold": threshold, "max_distance": args.max_distance, "noise": args.noise, "results": results}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
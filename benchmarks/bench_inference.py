@@ -0,0 +1,271 @@
+"""
+Inference micro-benchmarks for the recognition pipelines.
+
+Measures cold start, warm p50/p95/p99 latency and throughput at several
+concurrency levels for:
+  - ObjectDetectionService.detect_medicines
+  - ClassificationService.classify, one crop per call vs. a batch of crops
+  - the /faces/recognize pipeline (decode -> extract_faces -> embed -> gallery
+    search), through the route's own helpers
+
+Run from the repository root:
+    python -m benchmarks.bench_inference --output bench_results.json
+    python -m benchmarks.bench_inference --save-baseline      # record a new baseline
+Results are compared against benchmarks/baseline.json when it exists; the exit
+code is 1 if any latency regressed by more than --tolerance.
+
+Latencies depend on the CPU/GPU, so no baseline is committed. Record one on the
+machine that will run the comparison (a CI runner, the kiosk box), from the
+commit you want to compare against, with the same options you will compare with:
+    git checkout <reference commit>
+    python -m benchmarks.bench_inference --save-baseline
+    git checkout -
+    python -m benchmarks.bench_inference
+--baseline points to a file elsewhere, e.g. one kept per machine.
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+LATENCY_KEYS = ("p50_ms", "p95_ms", "p99_ms")
+
+
+def synthetic_frame(rng: np.random.Generator, width: int = 1280, height: int = 720) -> np.ndarray:
+    """A camera-sized frame with a few box-shaped 'packages' on a textured background."""
+    frame = cv2.GaussianBlur(rng.integers(0, 255, (height, width, 3), dtype=np.uint8), (0, 0), 3)
+    for _ in range(3):
+        x, y = int(rng.integers(0, width - 300)), int(rng.integers(0, height - 200))
+        w, h = int(rng.integers(120, 300)), int(rng.integers(80, 200))
+        color = tuple(int(c) for c in rng.integers(0, 255, 3))
+        cv2.rectangle(frame, (x, y), (x + w, y + h), color, thickness=-1)
+        cv2.putText(frame, "MED", (x + 10, y + h // 2), cv2.FONT_HERSHEY_SIMPLEX, 1.2, (255, 255, 255), 2)
+    return frame
+
+
+def load_fixtures(pattern: str | None) -> list[np.ndarray]:
+    if not pattern:
+        return []
+    images = [cv2.imread(path) for path in sorted(glob.glob(pattern, recursive=True))]
+    return [image for image in images if image is not None]
+
+
+def percentile(samples: list[float], q: float) -> float:
+    return float(np.percentile(np.asarray(samples), q))
+
+
+def summarize(samples: list[float]) -> dict:
+    return {
+        "iterations": len(samples),
+        "mean_ms": statistics.fmean(samples) * 1000,
+        "p50_ms": percentile(samples, 50) * 1000,
+        "p95_ms": percentile(samples, 95) * 1000,
+        "p99_ms": percentile(samples, 99) * 1000,
+    }
+
+
+async def measure(call, inputs: list, iterations: int, warmup: int, concurrency_levels: list[int]) -> dict:
+    """Warm latency of `call` over `inputs` (round-robin), then throughput per concurrency level."""
+    for i in range(warmup):
+        await call(inputs[i % len(inputs)])
+
+    latencies = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        await call(inputs[i % len(inputs)])
+        latencies.append(time.perf_counter() - start)
+    result = summarize(latencies)
+
+    throughput = {}
+    for concurrency in concurrency_levels:
+        counter = iter(range(iterations))
+
+        async def worker():
+            for i in counter:
+                await call(inputs[i % len(inputs)])
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        throughput[str(concurrency)] = iterations / (time.perf_counter() - start)
+    result["throughput_per_s"] = throughput
+    return result
+
+
+async def bench_detection(frames, args) -> dict:
+    start = time.perf_counter()
+    from app.services.object_detection import ObjectDetectionService  # loads the model
+
+    await ObjectDetectionService.detect_medicines(frames[0])
+    cold_start = time.perf_counter() - start
+
+    result = await measure(ObjectDetectionService.detect_medicines, frames, args.iterations, args.warmup,
+                           args.concurrency)
+    result["cold_start_s"] = cold_start
+    return result
+
+
+async def bench_classification(frames, args) -> dict:
+    from app.services.classification import ClassificationService
+
+    rng = np.random.default_rng(args.seed)
+    crops = []
+    for frame in frames:
+        h, w = frame.shape[:2]
+        x, y = int(rng.integers(0, w - 200)), int(rng.integers(0, h - 200))
+        crops.append(np.ascontiguousarray(frame[y:y + 200, x:x + 200]))
+
+    start = time.perf_counter()
+    service = ClassificationService()
+    await service.classify(crops[0])
+    cold_start = time.perf_counter() - start
+
+    single = await measure(service.classify, crops, args.iterations, args.warmup, args.concurrency)
+    single["cold_start_s"] = cold_start
+
+    batch_size = args.batch_size
+    batches = [[crops[(i + j) % len(crops)] for j in range(batch_size)] for i in range(len(crops))]
+    batched = await measure(service.classify, batches, args.iterations, args.warmup, args.concurrency)
+    batched["batch_size"] = batch_size
+    batched["per_crop_p50_ms"] = batched["p50_ms"] / batch_size
+    return {"single": single, "batched": batched}
+
+
+async def bench_face_pipeline(face_images, args) -> dict:
+    from app.api.routes_face_recognition import (
+        RECOGNIZE_ENDPOINT, _extract_faces, _parse_faces, _quality_gate, embed_face,
+    )
+    from app.core import config
+    from app.services.embedding_store import EmbeddingStore
+    from app.services.face_gallery import FaceGallery
+    from app.services.frame_decoder import DecodedFrame
+
+    payloads = [cv2.imencode(".jpg", image)[1].tobytes() for image in face_images]
+    # Embedding the gallery is a one-off cost (done at enrollment), not part of a recognition.
+    store_dir = tempfile.mkdtemp(prefix="bench-embeddings-")
+    gallery = FaceGallery(args.face_db, EmbeddingStore(store_dir), EmbeddingStore(os.path.join(store_dir, "photos")))
+    await asyncio.to_thread(gallery.reconcile_sync)
+    await gallery.refresh()
+
+    async def call(payload):
+        # What face_recognition() does, minus the database lookups, cache and serial port.
+        frame = await DecodedFrame.decode(payload, config.FACE_DECODE_SIZE, RECOGNIZE_ENDPOINT)
+        faces = await _extract_faces(frame, RECOGNIZE_ENDPOINT)
+        faces_detected, face_images = _parse_faces(frame, faces)
+        faces_detected, _ = _quality_gate(RECOGNIZE_ENDPOINT, faces_detected, face_images)
+        for face in faces_detected:
+            embedding = await embed_face(frame, face, RECOGNIZE_ENDPOINT)
+            if embedding is not None:
+                gallery.search(embedding)
+
+    start = time.perf_counter()
+    await call(payloads[0])
+    cold_start = time.perf_counter() - start
+
+    result = await measure(call, payloads, args.iterations, args.warmup, args.concurrency)
+    result["cold_start_s"] = cold_start
+    return result
+
+
+def compare(results: dict, baseline: dict, tolerance: float, path: str = "") -> list[str]:
+    """Return a description of every latency that regressed by more than `tolerance`."""
+    regressions = []
+    for key, value in results.items():
+        reference = baseline.get(key)
+        name = f"{path}.{key}" if path else key
+        if isinstance(value, dict) and isinstance(reference, dict):
+            regressions.extend(compare(value, reference, tolerance, name))
+        elif key in LATENCY_KEYS and isinstance(reference, (int, float)) and reference > 0:
+            change = value / reference - 1
+            status = "REGRESSION" if change > tolerance else "ok"
+            print(f"  {name:<40} {reference:9.2f} -> {value:9.2f} ms ({change:+.1%}) {status}")
+            if change > tolerance:
+                regressions.append(name)
+    return regressions
+
+
+async def run(args) -> dict:
+    rng = np.random.default_rng(args.seed)
+    frames = load_fixtures(args.fixtures) or [synthetic_frame(rng) for _ in range(8)]
+
+    results = {}
+    if "detection" in args.only:
+        print("Benchmarking detection...")
+        results["detection"] = await bench_detection(frames, args)
+    if "classification" in args.only:
+        print("Benchmarking classification...")
+        results["classification"] = await bench_classification(frames, args)
+    if "faces" in args.only:
+        face_images = load_fixtures(args.face_fixtures)
+        if face_images:
+            print("Benchmarking face recognition pipeline...")
+            results["faces"] = await bench_face_pipeline(face_images, args)
+        else:
+            print("Skipping face pipeline: no images matched --face-fixtures")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--batch-size", type=int, default=8, help="crops per batched classification call")
+    parser.add_argument("--fixtures", help="glob of medicine frames to use instead of synthetic ones")
+    parser.add_argument("--face-fixtures", default="db/**/*.jpg", help="glob of face images")
+    parser.add_argument("--face-db", default="./db", help="DeepFace gallery directory")
+    parser.add_argument("--only", nargs="+", default=["detection", "classification", "faces"],
+                        choices=["detection", "classification", "faces"])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed latency increase, e.g. 0.10 = 10%%")
+    args = parser.parse_args()
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "iterations": args.iterations,
+        },
+        "results": asyncio.run(run(args)),
+    }
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; record one on this machine with --save-baseline")
+        return
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    print(f"Comparing against {args.baseline} ({baseline['meta'].get('timestamp')}):")
+    regressions = compare(report["results"], baseline.get("results", {}), args.tolerance)
+    if regressions:
+        print(f"{len(regressions)} latency regression(s) above {args.tolerance:.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
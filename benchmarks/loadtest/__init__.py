@@ -0,0 +1,13 @@
+"""
+HTTP API load test at production-like data volumes.
+
+    1. python -m benchmarks.loadtest.seed --truncate      # synthetic users/medicines/transactions/logs
+    2. python -m benchmarks.loadtest.server --port 8000   # the app with inference mocked out
+    3. python -m benchmarks.loadtest.workload --base-url http://localhost:8000 --duration 60
+
+All three use the regular DB_* / DATABASE_URL settings, so point them at a
+dedicated local Postgres, never a real database.
+"""
+
+SEED_PASSWORD = "loadtest"
+SEED_EMAIL_DOMAIN = "biomedix.test"
@@ -0,0 +1,141 @@
+"""
+Seed a local Postgres with synthetic data for the load test.
+
+Default volumes (multiplied by --scale): 500 users, 50k medicines, 10M
+transactions with one detail each, and 5M access logs. Rows are generated
+server-side with generate_series, in chunks so progress is visible.
+"""
+import argparse
+import asyncio
+import time
+
+from sqlalchemy import text
+
+from app.core import security
+from app.database.database import engine
+from app.database.models import Base
+from benchmarks.loadtest import SEED_EMAIL_DOMAIN, SEED_PASSWORD
+
+CHUNK_SIZE = 1_000_000
+TABLES = ["transaction_details", "transactions", "access_logs", "authentication_history", "medicines", "users"]
+
+INSERT_USERS = text(f"""
+    INSERT INTO users (face_name, email, password, is_active, role, created_at, updated_at)
+    SELECT 'loadtest_' || g,
+           'loadtest' || g || '@{SEED_EMAIL_DOMAIN}',
+           :password,
+           g % 20 <> 0,
+           CASE WHEN g % 50 = 0 THEN 'IT_ADMIN' ELSE 'PHARMACIST' END,
+           now() - random() * interval '730 days',
+           now()
+    FROM generate_series(1, :count) AS g
+""")
+
+INSERT_MEDICINES = text("""
+    INSERT INTO medicines (name, description, stock, image_path, created_at, updated_at)
+    SELECT 'Medicine ' || lpad(g::text, 6, '0'),
+           'Synthetic medicine #' || g,
+           (random() * 500)::int,
+           'uploads/thumbnails/Medicine ' || lpad(g::text, 6, '0') || '.jpg',
+           now() - random() * interval '730 days',
+           now()
+    FROM generate_series(1, :count) AS g
+""")
+
+# Spread over two years in id order, like a real append-only history.
+INSERT_TRANSACTIONS = text("""
+    INSERT INTO transactions (user_id, mode, transaction_date, created_at, updated_at)
+    SELECT :user_min + (g % :user_count),
+           CASE WHEN random() < 0.3 THEN 'IN' ELSE 'OUT' END,
+           ts, ts, ts
+    FROM generate_series(:start, :stop) AS g,
+         LATERAL (SELECT now() - (1 - g::float8 / :total) * interval '730 days' AS ts) AS t
+""")
+
+# Skewed towards low ids so a few medicines are "popular", as in a real pharmacy.
+INSERT_DETAILS = text("""
+    INSERT INTO transaction_details (transaction_id, medicine_id, quantity, created_at, updated_at)
+    SELECT t.id,
+           :medicine_min + floor(power(random(), 3) * :medicine_count)::int,
+           1 + (random() * 9)::int,
+           t.created_at, t.created_at
+    FROM transactions AS t
+    WHERE t.id BETWEEN :transaction_min + :start - 1 AND :transaction_min + :stop - 1
+""")
+
+INSERT_ACCESS_LOGS = text("""
+    INSERT INTO access_logs (user_id, action, timestamp, created_at)
+    SELECT :user_min + (g % :user_count),
+           (ARRAY['LOGIN', 'LOGOUT', 'FACE_RECOGNIZED', 'STOCK_IN', 'STOCK_OUT'])[1 + g % 5],
+           ts, ts
+    FROM generate_series(:start, :stop) AS g,
+         LATERAL (SELECT now() - (1 - g::float8 / :total) * interval '730 days' AS ts) AS t
+""")
+
+
+async def _id_range(conn, table: str) -> tuple[int, int]:
+    row = (await conn.execute(text(f"SELECT min(id), count(*) FROM {table}"))).one()
+    return row[0], row[1]
+
+
+async def _chunked(conn, label: str, statement, total: int, **params):
+    started = time.perf_counter()
+    for start in range(1, total + 1, CHUNK_SIZE):
+        stop = min(total, start + CHUNK_SIZE - 1)
+        await conn.execute(statement, {"start": start, "stop": stop, "total": total, **params})
+        await conn.commit()
+        print(f"  {label}: {stop:,}/{total:,} ({time.perf_counter() - started:.0f}s)")
+
+
+async def seed(args):
+    users = int(500 * args.scale)
+    medicines = int(50_000 * args.scale)
+    transactions = int(10_000_000 * args.scale)
+    access_logs = int(5_000_000 * args.scale)
+
+    async with engine.connect() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.commit()
+
+        existing = (await conn.execute(text("SELECT count(*) FROM users"))).scalar_one()
+        if existing and not args.truncate:
+            raise SystemExit(f"users already has {existing} rows; rerun with --truncate to wipe the database")
+        if args.truncate:
+            await conn.execute(text(f"TRUNCATE {', '.join(TABLES)} RESTART IDENTITY CASCADE"))
+            await conn.commit()
+
+        print(f"Seeding {users:,} users, {medicines:,} medicines, {transactions:,} transactions, "
+              f"{access_logs:,} access logs")
+        password = await security.hash_password(SEED_PASSWORD)
+        await conn.execute(INSERT_USERS, {"password": password, "count": users})
+        await conn.execute(INSERT_MEDICINES, {"count": medicines})
+        await conn.commit()
+
+        user_min, user_count = await _id_range(conn, "users")
+        medicine_min, medicine_count = await _id_range(conn, "medicines")
+        await _chunked(conn, "transactions", INSERT_TRANSACTIONS, transactions,
+                       user_min=user_min, user_count=user_count)
+
+        transaction_min, _ = await _id_range(conn, "transactions")
+        await _chunked(conn, "transaction_details", INSERT_DETAILS, transactions,
+                       transaction_min=transaction_min, medicine_min=medicine_min, medicine_count=medicine_count)
+        await _chunked(conn, "access_logs", INSERT_ACCESS_LOGS, access_logs,
+                       user_min=user_min, user_count=user_count)
+
+        print("Analyzing...")
+        for table in TABLES:
+            await conn.execute(text(f"ANALYZE {table}"))
+        await conn.commit()
+
+    await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplier on the default volumes")
+    parser.add_argument("--truncate", action="store_true", help="wipe all application tables first")
+    asyncio.run(seed(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
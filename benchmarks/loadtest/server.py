@@ -0,0 +1,98 @@
+"""
+Serve the API with inference mocked out, for load testing the HTTP and DB layers.
+
+ultralytics and deepface are replaced with stubs before app.main is imported, so
+no model weights are loaded: detection and face extraction return nothing and
+the recognition endpoints short-circuit. Everything else runs unchanged.
+"""
+import argparse
+import sys
+import types
+
+STUBBED_MODULES = [
+    "ultralytics",
+    "ultralytics.engine",
+    "ultralytics.engine.results",
+    "ultralytics.data",
+    "ultralytics.data.augment",
+    "ultralytics.models",
+    "ultralytics.models.yolo",
+    "ultralytics.models.yolo.classify",
+    "ultralytics.utils",
+    "deepface",
+]
+
+
+def _no_result(*args, **kwargs):
+    return []
+
+
+class _StubMeta(type):
+    def __getattr__(cls, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return _no_result
+
+
+class _Stub(metaclass=_StubMeta):
+    """Stands in for any model class (YOLO, DeepFace, trainers): constructs fine, predicts nothing."""
+
+    names: dict = {}
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __call__(self, *args, **kwargs):
+        return []
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return _no_result
+
+
+class _StubModule(types.ModuleType):
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        # Classes and constants become the stub class, functions return no results.
+        return _Stub if name[:1].isupper() else _no_result
+
+
+def install_inference_stubs():
+    for name in STUBBED_MODULES:
+        module = _StubModule(name)
+        module.__path__ = []
+        sys.modules[name] = module
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+
+    install_inference_stubs()
+    import uvicorn
+
+    if args.workers > 1:
+        # Worker processes re-import the app, so they need the stubs installed by this module.
+        uvicorn.run("benchmarks.loadtest.server:app", host=args.host, port=args.port, workers=args.workers,
+                    log_level="warning")
+    else:
+        from app.main import app as application
+        uvicorn.run(application, host=args.host, port=args.port, log_level="warning")
+
+
+def __getattr__(name):
+    # Lets uvicorn worker processes import "benchmarks.loadtest.server:app".
+    if name == "app":
+        install_inference_stubs()
+        from app.main import app as application
+        return application
+    raise AttributeError(name)
+
+
+if __name__ == "__main__":
+    main()
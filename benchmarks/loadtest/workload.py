@@ -0,0 +1,205 @@
+"""
+Replay a mixed read/write workload against a running server and report
+throughput and latency percentiles per endpoint.
+
+Each virtual user logs in as one of the seeded accounts, then issues requests
+picked at random from WORKLOAD (by weight) back to back until --duration ends.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import httpx
+import numpy as np
+
+from benchmarks.loadtest import SEED_EMAIL_DOMAIN, SEED_PASSWORD
+
+
+class VirtualUser:
+    def __init__(self, client: httpx.AsyncClient, rng: random.Random, args):
+        self.client = client
+        self.rng = rng
+        self.args = args
+        self.user_id: int | None = None
+        self.token: str | None = None
+
+    def _email(self) -> str:
+        # Every 20th seeded user is inactive, skip those.
+        while True:
+            n = self.rng.randint(1, self.args.users)
+            if n % 20:
+                return f"loadtest{n}@{SEED_EMAIL_DOMAIN}"
+
+    def _medicine_name(self) -> str:
+        return f"Medicine {self.rng.randint(1, self.args.medicines):06d}"
+
+    @property
+    def _auth(self) -> dict:
+        return {"Authorization": f"Bearer {self.token}"} if self.token else {}
+
+    async def login(self):
+        response = await self.client.post("/auth/login", json={"email": self._email(), "password": SEED_PASSWORD})
+        if response.status_code == 200:
+            body = response.json()
+            self.token = body["access_token"]
+            self.user_id = body["user"]["id"]
+        return response
+
+    async def list_medicines(self):
+        return await self.client.get("/medicines/all")
+
+    async def get_medicine(self):
+        return await self.client.get(f"/medicines/{self.rng.randint(1, self.args.medicines)}")
+
+    async def search_medicine(self):
+        return await self.client.get(f"/medicines/search/{self._medicine_name()[:-2]}")
+
+    async def add_stock(self):
+        return await self.client.post(
+            "/medicines/add_stock",
+            params={"medicine_name": self._medicine_name(), "quantity": self.rng.randint(1, 10)},
+            headers=self._auth,
+        )
+
+    async def reduce_stock(self):
+        return await self.client.post(
+            "/medicines/reduce_stock",
+            params={"medicine_name": self._medicine_name(), "quantity": 1},
+            headers=self._auth,
+        )
+
+    async def list_transactions(self):
+        return await self.client.get("/transactions/all", params={"page": self.rng.randint(0, 100), "size": 10})
+
+    async def user_transactions(self):
+        end = datetime.now() - timedelta(days=self.rng.randint(0, 700))
+        return await self.client.get(
+            "/transactions/user/all",
+            params={
+                "start_datetime": (end - timedelta(days=30)).isoformat(),
+                "end_datetime": end.isoformat(),
+                "page": 0,
+                "size": 20,
+            },
+            headers=self._auth,
+        )
+
+    async def list_access_logs(self):
+        return await self.client.get("/access-logs/", params={"limit": 50, "offset": self.rng.randint(0, 1000)})
+
+    async def create_access_log(self):
+        return await self.client.post("/access-logs/", json={"user_id": self.user_id or 1, "action": "LOADTEST"})
+
+
+# (endpoint label, VirtualUser method, weight)
+WORKLOAD = [
+    ("GET /medicines/all", VirtualUser.list_medicines, 15),
+    ("GET /medicines/{id}", VirtualUser.get_medicine, 20),
+    ("GET /medicines/search/{name}", VirtualUser.search_medicine, 15),
+    ("POST /medicines/add_stock", VirtualUser.add_stock, 5),
+    ("POST /medicines/reduce_stock", VirtualUser.reduce_stock, 5),
+    ("GET /transactions/all", VirtualUser.list_transactions, 10),
+    ("GET /transactions/user/all", VirtualUser.user_transactions, 10),
+    ("GET /access-logs/", VirtualUser.list_access_logs, 12),
+    ("POST /access-logs/", VirtualUser.create_access_log, 5),
+    ("POST /auth/login", VirtualUser.login, 3),
+]
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.statuses: dict[str, dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+    async def record(self, label: str, call):
+        start = time.perf_counter()
+        try:
+            response = await call()
+            status = str(response.status_code)
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        self.latencies[label].append(time.perf_counter() - start)
+        self.statuses[label][status] += 1
+
+    def report(self, elapsed: float) -> dict:
+        endpoints = {}
+        for label, samples in sorted(self.latencies.items()):
+            latencies = np.asarray(samples) * 1000
+            statuses = dict(self.statuses[label])
+            endpoints[label] = {
+                "requests": len(samples),
+                "throughput_per_s": len(samples) / elapsed,
+                "errors": sum(count for status, count in statuses.items() if not status.startswith(("2", "3"))),
+                "statuses": statuses,
+                "p50_ms": float(np.percentile(latencies, 50)),
+                "p95_ms": float(np.percentile(latencies, 95)),
+                "p99_ms": float(np.percentile(latencies, 99)),
+                "max_ms": float(latencies.max()),
+            }
+        total = sum(len(samples) for samples in self.latencies.values())
+        return {"elapsed_s": elapsed, "requests": total, "throughput_per_s": total / elapsed, "endpoints": endpoints}
+
+
+async def run(args) -> dict:
+    labels, calls, weights = zip(*WORKLOAD)
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=args.timeout) as client:
+        virtual_users = [VirtualUser(client, random.Random(args.seed + i), args) for i in range(args.concurrency)]
+        await asyncio.gather(*(user.login() for user in virtual_users))
+
+        deadline = time.perf_counter() + args.duration
+
+        async def drive(user: VirtualUser):
+            while time.perf_counter() < deadline:
+                index = user.rng.choices(range(len(calls)), weights=weights)[0]
+                await recorder.record(labels[index], lambda: calls[index](user))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(drive(user) for user in virtual_users))
+        return recorder.report(time.perf_counter() - started)
+
+
+def print_report(report: dict):
+    print(f"{'endpoint':<32} {'reqs':>8} {'req/s':>8} {'err':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}")
+    for label, stats in report["endpoints"].items():
+        print(
+            f"{label:<32} {stats['requests']:>8} {stats['throughput_per_s']:>8.1f} {stats['errors']:>6} "
+            f"{stats['p50_ms']:>8.1f} {stats['p95_ms']:>8.1f} {stats['p99_ms']:>8.1f} {stats['max_ms']:>8.1f}"
+        )
+    print(f"Total: {report['requests']} requests in {report['elapsed_s']:.1f}s "
+          f"({report['throughput_per_s']:.1f} req/s), latencies in ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--duration", type=float, default=60, help="seconds")
+    parser.add_argument("--concurrency", type=int, default=32, help="virtual users")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--users", type=int, default=500, help="number of seeded users")
+    parser.add_argument("--medicines", type=int, default=50_000, help="number of seeded medicines")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="loadtest_results.json")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    report["meta"] = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "base_url": args.base_url,
+        "concurrency": args.concurrency,
+        "duration_s": args.duration,
+    }
+    print_report(report)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
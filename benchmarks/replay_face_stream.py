@@ -0,0 +1,150 @@
+"""
+Replays a recorded kiosk video against a running server to compare face
+recognition work between the per-frame upload loop and /faces/stream.
+
+For each mode the video is played at its own frame rate and the server's
+biomedix_face_embeddings_total counter is read from /metrics before and after,
+giving embeddings computed per second of video.
+
+Run from the repository root against a server started with uvicorn:
+    python -m benchmarks.replay_face_stream kiosk.mp4 --base-url http://localhost:8000
+    python -m benchmarks.replay_face_stream kiosk.mp4 --mode stream --output replay.json
+"""
+import argparse
+import asyncio
+import json
+import re
+import sys
+import time
+
+import cv2
+import httpx
+import websockets
+
+EMBEDDINGS_METRIC = re.compile(r'^biomedix_face_embeddings_total\{endpoint="(?P<endpoint>[^"]+)"\} (?P<value>\S+)$', re.M)
+
+
+def load_frames(path: str, max_frames: int | None) -> tuple[list[bytes], float]:
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise SystemExit(f"Could not open {path}")
+    fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+    frames = []
+    while max_frames is None or len(frames) < max_frames:
+        ok, image = capture.read()
+        if not ok:
+            break
+        frames.append(cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes())
+    capture.release()
+    return frames, fps
+
+
+async def embeddings_total(client: httpx.AsyncClient, endpoint: str) -> float:
+    response = await client.get("/metrics")
+    response.raise_for_status()
+    for match in EMBEDDINGS_METRIC.finditer(response.text):
+        if match.group("endpoint") == endpoint:
+            return float(match.group("value"))
+    return 0.0
+
+
+async def replay_upload(client: httpx.AsyncClient, frames: list[bytes], fps: float) -> dict:
+    """The current kiosk loop: POST each frame, waiting for the response before the next."""
+    sent = 0
+    start = time.perf_counter()
+    for index, frame in enumerate(frames):
+        due = start + index / fps
+        if time.perf_counter() < due:
+            await asyncio.sleep(due - time.perf_counter())
+        elif index and time.perf_counter() - due > 1 / fps:
+            continue  # the loop falls behind the camera and drops frames, like the kiosk does
+        response = await client.post("/faces/recognize", files={"image": ("frame.jpg", frame, "image/jpeg")})
+        response.raise_for_status()
+        sent += 1
+    return {"frames_sent": sent}
+
+
+async def replay_stream(base_url: str, frames: list[bytes], fps: float) -> dict:
+    url = re.sub(r"^http", "ws", base_url.rstrip("/")) + "/faces/stream"
+    recognized = []
+    last_stats = {}
+
+    async with websockets.connect(url, max_size=None) as websocket:
+        async def read_messages():
+            nonlocal last_stats
+            async for raw in websocket:
+                message = json.loads(raw)
+                if message["type"] == "recognized":
+                    recognized.append(message["track_id"])
+                elif message["type"] == "tracks":
+                    last_stats = message["stats"]
+
+        reader = asyncio.create_task(read_messages())
+        start = time.perf_counter()
+        for index, frame in enumerate(frames):
+            due = start + index / fps
+            if time.perf_counter() < due:
+                await asyncio.sleep(due - time.perf_counter())
+            await websocket.send(frame)
+        # Let the last processed frame's messages arrive.
+        await asyncio.sleep(2.0)
+        reader.cancel()
+
+    return {"frames_sent": len(frames), "server": last_stats, "recognized_tracks": len(set(recognized))}
+
+
+async def run_mode(mode: str, base_url: str, frames: list[bytes], fps: float) -> dict:
+    endpoint = "/faces/stream" if mode == "stream" else "/faces/recognize"
+    async with httpx.AsyncClient(base_url=base_url, timeout=60.0) as client:
+        before = await embeddings_total(client, endpoint)
+        start = time.perf_counter()
+        if mode == "stream":
+            result = await replay_stream(base_url, frames, fps)
+        else:
+            result = await replay_upload(client, frames, fps)
+        elapsed = time.perf_counter() - start
+        embeddings = await embeddings_total(client, endpoint) - before
+
+    return {
+        **result,
+        "mode": mode,
+        "seconds": elapsed,
+        "embeddings": embeddings,
+        "embeddings_per_second": embeddings / elapsed if elapsed else 0.0,
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("video", help="Recorded kiosk video (any format OpenCV reads)")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--mode", choices=("upload", "stream", "both"), default="both")
+    parser.add_argument("--max-frames", type=int, default=None)
+    parser.add_argument("--output", help="Write the results as JSON to this path")
+    args = parser.parse_args(argv)
+
+    frames, fps = load_frames(args.video, args.max_frames)
+    print(f"{len(frames)} frames at {fps:.1f} fps ({len(frames) / fps:.1f}s of video)")
+
+    modes = ("upload", "stream") if args.mode == "both" else (args.mode,)
+    results = {}
+    for mode in modes:
+        results[mode] = asyncio.run(run_mode(mode, args.base_url, frames, fps))
+        r = results[mode]
+        print(
+            f"{mode:>7}: {r['embeddings']:.0f} embeddings in {r['seconds']:.1f}s "
+            f"= {r['embeddings_per_second']:.2f}/s"
+        )
+
+    if "upload" in results and "stream" in results and results["stream"]["embeddings"]:
+        ratio = results["upload"]["embeddings"] / results["stream"]["embeddings"]
+        print(f"stream computes {ratio:.1f}x fewer embeddings than per-frame upload")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"video": args.video, "fps": fps, "frames": len(frames), "results": results}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,2 @@
+CREATE INDEX IF NOT EXISTS idx_medicines_updated_at ON medicines (updated_at);
+CREATE INDEX IF NOT EXISTS idx_users_updated_at ON users (updated_at);
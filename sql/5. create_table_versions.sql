@@ -0,0 +1,36 @@
+-- One counter per table, bumped by every statement that writes to it. Writers
+-- take the counter's row lock until they commit, so the value only moves in
+-- commit order, which is what the list ETags need (updated_at is the
+-- transaction start time and can land behind an already visible change).
+CREATE TABLE IF NOT EXISTS table_versions
+(
+    name    VARCHAR(64) PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0
+);
+
+INSERT INTO table_versions (name)
+VALUES ('medicines'),
+       ('users')
+ON CONFLICT (name) DO NOTHING;
+
+CREATE OR REPLACE FUNCTION bump_table_version() RETURNS trigger AS
+$$
+BEGIN
+    UPDATE table_versions SET version = version + 1 WHERE name = TG_TABLE_NAME;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS medicines_table_version ON medicines;
+CREATE TRIGGER medicines_table_version
+    AFTER INSERT OR UPDATE OR DELETE
+    ON medicines
+    FOR EACH STATEMENT
+EXECUTE FUNCTION bump_table_version();
+
+DROP TRIGGER IF EXISTS users_table_version ON users;
+CREATE TRIGGER users_table_version
+    AFTER INSERT OR UPDATE OR DELETE
+    ON users
+    FOR EACH STATEMENT
+EXECUTE FUNCTION bump_table_version();
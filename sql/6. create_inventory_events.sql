@@ -0,0 +1,16 @@
+-- Inventory change log behind /events. Every worker LISTENs on the
+-- inventory_events channel and reads new rows from here, so a dashboard sees
+-- changes made through any worker and can resume from its last seq on any of
+-- them. seq comes from the 'inventory_events' counter in table_versions, which
+-- writers hold until they commit, so rows become visible in seq order.
+CREATE TABLE IF NOT EXISTS inventory_events
+(
+    seq        BIGINT PRIMARY KEY,
+    type       VARCHAR(32) NOT NULL,
+    data       JSONB       NOT NULL,
+    created_at TIMESTAMP   NOT NULL DEFAULT now()
+);
+
+INSERT INTO table_versions (name)
+VALUES ('inventory_events')
+ON CONFLICT (name) DO NOTHING;